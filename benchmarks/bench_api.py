@@ -0,0 +1,56 @@
+"""Load-test the whole HTTP API.
+
+Thin wrapper around :mod:`ucm_color_admin.loadtest` (also available as
+``ucm-color-admin bench``): seeds a throwaway database, starts the app
+under Uvicorn and prints throughput and p50/p95/p99 latency per route as
+JSON. With ``--baseline`` it exits non-zero when the run regresses::
+
+    python benchmarks/bench_api.py --users 5000 --concurrency 16 --duration 30
+    python benchmarks/bench_api.py --baseline benchmarks/baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from ucm_color_admin.loadtest import BenchmarkConfig, compare, run_benchmark
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        BenchmarkConfig(
+            users=args.users,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            warmup=args.warmup,
+            server_workers=args.server_workers,
+        )
+    )
+    print(json.dumps(report, indent=2))
+    if args.baseline is None:
+        return
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        return
+    regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+    for line in regressions:
+        print(f"regression: {line}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
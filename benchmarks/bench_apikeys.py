@@ -0,0 +1,86 @@
+"""Benchmark per-request authentication overhead for API keys.
+
+Creates a throwaway database with one user and API key, then times
+:func:`ucm_color_admin.rbac.authenticate` for a request carrying the key:
+``cold`` clears the key and permission caches before every call (prefix
+lookup, HMAC and role compilation), ``warm`` is the steady state (HMAC and
+a bit test). One PBKDF2 password check is timed for comparison. Results
+are in microseconds::
+
+    python benchmarks/bench_apikeys.py --requests 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "p50_us": round(statistics.median(ordered) * 1e6, 1),
+        "p99_us": round(ordered[max(int(len(ordered) * 0.99) - 1, 0)] * 1e6, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="ucm-apikey-bench-"))
+    os.environ["UCM_COLOR_DB"] = str(workdir / "bench.sqlite3")
+    os.environ["UCM_COLOR_DATA_DIR"] = str(workdir)
+
+    from starlette.requests import Request
+
+    from ucm_color_admin import apikeys, crud, rbac, schemas, security
+    from ucm_color_admin.database import SessionLocal, init_database
+
+    init_database()
+    with SessionLocal() as db:
+        user = crud.create_user(db, schemas.UserCreate(username="bench", password="benchmark"))
+        _, token = apikeys.create_api_key(db, user, "bench")
+        stored_hash = user.hashed_password
+
+    headers = [(b"x-api-key", token.encode())]
+
+    def request() -> Request:
+        return Request({"type": "http", "method": "GET", "path": "/users", "headers": headers, "query_string": b""})
+
+    def measure(count: int, *, cold: bool) -> list[float]:
+        samples = []
+        with SessionLocal() as db:
+            for _ in range(count):
+                if cold:
+                    apikeys._cache.clear()
+                    rbac.invalidate_permissions()
+                begin = time.perf_counter()
+                principal = rbac.authenticate(request(), db)
+                samples.append(time.perf_counter() - begin)
+                assert principal is not None
+        return samples
+
+    cold = measure(max(args.requests // 10, 1), cold=True)
+    warm = measure(args.requests, cold=False)
+    begin = time.perf_counter()
+    security.verify_password("benchmark", stored_hash)
+    pbkdf2 = time.perf_counter() - begin
+
+    report = {
+        "requests": args.requests,
+        "cold": _percentiles(cold),
+        "warm": _percentiles(warm),
+        "pbkdf2_password_us": round(pbkdf2 * 1e6, 1),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark the cost of auditing a request.
+
+Compares writing one ``audit_log`` row per event in its own transaction
+(what a synchronous audit call in every handler would do) with buffering
+the event through :mod:`ucm_color_admin.audit` and flushing in batches.
+Reports per-event latency percentiles in microseconds and the total time
+including the final flush::
+
+    python benchmarks/bench_audit.py --events 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "p50_us": round(statistics.median(ordered) * 1e6, 1),
+        "p99_us": round(ordered[int(len(ordered) * 0.99) - 1] * 1e6, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=20000)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="ucm-audit-bench-"))
+    os.environ["UCM_COLOR_DB"] = str(workdir / "bench.sqlite3")
+    os.environ["UCM_COLOR_DATA_DIR"] = str(workdir)
+
+    from ucm_color_admin import audit, models
+    from ucm_color_admin.database import SessionLocal, init_database
+
+    init_database()
+    detail = {"path": "/users/42", "status": 200}
+
+    synchronous: list[float] = []
+    started = time.perf_counter()
+    for index in range(args.events):
+        begin = time.perf_counter()
+        with SessionLocal() as db:
+            db.add(
+                models.AuditEntry(
+                    occurred_at=datetime.utcnow(),
+                    actor=f"user{index % 50}",
+                    action="http.put",
+                    ip="127.0.0.1",
+                    detail=json.dumps(detail),
+                )
+            )
+            db.commit()
+        synchronous.append(time.perf_counter() - begin)
+    synchronous_total = time.perf_counter() - started
+
+    log = audit.AuditLog(args.events)
+    buffered: list[float] = []
+    started = time.perf_counter()
+    for index in range(args.events):
+        begin = time.perf_counter()
+        log.record("http.put", actor=f"user{index % 50}", ip="127.0.0.1", detail=detail)
+        buffered.append(time.perf_counter() - begin)
+    log.flush()
+    buffered_total = time.perf_counter() - started
+
+    report = {
+        "events": args.events,
+        "synchronous": {**_percentiles(synchronous), "total_s": round(synchronous_total, 3)},
+        "buffered": {**_percentiles(buffered), "total_s": round(buffered_total, 3)},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
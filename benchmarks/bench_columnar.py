@@ -0,0 +1,146 @@
+"""Benchmark BI pivots on the SQL path versus the columnar snapshot.
+
+Builds a throwaway SQLite database with synthetic closed orders and order
+lines, builds a columnar snapshot from it, then runs the same pivots on
+both engines and reports p50 latency in milliseconds. The default matches
+the 10M order line target; pass a smaller ``--lines`` value for a quick
+run (requires the ``analytics`` extra)::
+
+    python benchmarks/bench_columnar.py --lines 500000 --queries 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from ucm_color_admin import models  # noqa: F401 - registers the tables
+from ucm_color_admin.columnar import ColumnarSnapshot, build_snapshot, sql_pivot
+from ucm_color_admin.config import Settings
+from ucm_color_admin.database import Base
+
+STORES = [f"S{index:03d}" for index in range(200)]
+REGIONS = ["east", "south", "north", "west", "central"]
+CATEGORIES = [f"C{index:02d}" for index in range(40)]
+SKUS = [f"SKU{index:05d}" for index in range(5000)]
+EPOCH = datetime(2024, 1, 1)
+SPAN_SECONDS = 365 * 24 * 3600
+LINES_PER_ORDER = 4
+_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+PIVOTS = {
+    "store": (["store"], "sales_cents", {}),
+    "region x category": (["region", "category"], "sales_cents", {}),
+    "store x hour": (["store", "hour"], "quantity", {}),
+    "top sku": (["sku"], "margin_cents", {"limit": 20}),
+    "category x day (30d)": (["category", "day"], "sales_cents", {"start": date(2024, 6, 1), "end": date(2024, 6, 30)}),
+    "region filter x sku": (["sku"], "sales_cents", {"region": "east", "limit": 50}),
+}
+
+
+def populate(path: Path, total_lines: int, seed: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(
+        engine, tables=[models.Store.__table__, models.Order.__table__, models.OrderLine.__table__]
+    )
+    engine.dispose()
+
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.executemany(
+        "INSERT INTO stores (store_id, name, region, updated_at) VALUES (?, ?, ?, ?)",
+        [(store, store, REGIONS[index % len(REGIONS)], EPOCH.strftime(_FORMAT)) for index, store in enumerate(STORES)],
+    )
+    orders = max(1, total_lines // LINES_PER_ORDER)
+    step = 50_000
+    for offset in range(0, orders, step):
+        order_rows, line_rows = [], []
+        for index in range(offset, min(offset + step, orders)):
+            closed = (EPOCH + timedelta(seconds=SPAN_SECONDS * index // orders)).strftime(_FORMAT)
+            total = 0
+            for _ in range(LINES_PER_ORDER):
+                sku = rng.randrange(len(SKUS))
+                quantity = rng.randint(1, 3)
+                price = 500 + sku % 97 * 100
+                line_rows.append(
+                    (index + 1, SKUS[sku], CATEGORIES[sku % len(CATEGORIES)], quantity, price, price * quantity, price // 2)
+                )
+                total += price * quantity
+            order_rows.append(
+                (index + 1, f"B{index:012d}", rng.choice(STORES), "pos", "CLOSED", 3, total, LINES_PER_ORDER, closed, closed, closed)
+            )
+        connection.executemany(
+            "INSERT INTO orders (id, order_no, store_id, channel, status, version, total_cents, item_count,"
+            " created_at, updated_at, closed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            order_rows,
+        )
+        connection.executemany(
+            "INSERT INTO order_lines (order_id, sku, category, quantity, unit_price_cents, amount_cents, cost_cents)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            line_rows,
+        )
+        connection.commit()
+    connection.execute("ANALYZE")
+    connection.close()
+
+
+def timed(call, queries: int) -> tuple[float, object]:
+    samples, result = [], None
+    for _ in range(queries):
+        began = time.perf_counter()
+        result = call()
+        samples.append((time.perf_counter() - began) * 1000)
+    return statistics.median(samples), result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=10_000_000)
+    parser.add_argument("--queries", type=int, default=5, help="Runs per pivot and engine")
+    parser.add_argument("--seed", type=int, default=17)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bi.sqlite3"
+        started = time.perf_counter()
+        populate(path, args.lines, args.seed)
+        report: dict[str, object] = {"lines": args.lines, "populate_s": round(time.perf_counter() - started, 1)}
+
+        engine = create_engine(f"sqlite:///{path}")
+        settings = Settings(data_dir=Path(tmp))
+        with Session(engine) as session:
+            info = build_snapshot(session, settings)
+            report["snapshot_build_s"] = info.build_seconds
+            snapshot = ColumnarSnapshot.open(settings.data_dir / "columnar" / info.name)
+
+            results = {}
+            for name, (dims, measure, filters) in PIVOTS.items():
+                filters = {"limit": 100_000, **filters}
+                sql_ms, sql_rows = timed(lambda: sql_pivot(session, dims, measure, **filters), args.queries)
+                columnar_ms, columnar_rows = timed(lambda: snapshot.pivot(dims, measure, **filters), args.queries)
+                results[name] = {
+                    "sql_p50_ms": round(sql_ms, 2),
+                    "columnar_p50_ms": round(columnar_ms, 2),
+                    "speedup": round(sql_ms / columnar_ms, 1) if columnar_ms else None,
+                    "groups": len(columnar_rows),
+                    "match": sorted(row.value for row in sql_rows) == sorted(row.value for row in columnar_rows),
+                }
+        engine.dispose()
+        report["pivots"] = results
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
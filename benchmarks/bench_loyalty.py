@@ -0,0 +1,75 @@
+"""Benchmark the compiled loyalty plan by scoring synthetic order lines.
+
+Usage::
+
+    python benchmarks/bench_loyalty.py --lines 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+
+from ucm_color_admin.loyalty import CompiledRules
+from ucm_color_admin.models import LoyaltyRule
+
+STORES = [f"S{index:03d}" for index in range(50)]
+CATEGORIES = [f"C{index:02d}" for index in range(40)]
+TIERS = [None, "silver", "gold", "platinum"]
+
+
+_DEFAULTS = {"is_active": True, "priority": 0, "store_id": None, "category": None, "tier": None, "min_amount_cents": 0, "multiplier": 1.0}
+
+
+def _rule(**values: object) -> LoyaltyRule:
+    # Column defaults only apply on flush, so transient rules spell them out.
+    return LoyaltyRule(**{**_DEFAULTS, **values})
+
+
+def build_rules() -> list[LoyaltyRule]:
+    rules = [_rule(name="base", kind="earn", points_per_yuan=1.0)]
+    for store in STORES[:10]:
+        rules.append(_rule(name=f"{store} double", kind="earn", store_id=store, points_per_yuan=2.0, priority=1))
+    for category in CATEGORIES[:10]:
+        rules.append(_rule(name=f"{category} bonus", kind="earn", category=category, points_per_yuan=1.5, min_amount_cents=500))
+    for threshold, tier, multiplier in ((1000, "silver", 1.1), (5000, "gold", 1.25), (20000, "platinum", 1.5)):
+        rules.append(_rule(name=tier, kind="tier", tier=tier, threshold_points=threshold, multiplier=multiplier))
+    return rules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lines = [
+        (rng.choice(STORES), rng.choice(CATEGORIES), rng.randint(100, 20000), rng.choice(TIERS))
+        for _ in range(args.lines)
+    ]
+
+    started = time.perf_counter()
+    plan = CompiledRules(build_rules())
+    compiled = time.perf_counter()
+    points = plan.score_lines(lines)
+    finished = time.perf_counter()
+
+    print(
+        json.dumps(
+            {
+                "lines": args.lines,
+                "compile_ms": round((compiled - started) * 1000, 3),
+                "score_s": round(finished - compiled, 3),
+                "lines_per_s": round(args.lines / (finished - compiled)),
+                "total_points": sum(points),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
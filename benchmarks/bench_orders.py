@@ -0,0 +1,144 @@
+"""Benchmark order search latency for each supported filter combination.
+
+Builds a throwaway SQLite database with synthetic orders, then runs the
+planned order search for every filter combination and reports p50/p95
+latency in milliseconds. The default matches the 10M order target; pass a
+smaller ``--orders`` value for a quick run::
+
+    python benchmarks/bench_orders.py --orders 200000 --queries 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from ucm_color_admin import models  # noqa: F401 - registers the tables
+from ucm_color_admin.database import Base
+from ucm_color_admin.orders import OrderFilter, choose_index, count_orders, query_orders
+
+STORES = [f"S{index:03d}" for index in range(200)]
+CHANNELS = ["pos", "online", "delivery", "mini_app"]
+STATUSES = ["CLOSED"] * 17 + ["CREATED", "PAID", "READY"]
+PAYMENTS = ["wechat", "alipay", "card", "cash"]
+EPOCH = datetime(2024, 1, 1)
+SPAN_SECONDS = 365 * 24 * 3600
+_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def populate(path: Path, total: int, members: int, seed: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine, tables=[models.Order.__table__])
+    engine.dispose()
+
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    step = 100_000
+    for offset in range(0, total, step):
+        rows = []
+        for index in range(offset, min(offset + step, total)):
+            created = (EPOCH + timedelta(seconds=SPAN_SECONDS * index // total)).strftime(_FORMAT)
+            rows.append(
+                (
+                    f"B{index:012d}",
+                    rng.choice(STORES),
+                    rng.choice(CHANNELS),
+                    rng.choice(STATUSES),
+                    rng.randint(1, members) if rng.random() < 0.6 else None,
+                    rng.choice(PAYMENTS),
+                    rng.randint(100, 50_000),
+                    rng.randint(1, 12),
+                    created,
+                    created,
+                )
+            )
+        connection.executemany(
+            "INSERT INTO orders (order_no, store_id, channel, status, member_id, payment_method, total_cents,"
+            " item_count, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        connection.commit()
+    connection.execute("ANALYZE")
+    connection.close()
+
+
+def random_window(rng: random.Random) -> tuple[datetime, datetime]:
+    start = EPOCH + timedelta(seconds=rng.randrange(SPAN_SECONDS - 7 * 24 * 3600))
+    return start, start + timedelta(days=7)
+
+
+COMBINATIONS = {
+    "time": lambda rng: OrderFilter(*random_window(rng)),
+    "store": lambda rng: OrderFilter(store_id=rng.choice(STORES)),
+    "store+time": lambda rng: OrderFilter(*random_window(rng), store_id=rng.choice(STORES)),
+    "store+status": lambda rng: OrderFilter(store_id=rng.choice(STORES), status="PAID"),
+    "channel+time": lambda rng: OrderFilter(*random_window(rng), channel=rng.choice(CHANNELS)),
+    "status": lambda rng: OrderFilter(status=rng.choice(["CREATED", "PAID", "READY"])),
+    "member": lambda rng: OrderFilter(member_id=rng.randint(1, 100_000)),
+    "member+channel": lambda rng: OrderFilter(member_id=rng.randint(1, 100_000), channel=rng.choice(CHANNELS)),
+    "store+amount": lambda rng: OrderFilter(store_id=rng.choice(STORES), min_amount_cents=20_000, max_amount_cents=30_000),
+    "channel+status+amount": lambda rng: OrderFilter(
+        channel=rng.choice(CHANNELS), status="READY", min_amount_cents=10_000
+    ),
+}
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=10_000_000)
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200, help="Queries per filter combination")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "orders.sqlite3"
+        started = time.perf_counter()
+        populate(path, args.orders, args.members, args.seed)
+        report: dict[str, object] = {"orders": args.orders, "populate_s": round(time.perf_counter() - started, 1)}
+
+        engine = create_engine(f"sqlite:///{path}")
+        results = {}
+        with Session(engine) as session:
+            for name, build in COMBINATIONS.items():
+                page_ms: list[float] = []
+                count_ms: list[float] = []
+                for _ in range(args.queries):
+                    criteria = build(rng)
+                    began = time.perf_counter()
+                    query_orders(session, criteria, limit=50)
+                    page_ms.append((time.perf_counter() - began) * 1000)
+                    began = time.perf_counter()
+                    count_orders(session, criteria)
+                    count_ms.append((time.perf_counter() - began) * 1000)
+                results[name] = {
+                    "index": choose_index(criteria),
+                    "page_p50_ms": round(statistics.median(page_ms), 3),
+                    "page_p95_ms": round(percentile(page_ms, 0.95), 3),
+                    "count_p95_ms": round(percentile(count_ms, 0.95), 3),
+                }
+        engine.dispose()
+        report["combinations"] = results
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Benchmark basket pricing against a large set of active promotions.
+
+Compiles synthetic promotions (default 5,000) and prices random baskets,
+reporting p50/p95/p99 latency per basket and the average number of
+candidate promotions evaluated. ``--naive`` also times evaluating every
+promotion against every basket for comparison::
+
+    python benchmarks/bench_promotions.py --promotions 5000 --baskets 20000 --naive
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime
+
+from ucm_color_admin.models import Promotion
+from ucm_color_admin.promotions import BasketTotals, CompiledPromotions
+from ucm_color_admin.schemas import BasketLine, PricingRequest
+
+STORES = [f"S{index:03d}" for index in range(200)]
+CATEGORIES = [f"C{index:02d}" for index in range(60)]
+SKUS = [f"SKU{index:05d}" for index in range(20000)]
+TIERS = [None, "silver", "gold", "platinum"]
+
+_DEFAULTS = {
+    "is_active": True,
+    "priority": 0,
+    "stackable": False,
+    "store_id": None,
+    "category": None,
+    "sku": None,
+    "tier": None,
+    "coupon_code": None,
+    "threshold_cents": 0,
+    "discount_cents": 0,
+    "discount_percent": 0.0,
+    "starts_at": None,
+    "ends_at": None,
+}
+
+
+def _promotion(**values: object) -> Promotion:
+    # Column defaults only apply on flush, so transient rows spell them out.
+    return Promotion(**{**_DEFAULTS, **values})
+
+
+def build_promotions(total: int, rng: random.Random) -> list[Promotion]:
+    promotions = []
+    for index in range(total):
+        scope = rng.random()
+        values: dict[str, object] = {"id": index + 1, "name": f"P{index}", "priority": rng.randint(0, 5)}
+        if scope < 0.55:
+            values["sku"] = rng.choice(SKUS)
+        elif scope < 0.8:
+            values["category"] = rng.choice(CATEGORIES)
+        elif scope < 0.9:
+            values["store_id"] = rng.choice(STORES)
+        elif scope < 0.95:
+            values["coupon_code"] = f"CP{index}"
+        elif scope < 0.98:
+            values["tier"] = rng.choice(TIERS[1:])
+        if rng.random() < 0.5:
+            values.update(kind="threshold", threshold_cents=rng.randint(1, 20) * 1000, discount_cents=rng.randint(1, 10) * 100)
+        else:
+            values.update(kind="percent", discount_percent=float(rng.randint(5, 30)))
+        values["stackable"] = rng.random() < 0.2
+        promotions.append(_promotion(**values))
+    return promotions
+
+
+def build_basket(rng: random.Random) -> PricingRequest:
+    lines = [
+        BasketLine(sku=rng.choice(SKUS), category=rng.choice(CATEGORIES), amount_cents=rng.randint(500, 20000))
+        for _ in range(rng.randint(1, 12))
+    ]
+    return PricingRequest(store_id=rng.choice(STORES), member_tier=rng.choice(TIERS), lines=lines)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--promotions", type=int, default=5000)
+    parser.add_argument("--baskets", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--naive", action="store_true", help="also time evaluating every promotion")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = build_promotions(args.promotions, rng)
+    baskets = [build_basket(rng) for _ in range(args.baskets)]
+
+    started = time.perf_counter()
+    plan = CompiledPromotions(rows)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    latencies: list[float] = []
+    candidates = 0
+    for basket in baskets:
+        started = time.perf_counter()
+        priced = plan.price(basket)
+        latencies.append((time.perf_counter() - started) * 1e6)
+        candidates += priced.candidates
+
+    report: dict[str, object] = {
+        "promotions": args.promotions,
+        "baskets": args.baskets,
+        "compile_ms": round(compile_ms, 2),
+        "avg_candidates": round(candidates / args.baskets, 1),
+        "p50_us": round(statistics.median(latencies), 1),
+        "p95_us": round(percentile(latencies, 0.95), 1),
+        "p99_us": round(percentile(latencies, 0.99), 1),
+    }
+    if args.naive:
+        sample = baskets[:2000]
+        now = datetime.utcnow()
+        started = time.perf_counter()
+        for basket in sample:
+            totals = BasketTotals.of(basket)
+            for promo in plan.promotions:
+                plan.discount_for(promo, basket, totals, now)
+        report["naive_avg_us"] = round((time.perf_counter() - started) * 1e6 / len(sample), 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
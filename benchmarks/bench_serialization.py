@@ -0,0 +1,80 @@
+"""Benchmark list endpoint serialization with and without the fast path.
+
+Seeds a throwaway database with synthetic users, builds one application
+with ``UCM_COLOR_FAST_JSON=false`` (ORM objects validated through the
+``response_model``) and one with the column-only fast path, checks that
+both return the same JSON and times ``GET /users?limit=N`` in process.
+Results are in milliseconds per request::
+
+    python benchmarks/bench_serialization.py --users 5000 --limit 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="ucm-json-bench-"))
+    os.environ["UCM_COLOR_DB"] = str(workdir / "bench.sqlite3")
+    os.environ["UCM_COLOR_DATA_DIR"] = str(workdir)
+    os.environ["UCM_COLOR_JOB_WORKERS"] = "0"
+
+    from fastapi.testclient import TestClient
+
+    from ucm_color_admin import loadtest, responses
+    from ucm_color_admin.app import create_app
+    from ucm_color_admin.config import get_settings
+
+    loadtest.seed(args.users, 0, 0, 1)
+
+    def client(fast: bool) -> TestClient:
+        os.environ["UCM_COLOR_FAST_JSON"] = "true" if fast else "false"
+        get_settings.cache_clear()
+        return TestClient(create_app())
+
+    path = f"/users?skip=0&limit={args.limit}"
+    report = {
+        "users": args.users,
+        "limit": args.limit,
+        "encoder": "orjson" if responses.orjson is not None else "json",
+    }
+    bodies = {}
+    for name, fast in (("validated", False), ("fast", True)):
+        with client(fast) as test_client:
+            test_client.post(
+                "/web/login",
+                data={"username": loadtest.ADMIN_USERNAME, "password": loadtest.ADMIN_PASSWORD},
+                follow_redirects=False,
+            )
+            bodies[name] = test_client.get(path).json()
+            samples = []
+            for _ in range(args.requests):
+                begin = time.perf_counter()
+                response = test_client.get(path)
+                samples.append(time.perf_counter() - begin)
+                assert response.status_code == 200
+        report[name] = {
+            "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+            "p50_ms": round(statistics.median(samples) * 1000, 2),
+        }
+    if bodies["validated"] != bodies["fast"]:
+        raise SystemExit("fast path output differs from the validated response")
+    report["speedup"] = round(report["validated"]["p50_ms"] / report["fast"]["p50_ms"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark process start-up for CLI commands and the application factory.
+
+Runs each command in a fresh interpreter against a throwaway database
+(after one run that creates the schema) and reports wall-clock
+milliseconds, alongside a bare ``python -c pass`` as the floor.
+``-X importtime`` gives the per-module breakdown for the slowest case::
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+CASES = {
+    "python": ["-c", "pass"],
+    "cli --help": ["-m", "ucm_color_admin", "--help"],
+    "cli show-paths": ["-m", "ucm_color_admin", "show-paths"],
+    "cli list-users": ["-m", "ucm_color_admin", "list-users"],
+    "create_app": ["-c", "from ucm_color_admin.app import create_app; create_app()"],
+}
+
+
+def _time(args: list[str], env: dict[str, str]) -> float:
+    begin = time.perf_counter()
+    subprocess.run([sys.executable, *args], env=env, check=True, capture_output=True)
+    return time.perf_counter() - begin
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="ucm-startup-bench-"))
+    env = {
+        **os.environ,
+        "UCM_COLOR_DB": str(workdir / "bench.sqlite3"),
+        "UCM_COLOR_DATA_DIR": str(workdir / "data"),
+        "UCM_COLOR_INSTALLER_DIR": str(workdir / "installers"),
+        "UCM_COLOR_EXPORT_DIR": str(workdir / "exports"),
+    }
+    subprocess.run([sys.executable, "-m", "ucm_color_admin", "init-db"], env=env, check=True, capture_output=True)
+
+    report = {}
+    for name, command in CASES.items():
+        samples = sorted(_time(command, env) for _ in range(args.runs))
+        report[name] = {
+            "p50_ms": round(statistics.median(samples) * 1000, 1),
+            "min_ms": round(samples[0] * 1000, 1),
+        }
+    print(json.dumps({"runs": args.runs, "results": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Stress concurrent order status transitions and check the audit trail.
+
+Several threads push overlapping bulk transitions (payment callbacks,
+fulfilment updates, closures) at the same orders. Afterwards every order
+must satisfy ``version == 1 + number of logged transitions`` and its log
+must only contain legal steps that chain from ``CREATED``::
+
+    python benchmarks/stress_order_transitions.py --orders 2000 --threads 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from ucm_color_admin import models, schemas
+from ucm_color_admin.database import Base, configure_sqlite_connection
+from ucm_color_admin.order_states import ORDER_STATES, apply_transitions
+
+PATH = ["PAID", "READY", "DELIVERED", "CLOSED"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--batches", type=int, default=40, help="bulk requests per thread")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(
+            f"sqlite:///{Path(tmp) / 'stress.db'}", connect_args={"check_same_thread": False, "timeout": 30}
+        )
+        event.listen(engine, "connect", configure_sqlite_connection)
+        Base.metadata.create_all(engine)
+        factory = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+        with factory() as session:
+            session.execute(
+                insert(models.Order),
+                [
+                    {"order_no": f"T{index:08d}", "store_id": "S001", "channel": "pos", "total_cents": 1000}
+                    for index in range(args.orders)
+                ],
+            )
+            session.commit()
+
+        totals: dict[str, int] = defaultdict(int)
+        totals_lock = threading.Lock()
+        failures: list[BaseException] = []
+
+        def worker(index: int) -> None:
+            try:
+                run(index)
+            except BaseException as exc:  # reported after the run
+                failures.append(exc)
+
+        def run(index: int) -> None:
+            rng = random.Random(args.seed + index)
+            for _ in range(args.batches):
+                items = [
+                    schemas.BulkTransitionItem(order_id=rng.randint(1, args.orders), to_status=rng.choice(PATH))
+                    for _ in range(args.batch_size)
+                ]
+                with factory() as session:
+                    result = apply_transitions(session, items, actor=f"thread-{index}", source="stress")
+                with totals_lock:
+                    totals["applied"] += len(result.applied)
+                    totals["conflicts"] += len(result.conflicts)
+                    totals["rejected"] += len(result.rejected)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        errors: list[str] = [f"worker failed: {exc!r}" for exc in failures]
+        with factory() as session:
+            versions = dict(session.execute(select(models.Order.id, models.Order.version)).all())
+            logs: dict[int, list[models.OrderTransition]] = defaultdict(list)
+            for row in session.scalars(select(models.OrderTransition).order_by(models.OrderTransition.id)):
+                logs[row.order_id].append(row)
+        for order_id, version in versions.items():
+            steps = logs.get(order_id, [])
+            if version != 1 + len(steps):
+                errors.append(f"order {order_id}: version {version} but {len(steps)} transitions")
+            state = "CREATED"
+            for expected_version, step in enumerate(steps, start=2):
+                if step.from_status != state or not ORDER_STATES.can(step.from_status, step.to_status):
+                    errors.append(f"order {order_id}: illegal {step.from_status}->{step.to_status} after {state}")
+                if step.version != expected_version:
+                    errors.append(f"order {order_id}: step version {step.version}, expected {expected_version}")
+                state = step.to_status
+        engine.dispose()
+
+    requested = args.threads * args.batches * args.batch_size
+    print(
+        json.dumps(
+            {
+                "requested": requested,
+                **totals,
+                "seconds": round(elapsed, 2),
+                "transitions_per_second": round(requested / elapsed),
+                "violations": len(errors),
+            },
+            indent=2,
+        )
+    )
+    for line in errors[:20]:
+        print(line)
+    if errors:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
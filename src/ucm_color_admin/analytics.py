@@ -0,0 +1,272 @@
+"""Sales KPIs served from incrementally refreshed materialized views.
+
+``mv_sales_hourly`` (per store and hour), ``mv_product_daily`` (per
+store, day and SKU) and the per store and hour SKU sketches in
+``mv_sku_sketches`` are keyed by ``store_id`` first, so each store's rows
+are stored together. :func:`refresh_views` folds in only the orders closed
+since the watermark, which is the last ``order_transitions`` id into
+``CLOSED`` that has been processed. The aggregate upserts and the watermark
+move in one transaction, so a refresh can stop at any point and resume
+without double counting. The ``analytics.refresh`` job schedule (see
+:mod:`.jobs`) refreshes every ``analytics_refresh_seconds``. Dashboard queries only read the aggregate
+tables. Figures are gross sales at close time; refunds are reported by
+reconciliation.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from sqlalchemy import desc, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import jobs, models, schemas, sketches
+from .config import get_settings
+from .database import SessionLocal
+from .dependencies import get_db, get_read_db
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+VIEW_NAME = "sales"
+_BATCH = 5000
+_IN_CHUNK = 500
+
+_refresh_lock = threading.Lock()
+
+
+def _upsert(db: Session, model: type[models.Base], keys: tuple[str, ...], rows: list[dict[str, object]]) -> None:
+    if not rows:
+        return
+    table = model.__table__.c
+    statement = insert(model)
+    sums = [name for name in rows[0] if name not in keys]
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[table[name] for name in keys],
+            set_={name: table[name] + statement.excluded[name] for name in sums},
+        ),
+        rows,
+    )
+
+
+def _fold(db: Session, order_ids: list[int]) -> None:
+    order, line = models.Order, models.OrderLine
+    hourly: dict[tuple[str, datetime], list[int]] = defaultdict(lambda: [0, 0, 0, 0])
+    products: dict[tuple[str, date, str], list[int]] = defaultdict(lambda: [0, 0, 0])
+    units: dict[tuple[str, datetime], dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for start in range(0, len(order_ids), _IN_CHUNK):
+        chunk = order_ids[start:start + _IN_CHUNK]
+        closed: dict[int, tuple[str, datetime]] = {}
+        for row in db.execute(
+            select(order.id, order.store_id, order.closed_at, order.total_cents, order.item_count).where(
+                order.id.in_(chunk), order.closed_at.is_not(None)
+            )
+        ):
+            hour = row.closed_at.replace(minute=0, second=0, microsecond=0)
+            closed[row.id] = (row.store_id, hour)
+            bucket = hourly[(row.store_id, hour)]
+            bucket[0] += 1
+            bucket[1] += row.total_cents
+            bucket[2] += row.item_count
+        for row in db.execute(
+            select(line.order_id, line.sku, line.quantity, line.amount_cents, line.cost_cents).where(
+                line.order_id.in_(list(closed))
+            )
+        ):
+            store_id, hour = closed[row.order_id]
+            hourly[(store_id, hour)][3] += row.cost_cents * row.quantity
+            bucket = products[(store_id, hour.date(), row.sku)]
+            bucket[0] += row.quantity
+            bucket[1] += row.amount_cents
+            bucket[2] += row.cost_cents * row.quantity
+            units[(store_id, hour)][row.sku] += row.quantity
+
+    _upsert(
+        db,
+        models.SalesHourly,
+        ("store_id", "hour"),
+        [
+            {"store_id": store, "hour": hour, "order_count": n, "sales_cents": sales, "units": units, "cost_cents": cost}
+            for (store, hour), (n, sales, units, cost) in hourly.items()
+        ],
+    )
+    _upsert(
+        db,
+        models.ProductDaily,
+        ("store_id", "day", "sku"),
+        [
+            {"store_id": store, "day": day, "sku": sku, "quantity": qty, "sales_cents": sales, "cost_cents": cost}
+            for (store, day, sku), (qty, sales, cost) in products.items()
+        ],
+    )
+    sketches.record(db, units)
+
+
+def refresh_views(db: Session, *, batch_size: int = _BATCH) -> schemas.RefreshResult:
+    """Fold orders closed since the watermark into the aggregate tables."""
+
+    transition, mark = models.OrderTransition, models.ViewWatermark
+    transitions = orders = 0
+    with _refresh_lock:
+        db.execute(insert(mark).values(name=VIEW_NAME, last_transition_id=0).on_conflict_do_nothing())
+        db.commit()
+        while True:
+            watermark = db.scalar(select(mark.last_transition_id).where(mark.name == VIEW_NAME))
+            rows = db.execute(
+                select(transition.id, transition.order_id)
+                .where(transition.id > watermark, transition.to_status == "CLOSED")
+                .order_by(transition.id)
+                .limit(batch_size)
+            ).all()
+            now = datetime.utcnow()
+            if not rows:
+                db.execute(update(mark).where(mark.name == VIEW_NAME).values(refreshed_at=now))
+                sketches.prune(db, now - timedelta(days=get_settings().sketch_retention_days))
+                db.commit()
+                return schemas.RefreshResult(transitions=transitions, orders=orders, watermark=watermark)
+            # Moving the watermark first claims the batch; another process
+            # refreshing concurrently sees zero rows updated and starts over.
+            claimed = db.execute(
+                update(mark)
+                .where(mark.name == VIEW_NAME, mark.last_transition_id == watermark)
+                .values(last_transition_id=rows[-1].id, refreshed_at=now)
+            ).rowcount
+            if not claimed:
+                db.rollback()
+                continue
+            order_ids = sorted({row.order_id for row in rows})
+            _fold(db, order_ids)
+            db.commit()
+            transitions += len(rows)
+            orders += len(order_ids)
+
+
+@jobs.handler("analytics.refresh", max_attempts=1)
+def _refresh_job(context: jobs.JobContext) -> dict[str, int]:
+    with SessionLocal() as session:
+        return refresh_views(session).model_dump()
+
+
+jobs.builtin_schedule(
+    "analytics.refresh",
+    "analytics.refresh",
+    lambda settings: f"@every {max(settings.analytics_refresh_seconds, 1)}s",
+    enabled=lambda settings: settings.analytics_refresh_seconds > 0,
+    priority=10,
+)
+
+
+def _window(start: Optional[datetime], end: Optional[datetime]) -> tuple[datetime, datetime]:
+    end = end or datetime.utcnow()
+    return start or end - timedelta(days=1), end
+
+
+def sales_kpis(
+    db: Session, start: datetime, end: datetime, *, store_id: Optional[str] = None
+) -> schemas.SalesKpis:
+    """Sales, average ticket, UPT and estimated margin for hours in ``[start, end)``."""
+
+    hourly = models.SalesHourly
+    statement = select(
+        func.coalesce(func.sum(hourly.order_count), 0),
+        func.coalesce(func.sum(hourly.sales_cents), 0),
+        func.coalesce(func.sum(hourly.units), 0),
+        func.coalesce(func.sum(hourly.cost_cents), 0),
+    ).where(hourly.hour >= start, hourly.hour < end)
+    if store_id is not None:
+        statement = statement.where(hourly.store_id == store_id)
+    count, sales, units, cost = db.execute(statement).one()
+    state = db.get(models.ViewWatermark, VIEW_NAME)
+    return schemas.SalesKpis(
+        start=start,
+        end=end,
+        store_id=store_id,
+        order_count=count,
+        sales_cents=sales,
+        units=units,
+        average_ticket_cents=sales // count if count else 0,
+        units_per_transaction=round(units / count, 2) if count else 0.0,
+        gross_margin_cents=sales - cost,
+        gross_margin_rate=round((sales - cost) / sales, 4) if sales else 0.0,
+        refreshed_at=state.refreshed_at if state else None,
+    )
+
+
+def hourly_sales(
+    db: Session, start: datetime, end: datetime, *, store_id: Optional[str] = None
+) -> list[models.SalesHourly]:
+    hourly = models.SalesHourly
+    statement = select(hourly).where(hourly.hour >= start, hourly.hour < end)
+    if store_id is not None:
+        statement = statement.where(hourly.store_id == store_id)
+    return list(db.scalars(statement.order_by(hourly.store_id, hourly.hour)))
+
+
+def top_products(
+    db: Session, start: date, end: date, *, store_id: Optional[str] = None, limit: int = 10
+) -> list[schemas.TopProduct]:
+    """Best selling SKUs by sales for the days ``start``..``end``."""
+
+    product = models.ProductDaily
+    sales = func.sum(product.sales_cents).label("sales_cents")
+    statement = select(product.sku, func.sum(product.quantity).label("quantity"), sales).where(
+        product.day >= start, product.day <= end
+    )
+    if store_id is not None:
+        statement = statement.where(product.store_id == store_id)
+    statement = statement.group_by(product.sku).order_by(desc(sales), product.sku).limit(limit)
+    return [schemas.TopProduct.model_validate(row._mapping) for row in db.execute(statement)]
+
+
+@router.get("/kpis", response_model=schemas.SalesKpis)
+def kpis_endpoint(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    store_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    start, end = _window(start, end)
+    return sales_kpis(db, start, end, store_id=store_id)
+
+
+@router.get("/hourly", response_model=list[schemas.HourlySales])
+def hourly_endpoint(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    store_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    start, end = _window(start, end)
+    return hourly_sales(db, start, end, store_id=store_id)
+
+
+@router.get("/top-products", response_model=list[schemas.TopProduct])
+def top_products_endpoint(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    store_id: Optional[str] = None,
+    limit: int = 10,
+    db: Session = Depends(get_read_db),
+):
+    end = end or datetime.utcnow().date()
+    return top_products(db, start or end, end, store_id=store_id, limit=min(max(limit, 1), 100))
+
+
+@router.post("/refresh", response_model=schemas.RefreshResult)
+def refresh_endpoint(db: Session = Depends(get_db)):
+    return refresh_views(db)
+
+
+__all__ = [
+    "VIEW_NAME",
+    "hourly_sales",
+    "refresh_views",
+    "router",
+    "sales_kpis",
+    "top_products",
+]
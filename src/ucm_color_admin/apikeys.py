@@ -0,0 +1,219 @@
+"""API keys for machine clients.
+
+A key looks like ``ucm_<prefix>_<secret>``. The prefix is stored in clear
+and indexed, so finding the key row is a single unique-index lookup; the
+secret is stored only as an HMAC-SHA256 digest keyed with a server-side
+pepper (``UCM_COLOR_API_KEY_PEPPER`` or a generated ``api_key.pepper``
+file). Keys are long random strings, so unlike passwords they need no
+PBKDF2 stretching and verifying one costs a few microseconds.
+
+Rows read for a prefix are cached per process for
+``api_key_cache_seconds``; a cached request only recomputes the HMAC and
+compares digests. Revoking a key drops it from the local cache at once;
+other processes stop accepting it when their cache entry expires.
+
+Clients send the key as ``Authorization: Bearer <key>`` or ``X-API-Key``.
+The key acts with its owner's roles (see :mod:`rbac`).
+"""
+
+from __future__ import annotations
+
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import audit, models, schemas, security
+from .config import Settings, get_settings
+from .dependencies import get_db
+
+router = APIRouter(prefix="/api-keys", tags=["api-keys"])
+
+_SCHEME = "ucm"
+_PREFIX_BYTES = 6
+_SECRET_BYTES = 32
+_MAX_CACHED = 10_000
+
+_lock = threading.Lock()
+_pepper: Optional[bytes] = None
+_cache: dict[str, "_CachedKey"] = {}
+
+
+class UnknownApiKeyError(RuntimeError):
+    """Raised when revoking a key prefix that does not exist."""
+
+
+@dataclass(frozen=True, slots=True)
+class _CachedKey:
+    digest: Optional[bytes]
+    username: Optional[str]
+    expires_at: Optional[datetime]
+    loaded_at: float
+
+
+def load_pepper(settings: Optional[Settings] = None) -> bytes:
+    """Return the API key pepper, creating a private pepper file on first use."""
+
+    settings = settings or get_settings()
+    if settings.api_key_pepper:
+        return settings.api_key_pepper.encode("utf-8")
+    return security.load_secret_file(settings.data_dir / "api_key.pepper")
+
+
+def _get_pepper() -> bytes:
+    global _pepper
+    if _pepper is None:
+        with _lock:
+            if _pepper is None:
+                _pepper = load_pepper()
+    return _pepper
+
+
+def _split(token: str) -> Optional[tuple[str, str]]:
+    parts = token.split("_", 2)
+    if len(parts) != 3 or parts[0] != _SCHEME or not parts[1] or not parts[2]:
+        return None
+    return parts[1], parts[2]
+
+
+def create_api_key(
+    db: Session, user: models.User, name: str, *, expires_in_days: Optional[int] = None
+) -> tuple[models.ApiKey, str]:
+    """Create a key for ``user`` and return the row with the full key, which is not stored."""
+
+    expires_at = datetime.utcnow() + timedelta(days=expires_in_days) if expires_in_days else None
+    while True:
+        prefix = secrets.token_hex(_PREFIX_BYTES)
+        secret = secrets.token_urlsafe(_SECRET_BYTES)
+        api_key = models.ApiKey(
+            prefix=prefix,
+            secret_hash=security.keyed_digest(secret, _get_pepper()).hex(),
+            name=name,
+            user_id=user.id,
+            expires_at=expires_at,
+        )
+        db.add(api_key)
+        try:
+            db.commit()
+        except IntegrityError:  # pragma: no cover - 48 bit prefix collision
+            db.rollback()
+            continue
+        with _lock:
+            _cache.pop(prefix, None)
+        return api_key, f"{_SCHEME}_{prefix}_{secret}"
+
+
+def revoke_api_key(db: Session, prefix: str, *, user_id: Optional[int] = None) -> models.ApiKey:
+    statement = select(models.ApiKey).where(models.ApiKey.prefix == prefix)
+    if user_id is not None:
+        statement = statement.where(models.ApiKey.user_id == user_id)
+    api_key = db.scalars(statement).first()
+    if api_key is None:
+        raise UnknownApiKeyError(f"No API key with prefix '{prefix}'")
+    if api_key.revoked_at is None:
+        api_key.revoked_at = datetime.utcnow()
+        db.commit()
+    with _lock:
+        _cache.pop(prefix, None)
+    return api_key
+
+
+def list_api_keys(db: Session, *, user_id: Optional[int] = None) -> list[models.ApiKey]:
+    statement = select(models.ApiKey).order_by(models.ApiKey.created_at.desc(), models.ApiKey.id.desc())
+    if user_id is not None:
+        statement = statement.where(models.ApiKey.user_id == user_id)
+    return list(db.scalars(statement))
+
+
+def _load(db: Session, prefix: str, now: float) -> _CachedKey:
+    row = db.execute(
+        select(models.ApiKey.secret_hash, models.ApiKey.expires_at, models.User.username)
+        .join(models.User, models.User.id == models.ApiKey.user_id)
+        .where(models.ApiKey.prefix == prefix, models.ApiKey.revoked_at.is_(None))
+    ).first()
+    if row is None:
+        return _CachedKey(None, None, None, now)
+    return _CachedKey(bytes.fromhex(row.secret_hash), row.username, row.expires_at, now)
+
+
+def lookup(db: Session, token: str) -> Optional[str]:
+    """Return the username owning ``token``, or ``None`` if it is invalid, expired or revoked."""
+
+    parts = _split(token)
+    if parts is None:
+        return None
+    prefix, secret = parts
+    now = time.monotonic()
+    entry = _cache.get(prefix)
+    if entry is None or now - entry.loaded_at >= get_settings().api_key_cache_seconds:
+        entry = _load(db, prefix, now)
+        with _lock:
+            if len(_cache) >= _MAX_CACHED:
+                _cache.clear()
+            _cache[prefix] = entry
+    if entry.digest is None:
+        return None
+    if not secrets.compare_digest(security.keyed_digest(secret, _get_pepper()), entry.digest):
+        return None
+    if entry.expires_at is not None and entry.expires_at <= datetime.utcnow():
+        return None
+    return entry.username
+
+
+def request_token(request: Request) -> Optional[str]:
+    """Return the API key sent with ``request``, if any."""
+
+    authorization = request.headers.get("authorization")
+    if authorization:
+        scheme, _, credentials = authorization.partition(" ")
+        if scheme.lower() == "bearer" and credentials:
+            return credentials.strip()
+    return request.headers.get("x-api-key")
+
+
+def _caller(request: Request) -> int:
+    # The router is mounted behind rbac.require_permission(), which sets the principal.
+    return request.state.principal.user_id
+
+
+@router.get("", response_model=list[schemas.ApiKeyRead])
+def list_own_keys(request: Request, db: Session = Depends(get_db)) -> Sequence[models.ApiKey]:
+    return list_api_keys(db, user_id=_caller(request))
+
+
+@router.post("", response_model=schemas.ApiKeyCreated, status_code=status.HTTP_201_CREATED)
+def create_own_key(payload: schemas.ApiKeyCreate, request: Request, db: Session = Depends(get_db)):
+    user = db.get(models.User, _caller(request))
+    api_key, token = create_api_key(db, user, payload.name, expires_in_days=payload.expires_in_days)
+    audit.record_request(
+        request, "api_key.create", target_type="api_key", target_id=api_key.prefix, detail={"name": api_key.name}
+    )
+    return schemas.ApiKeyCreated(**schemas.ApiKeyRead.model_validate(api_key).model_dump(), key=token)
+
+
+@router.delete("/{prefix}", status_code=status.HTTP_204_NO_CONTENT)
+def revoke_own_key(prefix: str, request: Request, db: Session = Depends(get_db)) -> None:
+    try:
+        revoke_api_key(db, prefix, user_id=_caller(request))
+    except UnknownApiKeyError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exc)) from exc
+    audit.record_request(request, "api_key.revoke", target_type="api_key", target_id=prefix)
+
+
+__all__ = [
+    "UnknownApiKeyError",
+    "create_api_key",
+    "list_api_keys",
+    "load_pepper",
+    "lookup",
+    "request_token",
+    "revoke_api_key",
+    "router",
+]
@@ -2,67 +2,154 @@
 
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import AsyncIterator
 
 from fastapi import Depends, FastAPI, HTTPException, Request, status
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from sqlalchemy.orm import Session
 
-from . import __version__, crud, schemas
+from . import __version__, audit, crud, metrics, rbac, schemas
+from .analytics import router as analytics_router
+from .apikeys import router as api_keys_router
+from .audit import AuditMiddleware, router as audit_router, start_audit_writer, stop_audit_writer
+from .columnar import router as columnar_router
 from .config import get_settings
 from .database import init_database
-from .dependencies import get_db
+from .dependencies import get_db, get_read_db
+from .exports import router as exports_router
+from .jobs import router as jobs_router, start_workers, stop_workers
+from .loyalty import router as loyalty_router
+from .members import router as members_router
+from .metrics import MetricsMiddleware, start_exporter, stop_exporter
+from .order_states import router as order_states_router
+from .orders import router as orders_router
+from .profiling import ProfilingMiddleware, start_window_watcher, stop_window_watcher
+from .promotions import router as promotions_router
+from .purchases import router as purchases_router
+from .reconciliation import router as reconciliation_router
+from .rbac import router as rbac_router
+from .refunds import router as refunds_router
+from .responses import FastJSONResponse
+from .sketches import router as sketches_router
+from .stores import router as stores_router
 from .web import router as web_router
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncIterator[None]:
+    start_audit_writer()
+    start_workers()
+    start_window_watcher()
+    start_exporter()
+    try:
+        yield
+    finally:
+        stop_exporter()
+        stop_window_watcher()
+        stop_workers()
+        stop_audit_writer()
+
+
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application."""
 
     settings = get_settings()
     init_database()
 
-    app = FastAPI(title=settings.app_name, version=__version__)
+    app = FastAPI(title=settings.app_name, version=__version__, lifespan=_lifespan)
+    app.add_middleware(AuditMiddleware)
+    if settings.profiling_enabled:
+        app.add_middleware(ProfilingMiddleware)
+    app.add_middleware(MetricsMiddleware)
     installer_root = settings.installer_dir.resolve()
 
     @app.get("/health", tags=["system"])
     def health_check() -> dict[str, str]:
         return {"status": "ok"}
 
-    @app.get("/users", response_model=list[schemas.UserRead], tags=["users"])
-    def list_users(skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
+    @app.get("/metrics", response_class=PlainTextResponse, tags=["system"])
+    async def metrics_endpoint() -> PlainTextResponse:
+        return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+    can_read_users = Depends(rbac.require_permission("users:read"))
+    can_write_users = Depends(rbac.require_permission("users:write"))
+
+    @app.get("/users", response_model=list[schemas.UserRead], tags=["users"], dependencies=[can_read_users])
+    def list_users(skip: int = 0, limit: int = 50, db: Session = Depends(get_read_db)):
+        if settings.fast_json:
+            return FastJSONResponse(crud.list_user_rows(db, skip=skip, limit=limit))
         return crud.list_users(db, skip=skip, limit=limit)
 
-    @app.post("/users", response_model=schemas.UserRead, status_code=status.HTTP_201_CREATED, tags=["users"])
-    def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    @app.post(
+        "/users",
+        response_model=schemas.UserRead,
+        status_code=status.HTTP_201_CREATED,
+        tags=["users"],
+        dependencies=[can_write_users],
+    )
+    def create_user(user: schemas.UserCreate, request: Request, db: Session = Depends(get_db)):
         try:
-            return crud.create_user(db, user)
+            created = crud.create_user(db, user)
         except crud.DuplicateUsernameError as exc:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
-
-    @app.get("/users/{user_id}", response_model=schemas.UserRead, tags=["users"])
+        audit.record_request(
+            request,
+            "user.create",
+            target_type="user",
+            target_id=created.id,
+            detail={"username": created.username, "is_superuser": created.is_superuser},
+        )
+        return created
+
+    @app.get("/users/{user_id}", response_model=schemas.UserRead, tags=["users"], dependencies=[can_read_users])
     def get_user(user_id: int, db: Session = Depends(get_db)):
         user = crud.get_user(db, user_id)
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
         return user
 
-    @app.put("/users/{user_id}", response_model=schemas.UserRead, tags=["users"])
-    def update_user(user_id: int, payload: schemas.UserUpdate, db: Session = Depends(get_db)):
+    @app.put("/users/{user_id}", response_model=schemas.UserRead, tags=["users"], dependencies=[can_write_users])
+    def update_user(user_id: int, payload: schemas.UserUpdate, request: Request, db: Session = Depends(get_db)):
         user = crud.get_user(db, user_id)
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        return crud.update_user(db, user, payload)
-
-    @app.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["users"])
-    def delete_user(user_id: int, db: Session = Depends(get_db)) -> None:
+        updated = crud.update_user(db, user, payload)
+        audit.record_request(
+            request, "user.update", target_type="user", target_id=user_id, detail=audit.user_changes(payload)
+        )
+        return updated
+
+    @app.delete(
+        "/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["users"], dependencies=[can_write_users]
+    )
+    def delete_user(user_id: int, request: Request, db: Session = Depends(get_db)) -> None:
         user = crud.get_user(db, user_id)
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        username = user.username
         crud.delete_user(db, user)
+        audit.record_request(request, "user.delete", target_type="user", target_id=user_id, detail={"username": username})
 
     @app.get("/downloads", response_model=list[schemas.DownloadEntry], tags=["downloads"])
     def list_downloads(request: Request) -> list[schemas.DownloadEntry]:
         if not installer_root.exists():
             return []
 
+        if settings.fast_json:
+            return FastJSONResponse(
+                [
+                    {
+                        "filename": path.name,
+                        "url": str(request.url_for("download_installer", filename=path.name)),
+                        "size": path.stat().st_size,
+                    }
+                    for path in sorted(installer_root.glob("*"))
+                    if path.is_file()
+                ]
+            )
+
         entries: list[schemas.DownloadEntry] = []
         for path in sorted(installer_root.glob("*")):
             if not path.is_file():
@@ -93,6 +180,30 @@ def create_app() -> FastAPI:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Installer not found")
         return FileResponse(requested)
 
+    members_access = Depends(rbac.require_method_permission("members:read", "members:write"))
+    orders_access = Depends(rbac.require_method_permission("orders:read", "orders:write"))
+    analytics_access = Depends(rbac.require_method_permission("analytics:read", "analytics:refresh"))
+
+    app.include_router(rbac_router)
+    app.include_router(api_keys_router, dependencies=[Depends(rbac.require_permission())])
+    app.include_router(members_router, dependencies=[members_access])
+    app.include_router(purchases_router, dependencies=[members_access])
+    app.include_router(loyalty_router, dependencies=[Depends(rbac.require_permission())])
+    app.include_router(promotions_router, dependencies=[Depends(rbac.require_permission())])
+    app.include_router(exports_router, dependencies=[Depends(rbac.require_permission())])
+    app.include_router(jobs_router, dependencies=[Depends(rbac.require_permission("jobs:manage"))])
+    app.include_router(order_states_router, dependencies=[orders_access])
+    app.include_router(orders_router, dependencies=[orders_access])
+    app.include_router(
+        reconciliation_router,
+        dependencies=[Depends(rbac.require_method_permission("analytics:read", "reconciliation:run"))],
+    )
+    app.include_router(refunds_router)
+    app.include_router(audit_router, dependencies=[Depends(rbac.require_permission("audit:read"))])
+    app.include_router(analytics_router, dependencies=[analytics_access])
+    app.include_router(columnar_router, dependencies=[analytics_access])
+    app.include_router(sketches_router, dependencies=[analytics_access])
+    app.include_router(stores_router, dependencies=[Depends(rbac.require_method_permission(None, "stores:manage"))])
     app.include_router(web_router)
 
     return app
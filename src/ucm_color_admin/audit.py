@@ -0,0 +1,314 @@
+"""Audit log: who did what, to which object, and when.
+
+Handlers never write audit rows themselves. :func:`record` (or
+:func:`record_request` inside a route) appends the event to an in-memory
+ring buffer and returns immediately; a background thread drains the buffer
+every ``audit_flush_seconds`` (or as soon as a batch is full) and inserts
+the whole batch in one transaction into the append-only ``audit_log``
+table.
+
+The buffer holds at most ``audit_buffer_size`` events. If the database
+falls that far behind, the oldest buffered events are dropped and counted
+in :attr:`AuditLog.dropped` rather than blocking requests, so the loss is
+bounded by the buffer size. On shutdown the writer drains the buffer and
+checkpoints the WAL so everything recorded is on disk.
+
+:class:`AuditMiddleware` records every mutating HTTP request that the
+route did not already describe with a more specific event.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Iterator, Optional
+
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select, text
+
+from . import models, schemas
+from .config import get_settings
+from .database import ReadSessionLocal, SessionLocal, get_engine
+
+__all__ = [
+    "AuditLog",
+    "AuditMiddleware",
+    "get_audit_log",
+    "iter_entries_ndjson",
+    "record",
+    "record_request",
+    "router",
+    "start_audit_writer",
+    "stop_audit_writer",
+    "user_changes",
+]
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/audit", tags=["audit"])
+
+_BATCH_SIZE = 500
+_FETCH_SIZE = 1000
+_MUTATING_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+
+class AuditLog:
+    """Bounded ring buffer of audit events with batched persistence."""
+
+    def __init__(self, capacity: int, *, batch_size: int = _BATCH_SIZE) -> None:
+        self.capacity = max(capacity, 1)
+        self.batch_size = max(min(batch_size, self.capacity), 1)
+        self.dropped = 0
+        self._events: deque[dict[str, Any]] = deque(maxlen=self.capacity)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._batch_ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def record(
+        self,
+        action: str,
+        *,
+        actor: Optional[str] = None,
+        target_type: Optional[str] = None,
+        target_id: Any = None,
+        ip: Optional[str] = None,
+        detail: Optional[dict[str, Any]] = None,
+    ) -> None:
+        """Buffer one event. Never touches the database."""
+
+        event = {
+            "occurred_at": datetime.utcnow(),
+            "actor": actor,
+            "action": action,
+            "target_type": target_type,
+            "target_id": None if target_id is None else str(target_id),
+            "ip": ip,
+            "detail": json.dumps(detail, ensure_ascii=False, default=str) if detail else None,
+        }
+        with self._lock:
+            if len(self._events) == self.capacity:
+                self.dropped += 1
+            self._events.append(event)
+            if len(self._events) >= self.batch_size:
+                self._batch_ready.set()
+
+    def flush(self) -> int:
+        """Write everything currently buffered; return the number of rows written."""
+
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+                    self._batch_ready.clear()
+                if not batch:
+                    return written
+                try:
+                    with SessionLocal() as db:
+                        db.execute(insert(models.AuditEntry), batch)
+                        db.commit()
+                except Exception:
+                    self._requeue(batch)
+                    raise
+                written += len(batch)
+
+    def _requeue(self, batch: list[dict[str, Any]]) -> None:
+        with self._lock:
+            room = self.capacity - len(self._events)
+            kept = batch[-room:] if room > 0 else []
+            self.dropped += len(batch) - len(kept)
+            self._events.extendleft(reversed(kept))
+
+    def start(self, flush_seconds: float) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(max(flush_seconds, 0.05),), name="ucm-color-audit", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the writer, drain the buffer and checkpoint the WAL."""
+
+        if self._thread is not None:
+            self._stop.set()
+            self._batch_ready.set()
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self.flush()
+        with get_engine().connect() as connection:
+            connection.execute(text("PRAGMA wal_checkpoint(FULL)"))
+        if self.dropped:
+            logger.warning("Audit buffer overflowed; %d events were dropped", self.dropped)
+
+    def _run(self, flush_seconds: float) -> None:
+        while not self._stop.is_set():
+            self._batch_ready.wait(flush_seconds)
+            try:
+                self.flush()
+            except Exception:  # pragma: no cover - database unavailable; events stay buffered
+                logger.exception("Failed to flush %d audit events", len(self._events))
+
+
+_log: Optional[AuditLog] = None
+_log_lock = threading.Lock()
+
+
+def get_audit_log() -> AuditLog:
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = AuditLog(get_settings().audit_buffer_size)
+    return _log
+
+
+def record(action: str, **fields: Any) -> None:
+    """Buffer an audit event (see :meth:`AuditLog.record`)."""
+
+    get_audit_log().record(action, **fields)
+
+
+def record_request(request: Request, action: str, **fields: Any) -> None:
+    """Buffer an event for the current request and skip the generic middleware entry."""
+
+    request.state.audited = True
+    fields.setdefault("actor", getattr(request.state, "actor", None))
+    fields.setdefault("ip", request.client.host if request.client else None)
+    record(action, **fields)
+
+
+def user_changes(payload: schemas.UserUpdate) -> dict[str, Any]:
+    """Describe a user update for the audit log; the password itself is never recorded."""
+
+    changes = payload.model_dump(exclude_none=True, exclude={"password"})
+    if payload.password:
+        changes["password_changed"] = True
+    return changes
+
+
+def start_audit_writer() -> None:
+    get_audit_log().start(get_settings().audit_flush_seconds)
+
+
+def stop_audit_writer() -> None:
+    get_audit_log().stop()
+
+
+class AuditMiddleware:
+    """Record ``http.<method>`` for mutating requests that no route audited explicitly."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] not in _MUTATING_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+        status_code = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not state.get("audited"):
+                client = scope.get("client")
+                record(
+                    f"http.{scope['method'].lower()}",
+                    actor=state.get("actor"),
+                    ip=client[0] if client else None,
+                    detail={"path": scope["path"], "status": status_code},
+                )
+
+
+def iter_entries_ndjson(
+    *,
+    actor: Optional[str] = None,
+    action: Optional[str] = None,
+    target_type: Optional[str] = None,
+    target_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = None,
+) -> Iterator[str]:
+    """Yield matching audit entries, oldest first, as newline-delimited JSON."""
+
+    entry = models.AuditEntry
+    statement = select(entry).order_by(entry.occurred_at, entry.id)
+    if actor is not None:
+        statement = statement.where(entry.actor == actor)
+    if action is not None:
+        statement = statement.where(entry.action == action)
+    if target_type is not None:
+        statement = statement.where(entry.target_type == target_type)
+    if target_id is not None:
+        statement = statement.where(entry.target_id == target_id)
+    if start is not None:
+        statement = statement.where(entry.occurred_at >= start)
+    if end is not None:
+        statement = statement.where(entry.occurred_at < end)
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    with ReadSessionLocal() as session:
+        result = session.scalars(statement.execution_options(yield_per=_FETCH_SIZE))
+        for partition in result.partitions():
+            yield "".join(
+                json.dumps(
+                    {
+                        "id": row.id,
+                        "occurred_at": row.occurred_at.isoformat(),
+                        "actor": row.actor,
+                        "action": row.action,
+                        "target_type": row.target_type,
+                        "target_id": row.target_id,
+                        "ip": row.ip,
+                        "detail": json.loads(row.detail) if row.detail else None,
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n"
+                for row in partition
+            )
+
+
+@router.get("")
+def query_audit_log(
+    actor: Optional[str] = None,
+    action: Optional[str] = None,
+    target_type: Optional[str] = None,
+    target_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1),
+) -> StreamingResponse:
+    get_audit_log().flush()
+    return StreamingResponse(
+        iter_entries_ndjson(
+            actor=actor,
+            action=action,
+            target_type=target_type,
+            target_id=target_id,
+            start=start,
+            end=end,
+            limit=limit,
+        ),
+        media_type="application/x-ndjson",
+    )
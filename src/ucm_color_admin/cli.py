@@ -2,22 +2,21 @@
 
 from __future__ import annotations
 
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from typing import Optional
-from urllib.error import URLError
-from urllib.request import urlopen
 
 import json
-import shutil
+import os
+import signal
+import time
 
 import typer
-import uvicorn
 
-from . import schemas
 from .config import Settings, get_settings
-from .crud import DuplicateUsernameError, create_user, get_user_by_username, list_users
-from .database import SessionLocal, init_database
-from .publisher import GitHubPublishingError, PublishResult, publish_installers_to_github
+
+# Commands import what they need when they run: loading FastAPI, SQLAlchemy
+# and the ORM for every invocation would dominate quick commands.
 
 app = typer.Typer(help="Manage and run the UCM Color admin backend service.")
 
@@ -27,6 +26,10 @@ def _print_header(title: str) -> None:
 
 
 def _resolve_settings() -> Settings:
+    """Return settings after making sure the database schema is current."""
+
+    from .database import init_database
+
     settings = get_settings()
     init_database()
     return settings
@@ -38,18 +41,39 @@ def run(
     port: Optional[int] = typer.Option(None, help="Port to expose"),
     reload: Optional[bool] = typer.Option(None, help="Enable auto-reload"),
     log_level: Optional[str] = typer.Option(None, help="Uvicorn log level"),
+    workers: Optional[int] = typer.Option(
+        None, min=1, help="Server processes; defaults to UCM_COLOR_WORKERS or the CPU count (at most 4)"
+    ),
 ) -> None:
-    """Start the FastAPI service using Uvicorn."""
+    """Start the FastAPI service using Uvicorn.
 
+    With several workers each process serves requests on the shared port with
+    its own database connections; send SIGHUP to replace them one at a time.
+    """
+
+    import uvicorn
+
+    # The schema is created here, once, before any worker process starts.
     settings = _resolve_settings()
+    reload = settings.reload if reload is None else reload
+    workers = 1 if reload else workers or settings.workers
+    if workers > 1:
+        metrics_dir = settings.metrics_dir or settings.data_dir / "metrics"
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        for stale in metrics_dir.glob("worker-*.json"):
+            stale.unlink(missing_ok=True)
+        # Workers are spawned and inherit the environment.
+        os.environ["UCM_COLOR_METRICS_DIR"] = str(metrics_dir)
+        _print_header(f"Starting {workers} worker processes")
 
     uvicorn.run(
         "ucm_color_admin.app:create_app",
         host=host or settings.host,
         port=port or settings.port,
-        reload=settings.reload if reload is None else reload,
+        reload=reload,
         log_level=log_level or settings.log_level,
         factory=True,
+        workers=workers,
     )
 
 
@@ -79,6 +103,10 @@ def create_admin(
 ) -> None:
     """Create an administrator user in the database."""
 
+    from . import schemas
+    from .crud import DuplicateUsernameError, create_user, get_user_by_username
+    from .database import SessionLocal
+
     _resolve_settings()
     with SessionLocal() as session:
         if get_user_by_username(session, username):
@@ -109,6 +137,9 @@ def create_admin(
 def list_users_cmd() -> None:
     """Display users stored in the database."""
 
+    from .crud import list_users
+    from .database import SessionLocal
+
     _resolve_settings()
     with SessionLocal() as session:
         users = list_users(session)
@@ -122,14 +153,320 @@ def list_users_cmd() -> None:
             )
 
 
+@app.command("create-api-key")
+def create_api_key_cmd(
+    username: str = typer.Argument(..., help="User the key acts as"),
+    name: str = typer.Option(..., "--name", help="Label identifying the client using the key"),
+    expires_in_days: Optional[int] = typer.Option(None, "--expires-in-days", help="Expire the key after N days"),
+) -> None:
+    """Create an API key; the full key is printed once and never stored."""
+
+    from .apikeys import create_api_key
+    from .crud import get_user_by_username
+    from .database import SessionLocal
+
+    _resolve_settings()
+    with SessionLocal() as session:
+        user = get_user_by_username(session, username)
+        if not user:
+            typer.secho(f"User {username} does not exist", fg=typer.colors.RED)
+            raise typer.Exit(code=1)
+        api_key, token = create_api_key(session, user, name, expires_in_days=expires_in_days)
+    typer.secho(f"Created API key {api_key.prefix} for {username}", fg=typer.colors.GREEN)
+    typer.echo(token)
+
+
+@app.command("list-api-keys")
+def list_api_keys_cmd(
+    username: Optional[str] = typer.Option(None, help="Only show keys owned by this user"),
+) -> None:
+    """Display API keys without their secrets."""
+
+    from .apikeys import list_api_keys
+    from .crud import get_user_by_username
+    from .database import SessionLocal
+
+    _resolve_settings()
+    with SessionLocal() as session:
+        user_id = None
+        if username:
+            user = get_user_by_username(session, username)
+            if not user:
+                typer.secho(f"User {username} does not exist", fg=typer.colors.RED)
+                raise typer.Exit(code=1)
+            user_id = user.id
+        keys = list_api_keys(session, user_id=user_id)
+        if not keys:
+            typer.echo("No API keys found.")
+            return
+        _print_header("API keys")
+        for api_key in keys:
+            state = "revoked" if api_key.revoked_at else f"expires={api_key.expires_at or 'never'}"
+            typer.echo(f"- {api_key.prefix} {api_key.name} | user={api_key.user.username} | {state}")
+
+
+@app.command("revoke-api-key")
+def revoke_api_key_cmd(prefix: str = typer.Argument(..., help="Prefix shown by list-api-keys")) -> None:
+    """Revoke an API key."""
+
+    from .apikeys import UnknownApiKeyError, revoke_api_key
+    from .database import SessionLocal
+
+    _resolve_settings()
+    with SessionLocal() as session:
+        try:
+            revoke_api_key(session, prefix)
+        except UnknownApiKeyError as exc:
+            typer.secho(str(exc), fg=typer.colors.RED)
+            raise typer.Exit(code=1) from exc
+    typer.secho(f"Revoked API key {prefix}", fg=typer.colors.GREEN)
+
+
+@app.command("dedupe-members")
+def dedupe_members(
+    batch_size: int = typer.Option(1000, help="Number of pending members processed per committed batch."),
+) -> None:
+    """Normalize imported members and merge duplicate phone numbers."""
+
+    from .database import SessionLocal
+    from .members import run_dedupe
+
+    _resolve_settings()
+    with SessionLocal() as session:
+        result = run_dedupe(session, batch_size=batch_size)
+    typer.secho(
+        f"Scanned {result.scanned} member(s): {result.promoted} promoted, "
+        f"{result.merged} merged, {result.invalid} invalid",
+        fg=typer.colors.GREEN,
+    )
+    for batch_id in result.batch_ids:
+        typer.echo(f"- batch {batch_id}")
+
+
+@app.command("undo-member-merge")
+def undo_member_merge(batch_id: str = typer.Argument(..., help="Batch identifier reported by dedupe-members.")) -> None:
+    """Revert the changes applied by a member merge batch."""
+
+    from .database import SessionLocal
+    from .members import MergeUndoConflictError, undo_merge_batch
+
+    _resolve_settings()
+    with SessionLocal() as session:
+        try:
+            restored = undo_merge_batch(session, batch_id)
+        except MergeUndoConflictError as exc:
+            typer.secho(str(exc), fg=typer.colors.RED)
+            for conflict in exc.conflicts:
+                typer.echo(
+                    f"  entry {conflict['entry_id']}: member {conflict['member_id']} "
+                    f"phone {conflict['phone_normalized']} is held by member {conflict['held_by']}"
+                )
+            raise typer.Exit(code=1) from exc
+    if not restored:
+        typer.secho(f"No pending undo entries for batch {batch_id}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    typer.secho(f"Reverted {restored} change(s) from batch {batch_id}", fg=typer.colors.GREEN)
+
+
+def _raise_interrupt(_signum, _frame) -> None:
+    raise KeyboardInterrupt
+
+
+@app.command()
+def worker(
+    concurrency: int = typer.Option(2, min=1, help="Number of jobs run in parallel."),
+) -> None:
+    """Run background jobs and schedules without the web server.
+
+    Set UCM_COLOR_JOB_WORKERS=0 on the web processes to leave all jobs to this command.
+    """
+
+    from .jobs import WorkerPool
+
+    settings = _resolve_settings()
+    pool = WorkerPool(concurrency, poll_seconds=settings.job_poll_seconds)
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    pool.start()
+    _print_header(f"Job worker {pool.worker_id} running {concurrency} slot(s); press Ctrl+C to stop")
+    try:
+        pool.wait()
+    except KeyboardInterrupt:
+        typer.echo("Stopping; running jobs finish first")
+    finally:
+        pool.stop()
+
+
+@app.command("refresh-analytics")
+def refresh_analytics() -> None:
+    """Fold newly closed orders into the sales KPI aggregates."""
+
+    from .analytics import refresh_views
+    from .database import SessionLocal
+
+    _resolve_settings()
+    with SessionLocal() as session:
+        result = refresh_views(session)
+    typer.secho(
+        f"Processed {result.transitions} closure(s) across {result.orders} order(s); watermark {result.watermark}",
+        fg=typer.colors.GREEN,
+    )
+
+
+@app.command("build-columnar")
+def build_columnar() -> None:
+    """Rebuild the columnar snapshot used by the BI pivot endpoint."""
+
+    from .columnar import ColumnarUnavailableError, build_snapshot
+    from .database import SessionLocal
+
+    settings = _resolve_settings()
+    try:
+        with SessionLocal() as session:
+            info = build_snapshot(session, settings)
+    except ColumnarUnavailableError as exc:
+        typer.secho(str(exc), fg=typer.colors.RED)
+        raise typer.Exit(code=1) from exc
+    typer.secho(f"Snapshot {info.name}: {info.rows} line(s) in {info.build_seconds}s", fg=typer.colors.GREEN)
+
+
+@app.command("verify-reconciliation")
+def verify_reconciliation(
+    day: Optional[str] = typer.Option(None, help="Day to check as YYYY-MM-DD; defaults to yesterday (UTC)."),
+    repair: bool = typer.Option(False, help="Rebuild the day's rollups from orders when they differ."),
+) -> None:
+    """Recompute one day of reconciliation totals from orders and compare."""
+
+    from .database import SessionLocal
+    from .reconciliation import verify_day
+
+    _resolve_settings()
+    target = date.fromisoformat(day) if day else datetime.utcnow().date() - timedelta(days=1)
+    with SessionLocal() as session:
+        check = verify_day(session, target, repair=repair)
+    if check.ok:
+        typer.secho(f"{check.day}: {check.groups} rollup group(s) match the orders", fg=typer.colors.GREEN)
+        return
+    for mismatch in check.mismatches:
+        typer.echo(
+            f"- {mismatch.store_id}/{mismatch.channel}/{mismatch.payment_method or '-'} {mismatch.field}: "
+            f"rollup {mismatch.rollup}, orders {mismatch.recomputed}"
+        )
+    if check.repaired:
+        typer.secho(f"{check.day}: rollups rebuilt from orders", fg=typer.colors.YELLOW)
+        return
+    typer.secho(f"{check.day}: {len(check.mismatches)} mismatch(es)", fg=typer.colors.RED)
+    raise typer.Exit(code=1)
+
+
+@app.command("decrypt-export")
+def decrypt_export_cmd(
+    source: Path = typer.Argument(..., help="Encrypted export file produced by an export job."),
+    output: Path = typer.Option(..., "--output", "-o", help="Where to write the decrypted CSV."),
+) -> None:
+    """Decrypt a compliance export using the configured export key."""
+
+    from .exports import ExportDecryptionError, decrypt_export, load_export_key
+
+    settings = get_settings()
+    try:
+        with output.expanduser().open("wb") as handle:
+            for chunk in decrypt_export(source.expanduser(), load_export_key(settings)):
+                handle.write(chunk)
+    except ExportDecryptionError as exc:
+        output.expanduser().unlink(missing_ok=True)
+        typer.secho(str(exc), fg=typer.colors.RED)
+        raise typer.Exit(code=1) from exc
+    typer.secho(f"Decrypted export written to {output}", fg=typer.colors.GREEN)
+
+
+@app.command()
+def profile(
+    seconds: float = typer.Option(30.0, min=1.0, help="How long running servers should sample"),
+    label: str = typer.Option("window", help="Name included in the profile file names"),
+) -> None:
+    """Profile every running server process for a time window."""
+
+    from .profiling import request_window
+
+    settings = get_settings()
+    if not settings.profiling_enabled:
+        typer.secho(
+            "Servers only profile when started with UCM_COLOR_PROFILING=true", fg=typer.colors.YELLOW
+        )
+    started = datetime.utcnow()
+    directory = request_window(seconds, label, settings)
+    typer.echo(f"Profiling for {seconds:g}s; results are written to {directory}")
+    time.sleep(seconds + 2)
+    written = sorted(
+        path
+        for path in directory.glob("*.folded")
+        if datetime.utcfromtimestamp(path.stat().st_mtime) >= started
+    )
+    if not written:
+        typer.secho("No profiles were written; is a server running with profiling enabled?", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    for path in written:
+        typer.echo(f"- {path}")
+
+
+@app.command()
+def bench(
+    users: int = typer.Option(1000, min=1, help="Synthetic users to seed"),
+    installers: int = typer.Option(5, min=0, help="Synthetic installer files to serve"),
+    concurrency: int = typer.Option(8, min=1, help="Concurrent client connections"),
+    duration: float = typer.Option(10.0, min=1.0, help="Measured seconds of load"),
+    warmup: float = typer.Option(2.0, min=0.0, help="Unmeasured seconds of load before the run"),
+    server_workers: int = typer.Option(1, min=1, help="Uvicorn worker processes"),
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="Write the JSON report to this file"),
+    baseline: Optional[Path] = typer.Option(None, "--baseline", help="Fail if the run regresses against this report"),
+    save_baseline: bool = typer.Option(False, help="Store this run as the --baseline report instead of comparing"),
+    tolerance: float = typer.Option(0.2, min=0.0, help="Allowed relative p95 and throughput drift"),
+) -> None:
+    """Load-test the API against a seeded temporary database."""
+
+    from .loadtest import BenchmarkConfig, compare, run_benchmark
+
+    config = BenchmarkConfig(
+        users=users,
+        installers=installers,
+        concurrency=concurrency,
+        duration=duration,
+        warmup=warmup,
+        server_workers=server_workers,
+    )
+    report = run_benchmark(config)
+    rendered = json.dumps(report, indent=2)
+    typer.echo(rendered)
+    if output is not None:
+        output.write_text(rendered + "\n")
+
+    if baseline is None:
+        return
+    if save_baseline:
+        baseline.write_text(rendered + "\n")
+        typer.secho(f"Saved baseline to {baseline}", fg=typer.colors.GREEN)
+        return
+    if not baseline.exists():
+        typer.secho(f"Baseline {baseline} does not exist; run with --save-baseline first", fg=typer.colors.RED)
+        raise typer.Exit(code=2)
+    regressions = compare(report, json.loads(baseline.read_text()), tolerance)
+    if regressions:
+        typer.secho("Regressed against baseline:", fg=typer.colors.RED)
+        for line in regressions:
+            typer.echo(f"- {line}")
+        raise typer.Exit(code=1)
+    typer.secho(f"Within {tolerance:.0%} of baseline", fg=typer.colors.GREEN)
+
+
 @app.command()
 def show_paths() -> None:
     """Print out important filesystem paths."""
 
-    settings = _resolve_settings()
+    settings = get_settings()
     typer.echo(f"Database: {settings.database_path}")
     typer.echo(f"Config directory: {settings.database_path.parent}")
     typer.echo(f"Installer directory: {settings.installer_dir}")
+    typer.echo(f"Export directory: {settings.export_dir}")
 
 
 @app.command("download-installers")
@@ -153,6 +490,10 @@ def download_installers(
 ) -> None:
     """Download installers exposed by the running API to the local machine."""
 
+    import shutil
+    from urllib.error import URLError
+    from urllib.request import urlopen
+
     output = output.expanduser()
     output.mkdir(parents=True, exist_ok=True)
 
@@ -238,7 +579,9 @@ def publish_installers(
 ) -> None:
     """Publish the current installers as GitHub release assets."""
 
-    settings = _resolve_settings()
+    from .publisher import GitHubPublishingError, PublishResult, publish_installers_to_github
+
+    settings = get_settings()
     source_dir = (installer_dir or settings.installer_dir).expanduser()
 
     if not source_dir.exists():
@@ -0,0 +1,436 @@
+"""Columnar snapshots for BI pivots and top-N queries.
+
+:func:`build_snapshot` streams every closed order line into one NumPy
+array per column (store, region, category, SKU, hour, day, quantity,
+sales, cost). Strings are dictionary encoded, and the arrays are written
+as ``.npy`` files under ``<data dir>/columnar``. Queries memory-map the
+current snapshot and answer group-by, pivot and top-N requests with
+vectorized masks and ``bincount`` instead of row-by-row SQL aggregation.
+:func:`run_pivot` picks the engine: ``auto`` uses the snapshot when NumPy
+is installed (the ``analytics`` extra) and the snapshot is younger than
+``columnar_max_age_seconds``, and otherwise falls back to SQL.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.orm import Session
+
+from . import jobs, models, schemas
+from .config import Settings, get_settings
+from .database import SessionLocal
+from .dependencies import get_db, get_read_db
+
+try:  # NumPy is an optional dependency (``pip install ucm-color-admin[analytics]``)
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without the extra
+    np = None
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+Dimension = Literal["store", "region", "category", "sku", "hour", "day"]
+Measure = Literal["sales_cents", "quantity", "cost_cents", "margin_cents", "lines"]
+Engine = Literal["auto", "sql", "columnar"]
+
+_EPOCH = date(1970, 1, 1)
+_FETCH_SIZE = 100_000
+_DENSE_LIMIT = 1 << 22
+_ENCODED = ("store", "region", "category", "sku")
+_DTYPES = {
+    "store": "int32",
+    "region": "int32",
+    "category": "int32",
+    "sku": "int32",
+    "hour": "int8",
+    "day": "int32",
+    "quantity": "int32",
+    "sales_cents": "int64",
+    "cost_cents": "int64",
+}
+
+_loaded: Optional["ColumnarSnapshot"] = None
+
+
+class ColumnarUnavailableError(RuntimeError):
+    """Raised when the columnar engine is requested but cannot be used."""
+
+
+def _root(settings: Settings) -> Path:
+    return settings.data_dir / "columnar"
+
+
+def _source_statement(as_of: datetime):
+    order, line, store = models.Order, models.OrderLine, models.Store
+    return (
+        select(
+            order.store_id,
+            func.coalesce(store.region, ""),
+            func.coalesce(line.category, ""),
+            line.sku,
+            cast(func.strftime("%H", order.closed_at), Integer),
+            cast(func.julianday(func.date(order.closed_at)) - 2440587.5, Integer),
+            line.quantity,
+            line.amount_cents,
+            line.cost_cents * line.quantity,
+        )
+        .select_from(line)
+        .join(order, order.id == line.order_id)
+        .outerjoin(store, store.store_id == order.store_id)
+        .where(order.closed_at.is_not(None), order.closed_at <= as_of)
+    )
+
+
+def build_snapshot(db: Session, settings: Optional[Settings] = None) -> schemas.ColumnarSnapshotInfo:
+    """Write a new snapshot of all closed order lines and make it current."""
+
+    if np is None:
+        raise ColumnarUnavailableError("NumPy is not installed; install the 'analytics' extra")
+    settings = settings or get_settings()
+    started = time.perf_counter()
+    as_of = datetime.utcnow()
+    name = f"snap-{as_of:%Y%m%d%H%M%S%f}"
+    root = _root(settings)
+    target = root / name
+    target.mkdir(parents=True, exist_ok=True)
+
+    statement = _source_statement(as_of)
+    capacity = db.scalar(select(func.count()).select_from(statement.subquery())) or 0
+    arrays = {
+        column: np.lib.format.open_memmap(target / f"{column}.npy", mode="w+", dtype=dtype, shape=(max(capacity, 1),))
+        for column, dtype in _DTYPES.items()
+    }
+    dictionaries: dict[str, dict[str, int]] = {column: {} for column in _ENCODED}
+    rows = 0
+    result = db.execute(statement.execution_options(yield_per=_FETCH_SIZE))
+    for partition in result.partitions():
+        size = min(len(partition), capacity - rows)
+        if size <= 0:
+            break
+        columns = list(zip(*partition[:size]))
+        for index, column in enumerate(_ENCODED):
+            codes = dictionaries[column]
+            arrays[column][rows:rows + size] = [codes.setdefault(value, len(codes)) for value in columns[index]]
+        for index, column in enumerate(("hour", "day", "quantity", "sales_cents", "cost_cents"), start=len(_ENCODED)):
+            arrays[column][rows:rows + size] = columns[index]
+        rows += size
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    info = schemas.ColumnarSnapshotInfo(
+        name=name, rows=rows, as_of=as_of, build_seconds=round(time.perf_counter() - started, 3)
+    )
+    manifest = {**info.model_dump(mode="json"), "dictionaries": {key: list(value) for key, value in dictionaries.items()}}
+    (target / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False))
+    pointer = root / "CURRENT.tmp"
+    pointer.write_text(name)
+    os.replace(pointer, root / "CURRENT")
+    for stale in root.glob("snap-*"):
+        if stale.name != name:
+            shutil.rmtree(stale, ignore_errors=True)
+    return info
+
+
+@dataclass
+class ColumnarSnapshot:
+    """A memory-mapped snapshot plus its string dictionaries."""
+
+    name: str
+    rows: int
+    as_of: datetime
+    build_seconds: float
+    columns: dict[str, Any]
+    values: dict[str, list[str]]
+    codes: dict[str, dict[str, int]]
+
+    @classmethod
+    def open(cls, path: Path) -> "ColumnarSnapshot":
+        manifest = json.loads((path / "manifest.json").read_text())
+        rows = manifest["rows"]
+        columns = {column: np.load(path / f"{column}.npy", mmap_mode="r")[:rows] for column in _DTYPES}
+        values = manifest["dictionaries"]
+        return cls(
+            name=manifest["name"],
+            rows=rows,
+            as_of=datetime.fromisoformat(manifest["as_of"]),
+            build_seconds=manifest["build_seconds"],
+            columns=columns,
+            values=values,
+            codes={column: {value: code for code, value in enumerate(names)} for column, names in values.items()},
+        )
+
+    def info(self) -> schemas.ColumnarSnapshotInfo:
+        return schemas.ColumnarSnapshotInfo(name=self.name, rows=self.rows, as_of=self.as_of, build_seconds=self.build_seconds)
+
+    def _measure(self, measure: str, mask: Any) -> Any:
+        def column(name: str) -> Any:
+            data = self.columns[name]
+            return data if mask is None else data[mask]
+
+        if measure == "lines":
+            return None
+        if measure == "margin_cents":
+            return column("sales_cents") - column("cost_cents")
+        return column(measure)
+
+    def pivot(
+        self,
+        dims: list[str],
+        measure: str,
+        *,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        store_id: Optional[str] = None,
+        region: Optional[str] = None,
+        limit: int = 100,
+    ) -> list[schemas.PivotRow]:
+        """Group the snapshot by *dims* and return the top *limit* groups by *measure*."""
+
+        conditions = []
+        if start is not None:
+            conditions.append(self.columns["day"] >= (start - _EPOCH).days)
+        if end is not None:
+            conditions.append(self.columns["day"] <= (end - _EPOCH).days)
+        for column, value in (("store", store_id), ("region", region)):
+            if value is None:
+                continue
+            code = self.codes[column].get(value)
+            if code is None:
+                return []
+            conditions.append(self.columns[column] == code)
+        mask = np.logical_and.reduce(conditions) if conditions else None
+        weights = self._measure(measure, mask)
+
+        if not dims:
+            matched = self.rows if mask is None else int(mask.sum())
+            if not matched:
+                return []
+            total = matched if weights is None else int(weights.sum())
+            return [schemas.PivotRow(keys={}, value=total)]
+
+        keys, sizes, offsets = [], [], []
+        for dim in dims:
+            data = self.columns[dim]
+            data = data if mask is None else data[mask]
+            offset = int(data.min()) if dim == "day" and len(data) else 0
+            size = 24 if dim == "hour" else (int(data.max()) - offset + 1 if dim == "day" and len(data) else len(self.values.get(dim, ())) or 1)
+            keys.append(data.astype(np.int64) - offset)
+            sizes.append(size)
+            offsets.append(offset)
+        if not len(keys[0]):
+            return []
+
+        flat = keys[0]
+        for key, size in zip(keys[1:], sizes[1:]):
+            flat = flat * size + key
+        groups = 1
+        for size in sizes:
+            groups *= size
+        if groups <= _DENSE_LIMIT:
+            counts = np.bincount(flat, minlength=groups)
+            present = np.flatnonzero(counts)
+            sums = counts[present] if weights is None else np.bincount(flat, weights=weights, minlength=groups)[present]
+        else:
+            present, inverse = np.unique(flat, return_inverse=True)
+            sums = np.bincount(inverse) if weights is None else np.bincount(inverse, weights=weights)
+
+        if limit < len(present):
+            top = np.argpartition(-sums, limit - 1)[:limit]
+            present, sums = present[top], sums[top]
+        order = np.argsort(-sums, kind="stable")
+        present, sums = present[order], sums[order]
+
+        decoded = np.unravel_index(present, sizes)
+        rows: list[schemas.PivotRow] = []
+        for position, value in enumerate(sums):
+            labels: dict[str, Any] = {}
+            for dim, codes, offset in zip(dims, decoded, offsets):
+                code = int(codes[position]) + offset
+                if dim == "hour":
+                    labels[dim] = code
+                elif dim == "day":
+                    labels[dim] = (_EPOCH + timedelta(days=code)).isoformat()
+                else:
+                    labels[dim] = self.values[dim][code]
+            rows.append(schemas.PivotRow(keys=labels, value=int(round(float(value)))))
+        return rows
+
+
+def current_snapshot(settings: Optional[Settings] = None) -> Optional[ColumnarSnapshot]:
+    """Return the current snapshot, reopening it when a newer one was built."""
+
+    global _loaded
+    if np is None:
+        return None
+    root = _root(settings or get_settings())
+    try:
+        name = (root / "CURRENT").read_text().strip()
+    except FileNotFoundError:
+        return None
+    if _loaded is None or _loaded.name != name:
+        _loaded = ColumnarSnapshot.open(root / name)
+    return _loaded
+
+
+def sql_pivot(
+    db: Session,
+    dims: list[str],
+    measure: str,
+    *,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    store_id: Optional[str] = None,
+    region: Optional[str] = None,
+    limit: int = 100,
+) -> list[schemas.PivotRow]:
+    """Row-oriented equivalent of :meth:`ColumnarSnapshot.pivot`."""
+
+    order, line, store = models.Order, models.OrderLine, models.Store
+    dimensions = {
+        "store": order.store_id,
+        "region": func.coalesce(store.region, ""),
+        "category": func.coalesce(line.category, ""),
+        "sku": line.sku,
+        "hour": cast(func.strftime("%H", order.closed_at), Integer),
+        "day": func.date(order.closed_at),
+    }
+    measures = {
+        "sales_cents": func.sum(line.amount_cents),
+        "quantity": func.sum(line.quantity),
+        "cost_cents": func.sum(line.cost_cents * line.quantity),
+        "margin_cents": func.sum(line.amount_cents - line.cost_cents * line.quantity),
+        "lines": func.count(),
+    }
+    value = measures[measure].label("value")
+    statement = (
+        select(*(dimensions[dim].label(dim) for dim in dims), value)
+        .select_from(line)
+        .join(order, order.id == line.order_id)
+        .outerjoin(store, store.store_id == order.store_id)
+        .where(order.closed_at.is_not(None))
+    )
+    if start is not None:
+        statement = statement.where(order.closed_at >= datetime.combine(start, datetime.min.time()))
+    if end is not None:
+        statement = statement.where(order.closed_at < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    if store_id is not None:
+        statement = statement.where(order.store_id == store_id)
+    if region is not None:
+        statement = statement.where(store.region == region)
+    if dims:
+        statement = statement.group_by(*(dimensions[dim] for dim in dims))
+    statement = statement.order_by(value.desc()).limit(limit)
+    return [
+        schemas.PivotRow(keys={dim: row._mapping[dim] for dim in dims}, value=row.value)
+        for row in db.execute(statement)
+        if row.value is not None
+    ]
+
+
+def choose_engine(requested: str, snapshot: Optional[ColumnarSnapshot], settings: Optional[Settings] = None) -> str:
+    if requested == "sql":
+        return "sql"
+    if requested == "columnar":
+        if snapshot is None:
+            raise ColumnarUnavailableError("No columnar snapshot is available; build one first")
+        return "columnar"
+    settings = settings or get_settings()
+    if snapshot is not None and (datetime.utcnow() - snapshot.as_of).total_seconds() <= settings.columnar_max_age_seconds:
+        return "columnar"
+    return "sql"
+
+
+def run_pivot(
+    db: Session,
+    dims: list[str],
+    measure: str,
+    *,
+    engine: str = "auto",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    store_id: Optional[str] = None,
+    region: Optional[str] = None,
+    limit: int = 100,
+) -> schemas.PivotResult:
+    snapshot = current_snapshot() if engine != "sql" else None
+    chosen = choose_engine(engine, snapshot)
+    filters = dict(start=start, end=end, store_id=store_id, region=region, limit=limit)
+    if chosen == "columnar":
+        rows = snapshot.pivot(dims, measure, **filters)
+        return schemas.PivotResult(engine="columnar", measure=measure, dims=dims, as_of=snapshot.as_of, rows=rows)
+    rows = sql_pivot(db, dims, measure, **filters)
+    return schemas.PivotResult(engine="sql", measure=measure, dims=dims, rows=rows)
+
+
+@router.get("/pivot", response_model=schemas.PivotResult)
+def pivot_endpoint(
+    dims: list[Dimension] = Query(default=["store"]),
+    measure: Measure = "sales_cents",
+    engine: Engine = "auto",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    store_id: Optional[str] = None,
+    region: Optional[str] = None,
+    limit: int = 100,
+    db: Session = Depends(get_read_db),
+):
+    try:
+        return run_pivot(
+            db,
+            list(dict.fromkeys(dims)),
+            measure,
+            engine=engine,
+            start=start,
+            end=end,
+            store_id=store_id,
+            region=region,
+            limit=min(max(limit, 1), 10_000),
+        )
+    except ColumnarUnavailableError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+
+
+@router.get("/columnar", response_model=schemas.ColumnarSnapshotInfo)
+def snapshot_info():
+    snapshot = current_snapshot()
+    if snapshot is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No columnar snapshot")
+    return snapshot.info()
+
+
+@router.post("/columnar/rebuild", response_model=schemas.JobRead, status_code=status.HTTP_202_ACCEPTED)
+def rebuild_snapshot(db: Session = Depends(get_db)):
+    if np is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="NumPy is not installed")
+    return jobs.enqueue(db, "columnar.rebuild", priority=5)
+
+
+@jobs.handler("columnar.rebuild", max_attempts=2)
+def _rebuild_job(context: jobs.JobContext) -> dict[str, Any]:
+    with SessionLocal() as session:
+        return build_snapshot(session).model_dump(mode="json")
+
+
+jobs.builtin_schedule("columnar.rebuild", "columnar.rebuild", "5 * * * *", enabled=lambda settings: np is not None)
+
+
+__all__ = [
+    "ColumnarSnapshot",
+    "ColumnarUnavailableError",
+    "build_snapshot",
+    "choose_engine",
+    "current_snapshot",
+    "router",
+    "run_pivot",
+    "sql_pivot",
+]
@@ -26,6 +26,24 @@ def _default_database_path() -> Path:
     return _default_data_root() / "database.sqlite3"
 
 
+def _default_data_dir() -> Path:
+    """Resolve the directory holding generated data, next to the database by default."""
+
+    override = os.environ.get("UCM_COLOR_DATA_DIR")
+    if override:
+        return Path(override).expanduser()
+    return _default_database_path().parent
+
+
+def _default_export_dir() -> Path:
+    """Resolve the directory where compliance exports are written."""
+
+    override = os.environ.get("UCM_COLOR_EXPORT_DIR")
+    if override:
+        return Path(override).expanduser()
+    return _default_data_dir() / "exports"
+
+
 def _default_installer_dir() -> Path:
     """Resolve the installer directory taking overrides into account."""
 
@@ -35,6 +53,24 @@ def _default_installer_dir() -> Path:
     return _default_data_root() / "installers"
 
 
+def _default_workers() -> int:
+    """One server process per core, capped because SQLite has a single writer."""
+
+    override = os.environ.get("UCM_COLOR_WORKERS")
+    if override:
+        return max(int(override), 1)
+    return min(os.cpu_count() or 1, 4)
+
+
+def _metrics_dir() -> Path | None:
+    """Directory where server processes exchange metrics; unset for a single process."""
+
+    override = os.environ.get("UCM_COLOR_METRICS_DIR")
+    if override:
+        return Path(override).expanduser()
+    return None
+
+
 @dataclass(slots=True)
 class Settings:
     """Runtime configuration loaded from environment variables."""
@@ -44,14 +80,67 @@ class Settings:
     port: int = field(default_factory=lambda: int(os.environ.get("UCM_COLOR_PORT", "8000")))
     reload: bool = field(default_factory=lambda: os.environ.get("UCM_COLOR_RELOAD", "false").lower() == "true")
     log_level: str = field(default_factory=lambda: os.environ.get("UCM_COLOR_LOG_LEVEL", "info"))
+    workers: int = field(default_factory=_default_workers)
+    metrics_dir: Path | None = field(default_factory=_metrics_dir)
     database_path: Path = field(default_factory=_default_database_path)
     installer_dir: Path = field(default_factory=_default_installer_dir)
+    data_dir: Path = field(default_factory=_default_data_dir)
+    export_dir: Path = field(default_factory=_default_export_dir)
+    export_key: str | None = field(default_factory=lambda: os.environ.get("UCM_COLOR_EXPORT_KEY") or None)
+    api_key_pepper: str | None = field(default_factory=lambda: os.environ.get("UCM_COLOR_API_KEY_PEPPER") or None)
+    session_secret: str | None = field(default_factory=lambda: os.environ.get("UCM_COLOR_SESSION_SECRET") or None)
+    api_key_cache_seconds: float = field(
+        default_factory=lambda: float(os.environ.get("UCM_COLOR_API_KEY_CACHE_SECONDS", "30"))
+    )
+    login_window_seconds: int = field(
+        default_factory=lambda: int(os.environ.get("UCM_COLOR_LOGIN_WINDOW_SECONDS", "300"))
+    )
+    login_max_failures_per_ip: int = field(
+        default_factory=lambda: int(os.environ.get("UCM_COLOR_LOGIN_MAX_FAILURES_PER_IP", "30"))
+    )
+    login_max_failures_per_user: int = field(
+        default_factory=lambda: int(os.environ.get("UCM_COLOR_LOGIN_MAX_FAILURES_PER_USER", "10"))
+    )
+    login_throttle_shared: bool = field(
+        default_factory=lambda: os.environ.get("UCM_COLOR_LOGIN_THROTTLE_SHARED", "false").lower() == "true"
+    )
+    fast_json: bool = field(default_factory=lambda: os.environ.get("UCM_COLOR_FAST_JSON", "true").lower() == "true")
+    read_pool_size: int = field(default_factory=lambda: int(os.environ.get("UCM_COLOR_READ_POOL_SIZE", "5")))
+    wal_checkpoint_seconds: int = field(
+        default_factory=lambda: int(os.environ.get("UCM_COLOR_WAL_CHECKPOINT_SECONDS", "60"))
+    )
+    job_workers: int = field(default_factory=lambda: int(os.environ.get("UCM_COLOR_JOB_WORKERS", "2")))
+    job_poll_seconds: float = field(default_factory=lambda: float(os.environ.get("UCM_COLOR_JOB_POLL_SECONDS", "1")))
+    audit_buffer_size: int = field(default_factory=lambda: int(os.environ.get("UCM_COLOR_AUDIT_BUFFER_SIZE", "10000")))
+    audit_flush_seconds: float = field(
+        default_factory=lambda: float(os.environ.get("UCM_COLOR_AUDIT_FLUSH_SECONDS", "1"))
+    )
+    analytics_refresh_seconds: int = field(
+        default_factory=lambda: int(os.environ.get("UCM_COLOR_ANALYTICS_REFRESH_SECONDS", "60"))
+    )
+    columnar_max_age_seconds: int = field(
+        default_factory=lambda: int(os.environ.get("UCM_COLOR_COLUMNAR_MAX_AGE_SECONDS", "3600"))
+    )
+    sketch_retention_days: int = field(
+        default_factory=lambda: int(os.environ.get("UCM_COLOR_SKETCH_RETENTION_DAYS", "400"))
+    )
+    profiling_enabled: bool = field(
+        default_factory=lambda: os.environ.get("UCM_COLOR_PROFILING", "false").lower() == "true"
+    )
+    profile_interval_ms: float = field(
+        default_factory=lambda: float(os.environ.get("UCM_COLOR_PROFILE_INTERVAL_MS", "5"))
+    )
+    refund_dual_review: bool = field(
+        default_factory=lambda: os.environ.get("UCM_COLOR_REFUND_DUAL_REVIEW", "false").lower() == "true"
+    )
 
     def ensure_storage(self) -> None:
         """Ensure that the database directory exists."""
 
         self.database_path.parent.mkdir(parents=True, exist_ok=True)
         self.installer_dir.mkdir(parents=True, exist_ok=True)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.export_dir.mkdir(parents=True, exist_ok=True)
 
 
 @lru_cache(maxsize=1)
@@ -20,6 +20,17 @@ def list_users(db: Session, *, skip: int = 0, limit: int = 50) -> list[models.Us
     return list(db.scalars(statement))
 
 
+_USER_FIELDS = tuple(schemas.UserRead.model_fields)
+
+
+def list_user_rows(db: Session, *, skip: int = 0, limit: int = 50) -> list[dict]:
+    """Same page as :func:`list_users` as plain ``UserRead``-shaped dicts, without loading ORM objects."""
+
+    columns = [getattr(models.User, name) for name in _USER_FIELDS]
+    statement = select(*columns).offset(skip).limit(limit)
+    return [dict(zip(_USER_FIELDS, row)) for row in db.execute(statement)]
+
+
 def get_user(db: Session, user_id: int) -> Optional[models.User]:
     return db.get(models.User, user_id)
 
@@ -59,15 +70,24 @@ def update_user(db: Session, user: models.User, payload: schemas.UserUpdate) ->
         user.is_superuser = payload.is_superuser
     if payload.password:
         user.hashed_password = security.hash_password(payload.password)
+    # rbac pulls in FastAPI; importing it here keeps CLI commands that only read users light.
+    from . import rbac
+
     db.add(user)
+    rbac.bump_generation(db)
     db.commit()
+    rbac.invalidate_permissions()
     db.refresh(user)
     return user
 
 
 def delete_user(db: Session, user: models.User) -> None:
+    from . import rbac
+
     db.delete(user)
+    rbac.bump_generation(db)
     db.commit()
+    rbac.invalidate_permissions()
 
 
 def authenticate_user(db: Session, username: str, password: str) -> Optional[models.User]:
@@ -1,11 +1,25 @@
-"""Database utilities."""
+"""Database utilities.
+
+Two engines open the same SQLite file. :func:`get_engine` (and
+:data:`SessionLocal`) serves everything that writes. :func:`get_read_engine`
+(and :data:`ReadSessionLocal`) opens connections with ``mode=ro`` and
+``PRAGMA query_only`` in a pool of its own, sized by
+``UCM_COLOR_READ_POOL_SIZE``, for reports, exports and list endpoints. Long
+scans then never hold a write-pool connection. :func:`oldest_reader_age`
+lets the WAL checkpoint job see how long this process's oldest read has
+been open.
+"""
 
 from __future__ import annotations
 
+import hashlib
+import os
+import threading
+import time
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Callable, Iterator, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, event, text
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
 from .config import get_settings
@@ -15,25 +29,131 @@ class Base(DeclarativeBase):
     """Base model for SQLAlchemy mappings."""
 
 
-def _create_engine():
+def configure_sqlite_connection(dbapi_connection, _connection_record) -> None:
+    """Use WAL journaling so readers never block the single writer."""
+
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def _create_engine() -> Engine:
+    from . import metrics
+
     settings = get_settings()
-    return create_engine(
-        f"sqlite:///{settings.database_path}", connect_args={"check_same_thread": False}, future=True
+    engine = create_engine(
+        f"sqlite:///{settings.database_path}",
+        connect_args={"check_same_thread": False},
+        poolclass=metrics.TimedQueuePool,
+        future=True,
     )
+    event.listen(engine, "connect", configure_sqlite_connection)
+    metrics.instrument_engine(engine)
+    return engine
 
 
-def get_engine():
-    """Return a lazily created engine instance."""
+def configure_read_only_connection(dbapi_connection, _connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
 
-    global engine
-    try:
-        return engine
-    except NameError:  # pragma: no cover - executed once at runtime
-        engine = _create_engine()
-        return engine
 
+# Checkout times of read connections, keyed by id(connection record).
+_readers: dict[int, float] = {}
+_readers_lock = threading.Lock()
+
+
+def _reader_checkout(_dbapi_connection, connection_record, _proxy) -> None:
+    with _readers_lock:
+        _readers[id(connection_record)] = time.monotonic()
+
+
+def _reader_checkin(_dbapi_connection, connection_record) -> None:
+    with _readers_lock:
+        _readers.pop(id(connection_record), None)
+
+
+def _create_read_engine() -> Engine:
+    from . import metrics
+
+    settings = get_settings()
+    # A ``file:`` URI with mode=ro: the connection cannot write even if query_only were reset.
+    uri = f"{settings.database_path.resolve().as_uri()}?mode=ro"
+    engine = create_engine(
+        f"sqlite:///{uri}&uri=true",
+        connect_args={"check_same_thread": False},
+        poolclass=metrics.TimedQueuePool,
+        pool_size=max(settings.read_pool_size, 1),
+        future=True,
+    )
+    event.listen(engine, "connect", configure_read_only_connection)
+    event.listen(engine, "checkout", _reader_checkout)
+    event.listen(engine, "checkin", _reader_checkin)
+    metrics.instrument_engine(engine)
+    return engine
+
+
+_engine: Optional[Engine] = None
+_read_engine: Optional[Engine] = None
+
+
+def get_engine() -> Engine:
+    """Return the engine, creating it on first use."""
+
+    global _engine
+    if _engine is None:
+        _engine = _create_engine()
+    return _engine
+
+
+def get_read_engine() -> Engine:
+    """Return the read-only engine, creating it on first use."""
+
+    global _read_engine
+    if _read_engine is None:
+        # The writable engine creates the database and its WAL files, which read-only connections cannot.
+        get_engine()
+        _read_engine = _create_read_engine()
+    return _read_engine
 
-SessionLocal = sessionmaker(bind=get_engine(), autoflush=False, autocommit=False, expire_on_commit=False)
+
+def oldest_reader_age() -> float:
+    """Seconds the oldest read-only connection in this process has been checked out, or ``0``."""
+
+    with _readers_lock:
+        started = min(_readers.values(), default=None)
+    return time.monotonic() - started if started is not None else 0.0
+
+
+def _dispose_after_fork() -> None:
+    """A forked child must open its own SQLite connections instead of sharing the parent's."""
+
+    for engine in (_engine, _read_engine):
+        if engine is not None:
+            engine.dispose(close=False)
+    _readers.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+class _LazySessionmaker(sessionmaker):
+    """Session factory that binds to its engine when the first session is made."""
+
+    def __init__(self, engine_factory: Callable[[], Engine], **kw) -> None:
+        super().__init__(**kw)
+        self.engine_factory = engine_factory
+
+    def __call__(self, **local_kw) -> Session:
+        if self.kw.get("bind") is None:
+            self.configure(bind=self.engine_factory())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = _LazySessionmaker(get_engine, autoflush=False, autocommit=False, expire_on_commit=False)
+ReadSessionLocal = _LazySessionmaker(get_read_engine, autoflush=False, autocommit=False, expire_on_commit=False)
 
 
 @contextmanager
@@ -51,9 +171,63 @@ def session_scope() -> Iterator[Session]:
         session.close()
 
 
-def init_database() -> None:
-    """Ensure that the database schema exists."""
+def schema_version() -> int:
+    """Fingerprint of the mapped tables, columns and indexes.
+
+    Stored in ``PRAGMA user_version`` so startup can tell whether the schema
+    already matches the models with one read instead of inspecting every
+    table.
+    """
 
     from . import models  # noqa: F401 - ensure models are imported
 
-    Base.metadata.create_all(bind=get_engine())
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        columns = ",".join(f"{column.name}:{column.type!r}" for column in table.columns)
+        indexes = ",".join(sorted(index.name or "" for index in table.indexes))
+        parts.append(f"{table.name}({columns})[{indexes}]")
+    digest = hashlib.blake2b("\n".join(parts).encode(), digest_size=4).digest()
+    # user_version is a signed 32-bit integer; keep it positive and non-zero.
+    return int.from_bytes(digest, "big") & 0x7FFFFFFF or 1
+
+
+def init_database() -> None:
+    """Ensure that the database schema exists."""
+
+    version = schema_version()
+    engine = get_engine()
+    with engine.connect() as connection:
+        if connection.execute(text("PRAGMA user_version")).scalar() == version:
+            return
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text(f"PRAGMA user_version = {version}"))
+
+
+def checkpoint_wal() -> dict[str, object]:
+    """Copy the WAL back into the database without blocking readers or writers.
+
+    A ``PASSIVE`` checkpoint copies every frame that no open read
+    transaction still needs. Only when it copied everything and no read in
+    this process is open is the WAL also truncated, with a short busy
+    timeout so writers are never held up for long.
+    """
+
+    readers = oldest_reader_age()
+    with get_engine().connect() as connection:
+        _, frames, copied = connection.execute(text("PRAGMA wal_checkpoint(PASSIVE)")).one()
+        truncated = False
+        if frames >= 0 and copied == frames and not readers:
+            timeout = connection.execute(text("PRAGMA busy_timeout")).scalar()
+            connection.execute(text("PRAGMA busy_timeout = 100"))
+            try:
+                truncated = connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)")).one()[0] == 0
+            finally:
+                connection.execute(text(f"PRAGMA busy_timeout = {int(timeout)}"))
+        connection.commit()
+    return {
+        "wal_frames": frames,
+        "checkpointed_frames": copied,
+        "truncated": truncated,
+        "oldest_reader_seconds": round(readers, 3),
+    }
@@ -0,0 +1,293 @@
+"""Asynchronous compliance export jobs.
+
+Export requests are stored in ``export_jobs`` and run as ``exports.run``
+jobs on the background job queue (see :mod:`.jobs`). Rows are streamed from the database in chunks and
+written through :class:`EncryptedWriter`, so memory use does not depend on
+the size of the export. Files are encrypted with a keyed BLAKE2b stream
+cipher and authenticated with HMAC-SHA256; use :func:`decrypt_export`
+(or ``ucm-color-admin decrypt-export``) to read them back.
+
+The API needs a signed-in user. Unmasked exports, and downloading them,
+are limited to superusers and holders of ``exports:unmasked``.
+"""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import hmac
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from . import jobs, models, rbac, schemas, security
+from .config import Settings, get_settings
+from .database import ReadSessionLocal, SessionLocal
+from .dependencies import get_db
+from .privacy import masked_member_columns
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+_MAGIC = b"UCMX1"
+_NONCE_BYTES = 16
+_MAC_BYTES = 32
+_BLOCK = 64
+_CHUNK = 64 * 1024
+_FETCH_SIZE = 1000
+_UNMASKED = rbac.permission_mask(("exports:unmasked",))
+
+
+class ExportDecryptionError(RuntimeError):
+    """Raised when an export file is corrupt or the key does not match."""
+
+
+def load_export_key(settings: Optional[Settings] = None) -> bytes:
+    """Return the export key, creating a private key file on first use."""
+
+    settings = settings or get_settings()
+    if settings.export_key:
+        return bytes.fromhex(settings.export_key)
+    return security.load_secret_file(settings.data_dir / "export.key")
+
+
+def _subkeys(key: bytes) -> tuple[bytes, bytes]:
+    encrypt = hashlib.blake2b(key, digest_size=32, person=b"ucm-export-enc").digest()
+    mac = hashlib.blake2b(key, digest_size=32, person=b"ucm-export-mac").digest()
+    return encrypt, mac
+
+
+def _keystream_xor(data: bytes, key: bytes, nonce: bytes, counter: int) -> bytes:
+    blocks = (len(data) + _BLOCK - 1) // _BLOCK
+    stream = b"".join(
+        hashlib.blake2b(nonce + (counter + index).to_bytes(8, "big"), key=key).digest() for index in range(blocks)
+    )
+    size = len(data)
+    return (int.from_bytes(data, "big") ^ int.from_bytes(stream[:size], "big")).to_bytes(size, "big")
+
+
+class EncryptedWriter:
+    """Text file-like object that encrypts everything written to it."""
+
+    def __init__(self, handle: BinaryIO, key: bytes) -> None:
+        self._handle = handle
+        self._key, mac_key = _subkeys(key)
+        self._nonce = os.urandom(_NONCE_BYTES)
+        self._mac = hmac.new(mac_key, digestmod=hashlib.sha256)
+        self._counter = 0
+        self._buffer = bytearray()
+        self._emit(_MAGIC + self._nonce, encrypt=False)
+
+    def _emit(self, data: bytes, *, encrypt: bool = True) -> None:
+        if encrypt:
+            data = _keystream_xor(data, self._key, self._nonce, self._counter)
+            self._counter += (len(data) + _BLOCK - 1) // _BLOCK
+        self._mac.update(data)
+        self._handle.write(data)
+
+    def write(self, text: str) -> int:
+        self._buffer += text.encode("utf-8")
+        if len(self._buffer) >= _CHUNK:
+            cut = len(self._buffer) - len(self._buffer) % _BLOCK
+            self._emit(bytes(self._buffer[:cut]))
+            del self._buffer[:cut]
+        return len(text)
+
+    def close(self) -> None:
+        if self._buffer:
+            self._emit(bytes(self._buffer))
+            self._buffer.clear()
+        self._handle.write(self._mac.digest())
+
+
+def decrypt_export(path: Path, key: bytes) -> Iterator[bytes]:
+    """Yield the plaintext of an export file after verifying its MAC."""
+
+    enc_key, mac_key = _subkeys(key)
+    size = path.stat().st_size
+    header = len(_MAGIC) + _NONCE_BYTES
+    if size < header + _MAC_BYTES:
+        raise ExportDecryptionError(f"{path} is not an export file")
+    body_end = size - _MAC_BYTES
+    with path.open("rb") as handle:
+        mac = hmac.new(mac_key, digestmod=hashlib.sha256)
+        remaining = body_end
+        while remaining:
+            chunk = handle.read(min(_CHUNK, remaining))
+            mac.update(chunk)
+            remaining -= len(chunk)
+        if not hmac.compare_digest(mac.digest(), handle.read(_MAC_BYTES)):
+            raise ExportDecryptionError(f"{path} failed authentication; wrong key or corrupted file")
+
+        handle.seek(0)
+        prefix = handle.read(header)
+        if not prefix.startswith(_MAGIC):
+            raise ExportDecryptionError(f"{path} is not an export file")
+        nonce = prefix[len(_MAGIC):]
+        counter = 0
+        remaining = body_end - header
+        while remaining:
+            chunk = handle.read(min(_CHUNK, remaining))
+            remaining -= len(chunk)
+            yield _keystream_xor(chunk, enc_key, nonce, counter)
+            counter += (len(chunk) + _BLOCK - 1) // _BLOCK
+
+
+def _set_status(job_id: int, **values: object) -> None:
+    with SessionLocal() as session:
+        session.execute(update(models.ExportJob).where(models.ExportJob.id == job_id).values(**values))
+        session.commit()
+
+
+def run_export(
+    job_id: int,
+    settings: Optional[Settings] = None,
+    *,
+    progress: Optional[Callable[[float, str], None]] = None,
+) -> None:
+    """Stream the rows for *job_id* into an encrypted CSV file.
+
+    *progress* is called after every chunk; an exception raised by it
+    (such as a cancellation) aborts the export and is re-raised.
+    """
+
+    settings = settings or get_settings()
+    with SessionLocal() as session:
+        job = session.get(models.ExportJob, job_id)
+        if job is None or job.status in ("succeeded", "failed"):
+            return
+        masked = job.masked
+        file_name = f"{job.kind}-{job.id}-{datetime.utcnow():%Y%m%d%H%M%S}.csv.enc"
+        total = session.scalar(select(func.count()).select_from(models.Member)) or 0
+    _set_status(job_id, status="running", started_at=datetime.utcnow(), file_name=file_name)
+
+    target = settings.export_dir / file_name
+    rows = 0
+    try:
+        columns = masked_member_columns(masked)
+        with ReadSessionLocal() as session, target.open("wb") as handle:
+            writer = EncryptedWriter(handle, load_export_key(settings))
+            out = csv.writer(writer)
+            out.writerow([column.key for column in columns])
+            result = session.execute(
+                select(*columns).order_by(models.Member.id).execution_options(yield_per=_FETCH_SIZE)
+            )
+            for partition in result.partitions():
+                out.writerows(partition)
+                rows += len(partition)
+                if progress is not None:
+                    progress(rows / total if total else 1.0, f"{rows} row(s) written")
+            writer.close()
+    except Exception as exc:
+        target.unlink(missing_ok=True)
+        _set_status(job_id, status="failed", error=str(exc), row_count=rows, finished_at=datetime.utcnow())
+        raise
+    _set_status(job_id, status="succeeded", row_count=rows, finished_at=datetime.utcnow())
+
+
+@jobs.handler("exports.run", max_attempts=1)
+def _export_job(context: jobs.JobContext) -> dict[str, int]:
+    export_id = int(context.payload["export_id"])
+    run_export(export_id, progress=context.progress)
+    return {"export_id": export_id}
+
+
+def may_export_unmasked(principal: Optional[rbac.Principal]) -> bool:
+    return principal is not None and principal.allows(_UNMASKED)
+
+
+def submit_export(db: Session, payload: schemas.ExportJobCreate, requested_by: Optional[str] = None) -> models.ExportJob:
+    job = models.ExportJob(kind=payload.kind, masked=payload.masked, requested_by=requested_by, status="queued")
+    db.add(job)
+    db.flush()
+    # enqueue() commits, so the export row and its queue entry land together.
+    jobs.enqueue(db, "exports.run", {"export_id": job.id})
+    db.refresh(job)
+    return job
+
+
+def visible_owner(principal: Optional[rbac.Principal]) -> Optional[str]:
+    """Return the requester whose exports ``principal`` is limited to, or None if they may see all of them."""
+
+    if may_export_unmasked(principal):
+        return None
+    return principal.username if principal is not None else ""
+
+
+def list_exports(db: Session, *, limit: int = 50, requested_by: Optional[str] = None) -> list[models.ExportJob]:
+    statement = select(models.ExportJob)
+    if requested_by is not None:
+        statement = statement.where(models.ExportJob.requested_by == requested_by)
+    return list(db.scalars(statement.order_by(models.ExportJob.id.desc()).limit(limit)))
+
+
+def _get_or_404(db: Session, job_id: int, principal: rbac.Principal) -> models.ExportJob:
+    job = db.get(models.ExportJob, job_id)
+    owner = visible_owner(principal)
+    if not job or (owner is not None and job.requested_by != owner):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export job not found")
+    return job
+
+
+def _require_unmasked(principal: rbac.Principal) -> None:
+    if not may_export_unmasked(principal):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Requires permission: exports:unmasked")
+
+
+@router.post("", response_model=schemas.ExportJobRead, status_code=status.HTTP_202_ACCEPTED)
+def create_export(
+    payload: schemas.ExportJobCreate,
+    principal: rbac.Principal = Depends(rbac.require_permission()),
+    db: Session = Depends(get_db),
+):
+    if not payload.masked:
+        _require_unmasked(principal)
+    return submit_export(db, payload, principal.username)
+
+
+@router.get("", response_model=list[schemas.ExportJobRead])
+def list_exports_endpoint(
+    limit: int = 50, principal: rbac.Principal = Depends(rbac.require_permission()), db: Session = Depends(get_db)
+):
+    return list_exports(db, limit=limit, requested_by=visible_owner(principal))
+
+
+@router.get("/{job_id}", response_model=schemas.ExportJobRead)
+def get_export(
+    job_id: int, principal: rbac.Principal = Depends(rbac.require_permission()), db: Session = Depends(get_db)
+):
+    return _get_or_404(db, job_id, principal)
+
+
+@router.get("/{job_id}/download", response_class=FileResponse)
+def download_export(
+    job_id: int, principal: rbac.Principal = Depends(rbac.require_permission()), db: Session = Depends(get_db)
+) -> FileResponse:
+    job = _get_or_404(db, job_id, principal)
+    if not job.masked:
+        _require_unmasked(principal)
+    if job.status != "succeeded" or not job.file_name:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Export is not ready")
+    path = get_settings().export_dir / job.file_name
+    if not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export file not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=job.file_name)
+
+
+__all__ = [
+    "EncryptedWriter",
+    "ExportDecryptionError",
+    "decrypt_export",
+    "list_exports",
+    "load_export_key",
+    "may_export_unmasked",
+    "router",
+    "run_export",
+    "submit_export",
+    "visible_owner",
+]
@@ -0,0 +1,38 @@
+"""Cross-process invalidation for compiled caches.
+
+The loyalty plan and the promotion indexes are compiled once per server
+process. Whoever changes their source rows calls :func:`bump` in the same
+transaction, which increments a counter in ``cache_generations``; every
+process compares its plan's generation with :func:`current` at most every
+``RECHECK_SECONDS`` and rebuilds the plan when it moved, the same way
+:mod:`rbac` handles ``rbac_state``.
+"""
+
+from __future__ import annotations
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+__all__ = ["RECHECK_SECONDS", "bump", "current"]
+
+RECHECK_SECONDS = 1.0
+
+
+def current(db: Session, name: str) -> int:
+    """Return the stored generation of cache ``name`` (``0`` before its first change)."""
+
+    table = models.CacheGeneration
+    return db.scalar(select(table.generation).where(table.name == name)) or 0
+
+
+def bump(db: Session, name: str) -> None:
+    """Record that the rows behind cache ``name`` changed. The caller commits."""
+
+    table = models.CacheGeneration
+    statement = sqlite_insert(table).values(name=name, generation=1)
+    db.execute(
+        statement.on_conflict_do_update(index_elements=[table.name], set_={"generation": table.generation + 1})
+    )
@@ -0,0 +1,670 @@
+"""Persistent background jobs with priorities, retries and schedules.
+
+Jobs are rows in the ``jobs`` table, so they survive restarts and need no
+broker. Workers claim the highest priority job that is due with a single
+``UPDATE ... RETURNING`` statement. SQLite runs one writer at a time, so
+two workers (threads or processes) can never claim the same row. A failed
+job is requeued with exponential backoff until it reaches
+``max_attempts``. While a job runs, its worker keeps extending a lease. If
+the process dies, the lease expires and the job is queued again.
+Schedules in ``job_schedules`` enqueue jobs from a cron expression or an
+``@every`` interval. Each run is claimed by moving ``next_run_at`` with a
+guarded update, so only one worker enqueues it.
+
+Feature modules register their handlers with :func:`handler` and their
+built-in schedules with :func:`builtin_schedule`. A handler receives a
+:class:`JobContext` and returns a JSON-serializable result. It should
+call :meth:`JobContext.progress` between commits; that call also raises
+:class:`JobCancelledError` once cancellation has been requested.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from importlib import import_module
+from typing import Any, Callable, Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .config import Settings, get_settings
+from .database import SessionLocal
+from .dependencies import get_db
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ("queued", "running")
+_HANDLER_MODULES = ("analytics", "columnar", "exports", "maintenance", "members")
+_BACKOFF_SECONDS = 5
+_MAX_BACKOFF_SECONDS = 3600
+_LEASE_SECONDS = 300
+
+Handler = Callable[["JobContext"], Any]
+CronSource = Union[str, Callable[[Settings], str]]
+
+
+@dataclass(frozen=True)
+class _Registration:
+    run: Handler
+    max_attempts: int
+
+
+@dataclass(frozen=True)
+class _BuiltinSchedule:
+    name: str
+    kind: str
+    cron: CronSource
+    enabled: Callable[[Settings], bool]
+    priority: int
+
+
+_handlers: dict[str, _Registration] = {}
+_builtin: dict[str, _BuiltinSchedule] = {}
+_wakeup = threading.Condition()
+_pool: Optional["WorkerPool"] = None
+
+
+class JobError(RuntimeError):
+    """Base class for job queue errors."""
+
+
+class UnknownJobKindError(JobError):
+    """Raised when no handler is registered for a job kind."""
+
+
+class InvalidScheduleError(JobError):
+    """Raised for cron expressions that cannot be parsed or never fire."""
+
+
+class JobCancelledError(JobError):
+    """Raised inside a handler once cancellation of its job was requested."""
+
+
+def handler(kind: str, *, max_attempts: int = 3) -> Callable[[Handler], Handler]:
+    """Register the decorated function as the handler for *kind* jobs."""
+
+    def register(function: Handler) -> Handler:
+        _handlers[kind] = _Registration(function, max_attempts)
+        return function
+
+    return register
+
+
+def builtin_schedule(
+    name: str,
+    kind: str,
+    cron: CronSource,
+    *,
+    enabled: Callable[[Settings], bool] = lambda settings: True,
+    priority: int = 0,
+) -> None:
+    """Declare a schedule that workers create or reset from configuration at startup."""
+
+    _builtin[name] = _BuiltinSchedule(name, kind, cron, enabled, priority)
+
+
+def load_handlers() -> None:
+    """Import the modules that register job handlers."""
+
+    for name in _HANDLER_MODULES:
+        import_module(f"{__package__}.{name}")
+
+
+def _registration(kind: str) -> _Registration:
+    if kind not in _handlers:
+        load_handlers()
+    try:
+        return _handlers[kind]
+    except KeyError:
+        raise UnknownJobKindError(f"No handler registered for job kind {kind!r}") from None
+
+
+_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+_ALIASES = {"@hourly": "0 * * * *", "@daily": "0 0 * * *", "@weekly": "0 0 * * 0", "@monthly": "0 0 1 * *"}
+_EVERY = re.compile(r"^@every\s+(\d+)\s*([smh])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+
+class CronSchedule:
+    """Five-field cron expression (UTC) or an ``@every 30s|5m|2h`` interval."""
+
+    __slots__ = ("expression", "interval", "minutes", "hours", "days", "months", "weekdays", "_any_day", "_any_weekday")
+
+    def __init__(self, expression: str) -> None:
+        self.expression = expression.strip()
+        self.interval: Optional[timedelta] = None
+        every = _EVERY.match(self.expression)
+        if every:
+            seconds = int(every.group(1)) * _UNITS[every.group(2)]
+            if seconds <= 0:
+                raise InvalidScheduleError(f"Interval must be positive: {expression!r}")
+            self.interval = timedelta(seconds=seconds)
+            return
+        parts = _ALIASES.get(self.expression, self.expression).split()
+        if len(parts) != 5:
+            raise InvalidScheduleError(f"Expected 5 cron fields or @every: {expression!r}")
+        values = [self._parse(part, low, high, name) for part, (name, low, high) in zip(parts, _FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse(part: str, low: int, high: int, name: str) -> set[int]:
+        values: set[int] = set()
+        for item in part.split(","):
+            body, _, step_text = item.partition("/")
+            try:
+                step = int(step_text) if step_text else 1
+                if body == "*":
+                    start, stop = low, high
+                elif "-" in body:
+                    start, stop = (int(bound) for bound in body.split("-", 1))
+                else:
+                    start = int(body)
+                    stop = high if step_text else start
+            except ValueError:
+                raise InvalidScheduleError(f"Invalid cron {name} field: {part!r}") from None
+            if step <= 0 or start < low or stop > high or start > stop:
+                raise InvalidScheduleError(f"Cron {name} field out of range: {part!r}")
+            values.update(range(start, stop + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_days = moment.day in self.days
+        in_weekdays = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return in_weekdays
+        if self._any_weekday:
+            return in_days
+        return in_days or in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First firing time strictly after *moment*."""
+
+        if self.interval is not None:
+            return moment + self.interval
+        current = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = current + timedelta(days=366 * 5)
+        while current < limit:
+            if current.month not in self.months:
+                year, month = divmod(current.month, 12)
+                current = current.replace(year=current.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(current):
+                current = current.replace(hour=0, minute=0) + timedelta(days=1)
+            elif current.hour not in self.hours:
+                current = current.replace(minute=0) + timedelta(hours=1)
+            elif current.minute not in self.minutes:
+                current += timedelta(minutes=1)
+            else:
+                return current
+        raise InvalidScheduleError(f"Cron expression never fires: {self.expression!r}")
+
+
+def _notify() -> None:
+    with _wakeup:
+        _wakeup.notify()
+
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: Optional[dict[str, Any]] = None,
+    *,
+    priority: int = 0,
+    run_at: Optional[datetime] = None,
+    max_attempts: Optional[int] = None,
+) -> models.Job:
+    """Queue a job; it runs as soon as a worker is free and *run_at* has passed."""
+
+    registration = _registration(kind)
+    job = models.Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        priority=priority,
+        run_at=run_at or datetime.utcnow(),
+        max_attempts=max_attempts or registration.max_attempts,
+        status="queued",
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _notify()
+    return job
+
+
+def cancel_job(db: Session, job_id: int) -> Optional[models.Job]:
+    """Cancel a queued job or ask a running one to stop at its next progress report."""
+
+    job = models.Job
+    now = datetime.utcnow()
+    db.execute(
+        update(job).where(job.id == job_id, job.status == "queued").values(status="cancelled", finished_at=now)
+    )
+    db.execute(update(job).where(job.id == job_id, job.status == "running").values(cancel_requested=True))
+    db.commit()
+    found = db.get(job, job_id)
+    if found is not None:
+        db.refresh(found)
+    return found
+
+
+def list_jobs(
+    db: Session,
+    *,
+    status_filter: Optional[str] = None,
+    kind: Optional[str] = None,
+    before: Optional[int] = None,
+    limit: int = 50,
+) -> list[models.Job]:
+    job = models.Job
+    statement = select(job)
+    if status_filter is not None:
+        statement = statement.where(job.status == status_filter)
+    if kind is not None:
+        statement = statement.where(job.kind == kind)
+    if before is not None:
+        statement = statement.where(job.id < before)
+    return list(db.scalars(statement.order_by(job.id.desc()).limit(limit)))
+
+
+def ensure_schedule(
+    db: Session,
+    name: str,
+    kind: str,
+    cron: str,
+    *,
+    payload: Optional[dict[str, Any]] = None,
+    priority: int = 0,
+    enabled: bool = True,
+) -> models.JobSchedule:
+    """Create or update a schedule; ``next_run_at`` is recomputed when *cron* changes."""
+
+    _registration(kind)
+    schedule, now = models.JobSchedule, datetime.utcnow()
+    next_run = CronSchedule(cron).next_after(now)
+    values = {"kind": kind, "payload": json.dumps(payload or {}), "priority": priority, "enabled": enabled}
+    db.execute(insert(schedule).values(name=name, cron=cron, next_run_at=next_run, **values).on_conflict_do_nothing())
+    db.execute(
+        update(schedule)
+        .where(schedule.name == name, schedule.cron != cron)
+        .values(cron=cron, next_run_at=next_run, updated_at=now)
+    )
+    db.execute(update(schedule).where(schedule.name == name).values(updated_at=now, **values))
+    db.commit()
+    found = db.get(schedule, name)
+    db.refresh(found)
+    return found
+
+
+def install_builtin_schedules(db: Session, settings: Optional[Settings] = None) -> None:
+    load_handlers()
+    settings = settings or get_settings()
+    for spec in _builtin.values():
+        cron = spec.cron(settings) if callable(spec.cron) else spec.cron
+        ensure_schedule(db, spec.name, spec.kind, cron, priority=spec.priority, enabled=spec.enabled(settings))
+
+
+def enqueue_due(db: Session, now: Optional[datetime] = None) -> int:
+    """Enqueue one job for every enabled schedule that is due; returns how many."""
+
+    schedule, job = models.JobSchedule, models.Job
+    now = now or datetime.utcnow()
+    queued = 0
+    due = db.execute(
+        select(schedule.name, schedule.kind, schedule.payload, schedule.cron, schedule.priority, schedule.next_run_at)
+        .where(schedule.enabled.is_(True), schedule.next_run_at <= now)
+    ).all()
+    for row in due:
+        try:
+            next_run = CronSchedule(row.cron).next_after(now)
+            registration = _registration(row.kind)
+        except JobError:
+            logger.exception("Disabling schedule %s", row.name)
+            db.execute(update(schedule).where(schedule.name == row.name).values(enabled=False))
+            continue
+        claimed = db.execute(
+            update(schedule)
+            .where(schedule.name == row.name, schedule.next_run_at == row.next_run_at)
+            .values(next_run_at=next_run, last_run_at=now)
+        ).rowcount
+        if not claimed:
+            continue
+        # Skip this run while the previous one is still pending so a slow
+        # job does not pile up copies of itself.
+        pending = db.scalar(
+            select(job.id).where(job.schedule_name == row.name, job.status.in_(ACTIVE)).limit(1)
+        )
+        if pending is None:
+            db.add(
+                models.Job(
+                    kind=row.kind,
+                    payload=row.payload,
+                    priority=row.priority,
+                    run_at=now,
+                    max_attempts=registration.max_attempts,
+                    schedule_name=row.name,
+                    status="queued",
+                )
+            )
+            queued += 1
+    db.commit()
+    return queued
+
+
+def requeue_expired(db: Session, now: Optional[datetime] = None) -> int:
+    """Put running jobs whose worker stopped renewing the lease back in the queue."""
+
+    job = models.Job
+    count = db.execute(
+        update(job)
+        .where(job.status == "running", job.lease_until < (now or datetime.utcnow()))
+        .values(status="queued", locked_by=None, lease_until=None)
+    ).rowcount
+    db.commit()
+    return count
+
+
+@dataclass
+class JobContext:
+    """What a handler knows about the job it is running."""
+
+    job_id: int
+    kind: str
+    payload: dict[str, Any]
+    attempt: int
+    worker_id: str
+
+    def progress(self, fraction: float, message: Optional[str] = None) -> None:
+        """Record progress (0..1) and stop the job if cancellation was requested.
+
+        Uses its own connection, so call it between the handler's commits.
+        """
+
+        job = models.Job
+        with SessionLocal() as session:
+            cancel = session.execute(
+                update(job)
+                .where(job.id == self.job_id, job.locked_by == self.worker_id)
+                .values(
+                    progress=min(max(fraction, 0.0), 1.0),
+                    progress_message=message[:255] if message else None,
+                    lease_until=datetime.utcnow() + timedelta(seconds=_LEASE_SECONDS),
+                )
+                .returning(job.cancel_requested)
+            ).scalar()
+            session.commit()
+        if cancel:
+            raise JobCancelledError(f"Job {self.job_id} was cancelled")
+
+
+def _claim(db: Session, worker_id: str) -> Optional[Any]:
+    job, now = models.Job, datetime.utcnow()
+    candidate = (
+        select(job.id)
+        .where(job.status == "queued", job.run_at <= now)
+        .order_by(job.priority.desc(), job.run_at, job.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    row = db.execute(
+        update(job)
+        .where(job.id == candidate, job.status == "queued")
+        .values(
+            status="running",
+            attempts=job.attempts + 1,
+            locked_by=worker_id,
+            lease_until=now + timedelta(seconds=_LEASE_SECONDS),
+            started_at=now,
+            cancel_requested=False,
+            progress=0.0,
+        )
+        .returning(job.id, job.kind, job.payload, job.attempts, job.max_attempts)
+        .execution_options(synchronize_session=False)
+    ).first()
+    db.commit()
+    return row
+
+
+def run_next(worker_id: str) -> bool:
+    """Claim and run one due job; returns ``False`` when the queue is empty."""
+
+    job = models.Job
+    with SessionLocal() as session:
+        claimed = _claim(session, worker_id)
+    if claimed is None:
+        return False
+    context = JobContext(claimed.id, claimed.kind, json.loads(claimed.payload), claimed.attempts, worker_id)
+    values: dict[str, Any]
+    try:
+        result = _registration(claimed.kind).run(context)
+    except JobCancelledError:
+        values = {"status": "cancelled"}
+    except Exception as exc:
+        logger.exception("Job %s (%s) failed", claimed.id, claimed.kind)
+        values = {"status": "failed", "error": f"{type(exc).__name__}: {exc}"}
+        if claimed.attempts < claimed.max_attempts:
+            delay = min(_BACKOFF_SECONDS * 2 ** (claimed.attempts - 1), _MAX_BACKOFF_SECONDS)
+            values.update(status="queued", run_at=datetime.utcnow() + timedelta(seconds=delay))
+    else:
+        values = {"status": "succeeded", "result": json.dumps(result, default=str), "progress": 1.0, "error": None}
+    if values["status"] != "queued":
+        values["finished_at"] = datetime.utcnow()
+    with SessionLocal() as session:
+        if values["status"] == "queued":
+            cancelled = session.scalar(select(job.cancel_requested).where(job.id == claimed.id))
+            if cancelled:
+                values.update(status="cancelled", finished_at=datetime.utcnow())
+        session.execute(
+            update(job)
+            .where(job.id == claimed.id, job.locked_by == worker_id)
+            .values(locked_by=None, lease_until=None, **values)
+        )
+        session.commit()
+    return True
+
+
+class WorkerPool:
+    """Worker threads plus one thread that enqueues schedules and renews leases."""
+
+    def __init__(self, concurrency: int, *, poll_seconds: float = 1.0) -> None:
+        self.concurrency = concurrency
+        self.poll_seconds = max(poll_seconds, 0.05)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        load_handlers()
+        with SessionLocal() as session:
+            install_builtin_schedules(session)
+        self._stop.clear()
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._work, name=f"ucm-job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._maintain, name="ucm-job-scheduler", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        with _wakeup:
+            _wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads.clear()
+
+    def wait(self) -> None:
+        """Block until :meth:`stop` is called from another thread or a signal handler."""
+
+        while not self._stop.is_set():
+            self._stop.wait(1.0)
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if run_next(self.worker_id):
+                    continue
+            except Exception:  # pragma: no cover - database unavailable; retry after the poll interval
+                logger.exception("Job worker failed to claim a job")
+            with _wakeup:
+                _wakeup.wait(self.poll_seconds)
+
+    def _maintain(self) -> None:
+        job = models.Job
+        renew_every = _LEASE_SECONDS / 3
+        last_renewal = datetime.min
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                with SessionLocal() as session:
+                    if enqueue_due(session):
+                        with _wakeup:
+                            _wakeup.notify_all()
+                    now = datetime.utcnow()
+                    if (now - last_renewal).total_seconds() >= renew_every:
+                        session.execute(
+                            update(job)
+                            .where(job.status == "running", job.locked_by == self.worker_id)
+                            .values(lease_until=now + timedelta(seconds=_LEASE_SECONDS))
+                        )
+                        session.commit()
+                        requeue_expired(session, now)
+                        last_renewal = now
+            except Exception:  # pragma: no cover - keep scheduling on the next tick
+                logger.exception("Job scheduler tick failed")
+
+
+def start_workers(concurrency: Optional[int] = None) -> None:
+    """Start the in-process pool (``job_workers`` threads; ``0`` leaves jobs to ``ucm-color-admin worker``)."""
+
+    global _pool
+    settings = get_settings()
+    concurrency = settings.job_workers if concurrency is None else concurrency
+    if concurrency <= 0 or _pool is not None:
+        return
+    _pool = WorkerPool(concurrency, poll_seconds=settings.job_poll_seconds)
+    _pool.start()
+
+
+def stop_workers() -> None:
+    global _pool
+    if _pool is None:
+        return
+    _pool.stop()
+    _pool = None
+
+
+def _get_or_404(db: Session, job_id: int) -> models.Job:
+    job = db.get(models.Job, job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.get("/schedules", response_model=list[schemas.JobScheduleRead])
+def list_schedules(db: Session = Depends(get_db)):
+    return list(db.scalars(select(models.JobSchedule).order_by(models.JobSchedule.name)))
+
+
+@router.put("/schedules/{name}", response_model=schemas.JobScheduleRead)
+def put_schedule(name: str, payload: schemas.JobScheduleUpdate, db: Session = Depends(get_db)):
+    try:
+        return ensure_schedule(
+            db,
+            name,
+            payload.kind,
+            payload.cron,
+            payload=payload.payload,
+            priority=payload.priority,
+            enabled=payload.enabled,
+        )
+    except JobError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)) from exc
+
+
+@router.delete("/schedules/{name}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_schedule(name: str, db: Session = Depends(get_db)) -> None:
+    schedule = db.get(models.JobSchedule, name)
+    if not schedule:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Schedule not found")
+    db.delete(schedule)
+    db.commit()
+
+
+@router.get("", response_model=list[schemas.JobRead])
+def list_jobs_endpoint(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    kind: Optional[str] = None,
+    before: Optional[int] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+):
+    return list_jobs(db, status_filter=status_filter, kind=kind, before=before, limit=min(max(limit, 1), 500))
+
+
+@router.post("", response_model=schemas.JobRead, status_code=status.HTTP_202_ACCEPTED)
+def create_job(payload: schemas.JobCreate, db: Session = Depends(get_db)):
+    try:
+        return enqueue(
+            db,
+            payload.kind,
+            payload.payload,
+            priority=payload.priority,
+            run_at=payload.run_at,
+            max_attempts=payload.max_attempts,
+        )
+    except UnknownJobKindError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)) from exc
+
+
+@router.get("/{job_id}", response_model=schemas.JobRead)
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    return _get_or_404(db, job_id)
+
+
+@router.post("/{job_id}/cancel", response_model=schemas.JobRead)
+def cancel_job_endpoint(job_id: int, db: Session = Depends(get_db)):
+    job = cancel_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    if job.status not in ACTIVE and job.status != "cancelled":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job already {job.status}")
+    return job
+
+
+__all__ = [
+    "CronSchedule",
+    "InvalidScheduleError",
+    "JobCancelledError",
+    "JobContext",
+    "JobError",
+    "UnknownJobKindError",
+    "WorkerPool",
+    "builtin_schedule",
+    "cancel_job",
+    "enqueue",
+    "enqueue_due",
+    "ensure_schedule",
+    "handler",
+    "list_jobs",
+    "load_handlers",
+    "requeue_expired",
+    "router",
+    "run_next",
+    "start_workers",
+    "stop_workers",
+]
@@ -0,0 +1,338 @@
+"""Reproducible load test for the HTTP API and console.
+
+:func:`run_benchmark` creates a throwaway data directory, seeds it with
+synthetic users and installer files, starts ``create_app`` under Uvicorn
+in a child process (so the database location never leaks into the
+caller's settings), then drives a fixed, seeded mix of requests from
+concurrent keep-alive connections:
+
+``login`` (``POST /web/login``), ``users.list``, ``users.get``,
+``downloads.list``, ``downloads.get`` and the ``web.dashboard``,
+``web.catalog`` and ``web.forms`` pages.
+
+The report gives throughput and p50/p95/p99 latency per scenario and
+overall. :func:`compare` checks a report against a saved baseline and
+lists every scenario whose p95 grew, or whose throughput fell, by more
+than the tolerance; scenarios with too few samples in the baseline only
+count towards the overall figures.
+"""
+
+from __future__ import annotations
+
+import http.client
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlencode
+
+__all__ = [
+    "BenchmarkConfig",
+    "SCENARIOS",
+    "compare",
+    "run_benchmark",
+    "seed",
+]
+
+ADMIN_USERNAME = "bench-admin"
+ADMIN_PASSWORD = "bench-password"
+_COOKIE = "ucm_color_admin_user"
+#: Scenarios with fewer baseline samples are too noisy to compare on their own.
+_MIN_COMPARED_SAMPLES = 50
+
+#: Scenario name and relative weight in the request mix.
+SCENARIOS: dict[str, int] = {
+    "login": 1,
+    "users.list": 20,
+    "users.get": 30,
+    "downloads.list": 10,
+    "downloads.get": 10,
+    "web.dashboard": 10,
+    "web.catalog": 10,
+    "web.forms": 9,
+}
+
+
+@dataclass
+class BenchmarkConfig:
+    users: int = 1000
+    installers: int = 5
+    installer_bytes: int = 256 * 1024
+    concurrency: int = 8
+    duration: float = 10.0
+    warmup: float = 2.0
+    seed: int = 1
+    server_workers: int = 1
+    extra_env: dict[str, str] = field(default_factory=dict)
+
+
+def seed(users: int, installers: int, installer_bytes: int, random_seed: int) -> None:
+    """Populate the database and installer directory named by the environment."""
+
+    from . import models, security
+    from .config import get_settings
+    from .database import SessionLocal, init_database
+
+    settings = get_settings()
+    settings.ensure_storage()
+    init_database()
+    rng = random.Random(random_seed)
+    # One PBKDF2 hash shared by the synthetic users keeps seeding fast.
+    hashed = security.hash_password(ADMIN_PASSWORD)
+    with SessionLocal() as db:
+        db.add(models.User(username=ADMIN_USERNAME, hashed_password=hashed, is_superuser=True))
+        db.add_all(
+            models.User(
+                username=f"user{index:06d}",
+                full_name=f"Synthetic User {index}",
+                email=f"user{index:06d}@example.com",
+                hashed_password=hashed,
+                is_active=rng.random() > 0.05,
+            )
+            for index in range(users)
+        )
+        db.commit()
+    for index in range(installers):
+        (settings.installer_dir / f"ucm-color-admin-{index}.zip").write_bytes(rng.randbytes(installer_bytes))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(env: dict[str, str], port: int, workers: int) -> subprocess.Popen:
+    command = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "ucm_color_admin.app:create_app",
+        "--factory",
+        "--host",
+        "127.0.0.1",
+        "--port",
+        str(port),
+        "--log-level",
+        "warning",
+        "--no-access-log",
+    ]
+    if workers > 1:
+        command += ["--workers", str(workers)]
+    server = subprocess.Popen(command, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Benchmark server exited with code {server.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                connection.close()
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Benchmark server did not become healthy within 30 seconds")
+
+
+class _Client:
+    """One keep-alive connection issuing requests for a single simulated client."""
+
+    def __init__(self, port: int, rng: random.Random, users: int, installers: list[str]) -> None:
+        self.port = port
+        self.rng = rng
+        self.users = users
+        self.installers = installers
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        self.cookie = self._login()
+
+    def _login(self) -> str:
+        """Sign in through the console once and return the signed session cookie."""
+
+        body = urlencode({"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD}).encode()
+        self.connection.request(
+            "POST", "/web/login", body=body, headers={"Content-Type": "application/x-www-form-urlencoded"}
+        )
+        response = self.connection.getresponse()
+        response.read()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            if header.startswith(f"{_COOKIE}="):
+                return header.split(";", 1)[0]
+        raise RuntimeError(f"Benchmark login failed with status {response.status}")
+
+    def _send(self, method: str, path: str, body: Optional[bytes] = None, headers: Optional[dict] = None) -> int:
+        headers = {"Cookie": self.cookie, **(headers or {})}
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            return 0
+        return response.status
+
+    def run(self, scenario: str) -> bool:
+        if scenario == "login":
+            body = urlencode({"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD}).encode()
+            status = self._send(
+                "POST", "/web/login", body, {"Content-Type": "application/x-www-form-urlencoded"}
+            )
+            return status == 303
+        if scenario == "users.list":
+            return self._send("GET", f"/users?skip={self.rng.randrange(max(self.users - 50, 1))}&limit=50") == 200
+        if scenario == "users.get":
+            return self._send("GET", f"/users/{self.rng.randint(2, self.users + 1)}") == 200
+        if scenario == "downloads.list":
+            return self._send("GET", "/downloads") == 200
+        if scenario == "downloads.get":
+            return not self.installers or self._send("GET", f"/downloads/{self.rng.choice(self.installers)}") == 200
+        page = {"web.dashboard": "/web/dashboard", "web.catalog": "/web/catalog", "web.forms": "/web/forms"}[scenario]
+        return self._send("GET", page) == 200
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def _summary(samples: list[float], errors: int, elapsed: float) -> dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+    }
+
+
+def _drive(port: int, config: BenchmarkConfig, installers: list[str]) -> dict[str, object]:
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[name] for name in names]
+    samples: dict[str, list[float]] = {name: [] for name in names}
+    errors: dict[str, int] = dict.fromkeys(names, 0)
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from = start + config.warmup
+    stop_at = measure_from + config.duration
+
+    def worker(index: int) -> None:
+        rng = random.Random(config.seed * 1000 + index)
+        client = _Client(port, rng, config.users, installers)
+        local: dict[str, list[float]] = {name: [] for name in names}
+        local_errors = dict.fromkeys(names, 0)
+        while True:
+            scenario = rng.choices(names, weights)[0]
+            began = time.perf_counter()
+            if began >= stop_at:
+                break
+            ok = client.run(scenario)
+            if began >= measure_from:
+                local[scenario].append(time.perf_counter() - began)
+                if not ok:
+                    local_errors[scenario] += 1
+        client.connection.close()
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(config.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = config.duration
+    everything = [value for values in samples.values() for value in values]
+    return {
+        "overall": _summary(everything, sum(errors.values()), elapsed),
+        "scenarios": {name: _summary(samples[name], errors[name], elapsed) for name in names},
+    }
+
+
+def run_benchmark(config: BenchmarkConfig) -> dict[str, object]:
+    """Seed a temporary deployment, load it and return the report."""
+
+    with tempfile.TemporaryDirectory(prefix="ucm-color-bench-") as temporary:
+        results = _run_in(Path(temporary), config)
+    return {
+        "config": {
+            "users": config.users,
+            "installers": config.installers,
+            "concurrency": config.concurrency,
+            "duration_s": config.duration,
+            "server_workers": config.server_workers,
+            "seed": config.seed,
+        },
+        "python": sys.version.split()[0],
+        **results,
+    }
+
+
+def _run_in(workdir: Path, config: BenchmarkConfig) -> dict[str, object]:
+    env = {
+        **os.environ,
+        "UCM_COLOR_DB": str(workdir / "bench.sqlite3"),
+        "UCM_COLOR_DATA_DIR": str(workdir / "data"),
+        "UCM_COLOR_INSTALLER_DIR": str(workdir / "installers"),
+        # Keep background work out of the measurements.
+        "UCM_COLOR_JOB_WORKERS": "0",
+        **config.extra_env,
+    }
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from ucm_color_admin.loadtest import seed; "
+            "seed(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]))",
+            str(config.users),
+            str(config.installers),
+            str(config.installer_bytes),
+            str(config.seed),
+        ],
+        env=env,
+        check=True,
+    )
+    installers = sorted(path.name for path in (workdir / "installers").glob("*.zip"))
+    port = _free_port()
+    server = _start_server(env, port, config.server_workers)
+    try:
+        return _drive(port, config, installers)
+    finally:
+        # The server must be gone before the directory holding its database is removed.
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return a description of every regression of ``report`` against ``baseline``."""
+
+    regressions = []
+    sections = {"overall": (report["overall"], baseline["overall"])}
+    for name, stats in baseline.get("scenarios", {}).items():
+        if name in report["scenarios"] and stats["requests"] >= _MIN_COMPARED_SAMPLES:
+            sections[name] = (report["scenarios"][name], stats)
+    for name, (current, previous) in sections.items():
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms > baseline {previous['p95_ms']}ms")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {current['throughput_rps']} req/s < baseline {previous['throughput_rps']} req/s"
+            )
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors (baseline {previous['errors']})")
+    return regressions
@@ -0,0 +1,297 @@
+"""Points/loyalty rule engine.
+
+Admin defined rules are compiled into a :class:`CompiledRules` plan once
+and cached for the process. The plan resolves each ``(store, category,
+tier)`` combination to a single precomputed points factor the first time
+it is seen, so scoring an order line is one dictionary lookup and one
+multiplication instead of re-evaluating every rule. A store, category or
+tier that no rule names scores like an unscoped line, so the memo only
+ever holds combinations of values taken from the rules, however many
+distinct values clients send. Editing a rule bumps
+the ``loyalty`` generation in the database (see :mod:`generations`); the
+process that made the change recompiles on its next request and the other
+workers within ``generations.RECHECK_SECONDS``.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Iterable, Optional, Sequence
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import generations, models, rbac, schemas
+from .dependencies import get_db
+
+router = APIRouter(prefix="/loyalty", tags=["loyalty"])
+
+_CACHE_NAME = "loyalty"
+
+_can_manage = Depends(rbac.require_permission("loyalty:manage"))
+
+_lock = threading.Lock()
+_compiled: Optional["CompiledRules"] = None
+_checked_at = 0.0
+
+#: A scoring input: ``(store_id, category, amount_cents, member_tier)``.
+LineTuple = tuple[Optional[str], Optional[str], int, Optional[str]]
+
+
+@dataclass(frozen=True, slots=True)
+class _EarnTerm:
+    factor: float
+    min_amount_cents: int
+
+
+@dataclass(frozen=True, slots=True)
+class _RedeemTerm:
+    cents_per_point: float
+    max_redeem_ratio: float
+
+
+_NO_EARN = _EarnTerm(0.0, 0)
+
+
+class CompiledRules:
+    """Evaluation plan built from a snapshot of the active rules."""
+
+    __slots__ = (
+        "generation",
+        "_earn",
+        "_stores",
+        "_categories",
+        "_redeem",
+        "_tier_multiplier",
+        "_tier_discount",
+        "_thresholds",
+        "_tier_names",
+        "_resolved",
+    )
+
+    def __init__(self, rules: Iterable[models.LoyaltyRule], generation: int = 0) -> None:
+        self.generation = generation
+        earn: dict[tuple[Optional[str], Optional[str]], models.LoyaltyRule] = {}
+        redeem: dict[Optional[str], models.LoyaltyRule] = {}
+        tiers: dict[str, models.LoyaltyRule] = {}
+        for rule in rules:
+            if not rule.is_active:
+                continue
+            if rule.kind == "earn":
+                key = (rule.store_id, rule.category)
+                if key not in earn or rule.priority > earn[key].priority:
+                    earn[key] = rule
+            elif rule.kind == "redeem":
+                if rule.store_id not in redeem or rule.priority > redeem[rule.store_id].priority:
+                    redeem[rule.store_id] = rule
+            elif rule.kind == "tier" and rule.tier:
+                if rule.tier not in tiers or rule.priority > tiers[rule.tier].priority:
+                    tiers[rule.tier] = rule
+
+        self._earn = {key: (rule.points_per_yuan * rule.multiplier / 100.0, rule.min_amount_cents) for key, rule in earn.items()}
+        self._stores = {store_id for store_id, _ in earn}
+        self._categories = {category for _, category in earn}
+        self._redeem = {key: _RedeemTerm(rule.cents_per_point, rule.max_redeem_ratio) for key, rule in redeem.items()}
+        self._tier_multiplier = {name: rule.multiplier for name, rule in tiers.items()}
+        self._tier_discount = {name: rule.discount_percent for name, rule in tiers.items()}
+        ordered = sorted(tiers.values(), key=lambda rule: rule.threshold_points)
+        self._thresholds = [rule.threshold_points for rule in ordered]
+        self._tier_names = [rule.tier for rule in ordered]
+        self._resolved: dict[tuple[Optional[str], Optional[str], Optional[str]], _EarnTerm] = {}
+
+    def _resolve(self, store_id: Optional[str], category: Optional[str], tier: Optional[str]) -> _EarnTerm:
+        # Values no rule mentions match exactly what ``None`` matches; memoize under that key only.
+        if store_id not in self._stores:
+            store_id = None
+        if category not in self._categories:
+            category = None
+        if tier not in self._tier_multiplier:
+            tier = None
+        key = (store_id, category, tier)
+        term = self._resolved.get(key)
+        if term is not None:
+            return term
+        earn = self._earn
+        match = (
+            earn.get((store_id, category))
+            or earn.get((store_id, None))
+            or earn.get((None, category))
+            or earn.get((None, None))
+        )
+        if match is None:
+            term = _NO_EARN
+        else:
+            term = _EarnTerm(match[0] * self._tier_multiplier.get(tier, 1.0), match[1])
+        self._resolved[key] = term
+        return term
+
+    def score_line(self, store_id: Optional[str], category: Optional[str], amount_cents: int, tier: Optional[str] = None) -> int:
+        term = self._resolved.get((store_id, category, tier)) or self._resolve(store_id, category, tier)
+        if amount_cents < term.min_amount_cents:
+            return 0
+        return int(amount_cents * term.factor)
+
+    def score_lines(self, lines: Iterable[LineTuple]) -> list[int]:
+        """Score many lines in one pass; returns the points per line."""
+
+        resolved = self._resolved
+        resolve = self._resolve
+        points: list[int] = []
+        append = points.append
+        for store_id, category, amount_cents, tier in lines:
+            term = resolved.get((store_id, category, tier)) or resolve(store_id, category, tier)
+            append(int(amount_cents * term.factor) if amount_cents >= term.min_amount_cents else 0)
+        return points
+
+    def score_basket(self, basket: schemas.Basket) -> list[int]:
+        store_id, tier = basket.store_id, basket.member_tier
+        return self.score_lines((store_id, line.category, line.amount_cents, tier) for line in basket.lines)
+
+    def tier_for(self, lifetime_points: int) -> Optional[str]:
+        index = bisect_right(self._thresholds, lifetime_points)
+        return self._tier_names[index - 1] if index else None
+
+    def discount_percent(self, tier: Optional[str]) -> float:
+        return self._tier_discount.get(tier, 0.0) if tier else 0.0
+
+    def redeem_quote(self, store_id: Optional[str], points: int, payable_cents: int) -> tuple[int, int]:
+        """Return ``(points_used, value_cents)`` for redeeming up to *points*."""
+
+        term = self._redeem.get(store_id) or self._redeem.get(None)
+        if term is None or term.cents_per_point <= 0:
+            return 0, 0
+        cap_cents = int(payable_cents * term.max_redeem_ratio)
+        points_used = min(points, int(cap_cents / term.cents_per_point))
+        return points_used, int(points_used * term.cents_per_point)
+
+
+def invalidate_rules() -> None:
+    """Discard this process's plan; the next caller recompiles it."""
+
+    global _compiled
+    with _lock:
+        _compiled = None
+
+
+def get_compiled_rules(db: Session) -> CompiledRules:
+    """Return the cached plan, compiling it from the database when the stored generation moved."""
+
+    global _compiled, _checked_at
+    plan = _compiled
+    now = time.monotonic()
+    if plan is not None and now - _checked_at < generations.RECHECK_SECONDS:
+        return plan
+    generation = generations.current(db, _CACHE_NAME)
+    with _lock:
+        if _compiled is None or _compiled.generation != generation:
+            _compiled = CompiledRules(db.scalars(select(models.LoyaltyRule)), generation=generation)
+        _checked_at = now
+        return _compiled
+
+
+def _commit(db: Session) -> None:
+    generations.bump(db, _CACHE_NAME)
+    db.commit()
+    invalidate_rules()
+
+
+def score_orders(plan: CompiledRules, orders: dict[str, schemas.Basket]) -> dict[str, int]:
+    """Score a batch of baskets, e.g. a day's orders, in a single pass."""
+
+    keys: list[str] = []
+    lines: list[LineTuple] = []
+    for key, basket in orders.items():
+        for line in basket.lines:
+            keys.append(key)
+            lines.append((basket.store_id, line.category, line.amount_cents, basket.member_tier))
+    totals = dict.fromkeys(orders, 0)
+    for key, points in zip(keys, plan.score_lines(lines)):
+        totals[key] += points
+    return totals
+
+
+def _apply(rule: models.LoyaltyRule, payload: schemas.LoyaltyRuleCreate) -> None:
+    for name, value in payload.model_dump().items():
+        setattr(rule, name, value)
+
+
+def _get_rule_or_404(db: Session, rule_id: int) -> models.LoyaltyRule:
+    rule = db.get(models.LoyaltyRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rule not found")
+    return rule
+
+
+@router.get("/rules", response_model=list[schemas.LoyaltyRuleRead])
+def list_rules(db: Session = Depends(get_db)) -> Sequence[models.LoyaltyRule]:
+    return list(db.scalars(select(models.LoyaltyRule).order_by(models.LoyaltyRule.kind, models.LoyaltyRule.id)))
+
+
+@router.post(
+    "/rules", response_model=schemas.LoyaltyRuleRead, status_code=status.HTTP_201_CREATED, dependencies=[_can_manage]
+)
+def create_rule(payload: schemas.LoyaltyRuleCreate, db: Session = Depends(get_db)):
+    rule = models.LoyaltyRule()
+    _apply(rule, payload)
+    db.add(rule)
+    _commit(db)
+    db.refresh(rule)
+    return rule
+
+
+@router.put("/rules/{rule_id}", response_model=schemas.LoyaltyRuleRead, dependencies=[_can_manage])
+def update_rule(rule_id: int, payload: schemas.LoyaltyRuleCreate, db: Session = Depends(get_db)):
+    rule = _get_rule_or_404(db, rule_id)
+    _apply(rule, payload)
+    _commit(db)
+    db.refresh(rule)
+    return rule
+
+
+@router.delete("/rules/{rule_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[_can_manage])
+def delete_rule(rule_id: int, db: Session = Depends(get_db)) -> None:
+    db.delete(_get_rule_or_404(db, rule_id))
+    _commit(db)
+
+
+@router.post("/score", response_model=schemas.BasketScore)
+def score_basket(basket: schemas.Basket, db: Session = Depends(get_db)):
+    plan = get_compiled_rules(db)
+    line_points = plan.score_basket(basket)
+    return schemas.BasketScore(
+        points=sum(line_points),
+        line_points=line_points,
+        discount_percent=plan.discount_percent(basket.member_tier),
+    )
+
+
+@router.post("/score-batch", response_model=schemas.OrderBatchScore)
+def score_batch(batch: schemas.OrderBatch, db: Session = Depends(get_db)):
+    totals = score_orders(get_compiled_rules(db), batch.orders)
+    return schemas.OrderBatchScore(total_points=sum(totals.values()), orders=totals)
+
+
+@router.post("/redeem-quote", response_model=schemas.RedeemQuote)
+def redeem_quote(payload: schemas.RedeemQuoteRequest, db: Session = Depends(get_db)):
+    points_used, value_cents = get_compiled_rules(db).redeem_quote(payload.store_id, payload.points, payload.payable_cents)
+    return schemas.RedeemQuote(points_used=points_used, value_cents=value_cents)
+
+
+@router.get("/tiers/resolve")
+def resolve_tier(points: int, db: Session = Depends(get_db)) -> dict[str, object]:
+    plan = get_compiled_rules(db)
+    tier = plan.tier_for(points)
+    return {"tier": tier, "discount_percent": plan.discount_percent(tier)}
+
+
+__all__ = [
+    "CompiledRules",
+    "get_compiled_rules",
+    "invalidate_rules",
+    "router",
+    "score_orders",
+]
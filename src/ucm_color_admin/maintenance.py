@@ -0,0 +1,39 @@
+"""Database housekeeping jobs.
+
+``database.checkpoint`` runs :func:`database.checkpoint_wal` every
+``UCM_COLOR_WAL_CHECKPOINT_SECONDS`` from a job worker, so the WAL is
+copied back into the database off the request path instead of by
+whichever write happens to cross SQLite's auto-checkpoint threshold.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from . import jobs
+from .database import checkpoint_wal
+
+logger = logging.getLogger(__name__)
+
+
+@jobs.handler("database.checkpoint", max_attempts=1)
+def _checkpoint_job(context: jobs.JobContext) -> dict[str, Any]:
+    result = checkpoint_wal()
+    if result["checkpointed_frames"] < result["wal_frames"]:
+        # A read transaction still needs the remaining frames; the next run picks them up.
+        logger.info(
+            "WAL checkpoint stopped at %s of %s frames behind an open reader",
+            result["checkpointed_frames"],
+            result["wal_frames"],
+        )
+    return result
+
+
+jobs.builtin_schedule(
+    "database.checkpoint",
+    "database.checkpoint",
+    lambda settings: f"@every {max(settings.wal_checkpoint_seconds, 1)}s",
+    enabled=lambda settings: settings.wal_checkpoint_seconds > 0,
+    priority=20,
+)
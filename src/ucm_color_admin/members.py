@@ -0,0 +1,555 @@
+"""Member (CRM) profiles, phone lookup and duplicate merging."""
+
+from __future__ import annotations
+
+import json
+import re
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import jobs, models, rbac, schemas
+from .database import SessionLocal
+from .dependencies import get_db, get_read_db
+from .privacy import mask_name, mask_phone, masked_member_columns
+
+router = APIRouter(prefix="/members", tags=["members"])
+
+_NON_DIGITS = re.compile(r"\D+")
+_CN_MOBILE = re.compile(r"1[3-9]\d{9}")
+_UNMASKED = rbac.permission_mask(("exports:unmasked",))
+
+
+class DuplicatePhoneError(RuntimeError):
+    """Raised when a phone number already belongs to another member."""
+
+
+class InvalidPhoneError(ValueError):
+    """Raised when a phone number cannot be normalized."""
+
+
+class MergeUndoConflictError(RuntimeError):
+    """Raised when undoing a merge would restore phone numbers now held by other members."""
+
+    def __init__(self, batch_id: str, conflicts: list[dict[str, object]]) -> None:
+        super().__init__(f"Cannot undo merge batch {batch_id}: {len(conflicts)} phone number(s) now belong to other members")
+        self.batch_id = batch_id
+        self.conflicts = conflicts
+
+
+@dataclass(slots=True)
+class DedupeResult:
+    """Summary of a dedupe run."""
+
+    scanned: int = 0
+    promoted: int = 0
+    merged: int = 0
+    invalid: int = 0
+    batch_ids: list[str] = field(default_factory=list)
+
+
+def normalize_phone(raw: str) -> Optional[str]:
+    """Return the canonical form of *raw* or ``None`` when it is not a valid number.
+
+    Mainland mobile numbers are reduced to their 11 digit form (dropping the
+    ``+86``/``0086`` prefixes); other international numbers keep a leading
+    ``+`` followed by their digits.
+    """
+
+    text = raw.strip()
+    digits = _NON_DIGITS.sub("", text)
+    if digits.startswith("0086"):
+        digits = digits[4:]
+    elif digits.startswith("86") and len(digits) == 13:
+        digits = digits[2:]
+    if _CN_MOBILE.fullmatch(digits):
+        return digits
+    if (text.startswith("+") or text.startswith("00")) and 8 <= len(digits.lstrip("0")) <= 15:
+        return f"+{digits.lstrip('0')}"
+    return None
+
+
+def list_members_masked(db: Session, *, after_id: int = 0, limit: int = 50) -> list[dict]:
+    """Return a page of members with phone numbers and names masked by SQLite."""
+
+    statement = (
+        select(*masked_member_columns(masked=True))
+        .where(models.Member.id > after_id, models.Member.status != "merged")
+        .order_by(models.Member.id)
+        .limit(limit)
+    )
+    return [dict(row) for row in db.execute(statement).mappings()]
+
+
+def member_view(member: models.Member, principal: Optional[rbac.Principal]) -> schemas.MemberRead:
+    """Serialize ``member``, masking its phone number and name unless ``principal`` may see them."""
+
+    view = schemas.MemberRead.model_validate(member)
+    if principal is not None and principal.allows(_UNMASKED):
+        return view
+    return view.model_copy(
+        update={
+            "phone": mask_phone(view.phone),
+            "phone_normalized": mask_phone(view.phone_normalized),
+            "name": mask_name(view.name),
+        }
+    )
+
+
+def get_member(db: Session, member_id: int) -> Optional[models.Member]:
+    return db.get(models.Member, member_id)
+
+
+def get_member_by_phone(db: Session, phone: str) -> Optional[models.Member]:
+    """Look up an active member using a single probe of the phone index."""
+
+    normalized = normalize_phone(phone)
+    if normalized is None:
+        return None
+    statement = select(models.Member).where(models.Member.phone_normalized == normalized)
+    return db.scalars(statement).first()
+
+
+def _resolve_tags(db: Session, names: Iterable[str]) -> list[models.MemberTag]:
+    wanted = sorted({name.strip() for name in names if name and name.strip()})
+    if not wanted:
+        return []
+    existing = {tag.name: tag for tag in db.scalars(select(models.MemberTag).where(models.MemberTag.name.in_(wanted)))}
+    for name in wanted:
+        if name not in existing:
+            tag = models.MemberTag(name=name)
+            db.add(tag)
+            existing[name] = tag
+    return [existing[name] for name in wanted]
+
+
+def create_member(db: Session, payload: schemas.MemberCreate) -> models.Member:
+    normalized = normalize_phone(payload.phone)
+    if normalized is None:
+        raise InvalidPhoneError(f"'{payload.phone}' is not a valid phone number")
+    member = models.Member(
+        phone=payload.phone.strip(),
+        phone_normalized=normalized,
+        name=payload.name,
+        status="active",
+        is_blacklisted=payload.is_blacklisted,
+        blacklist_reason=payload.blacklist_reason,
+    )
+    member.tags = _resolve_tags(db, payload.tags)
+    db.add(member)
+    try:
+        db.commit()
+    except IntegrityError as exc:
+        db.rollback()
+        raise DuplicatePhoneError(f"Phone '{normalized}' already belongs to a member") from exc
+    db.refresh(member)
+    return member
+
+
+def import_members(db: Session, rows: Iterable[schemas.MemberImportRow]) -> int:
+    """Bulk insert raw member rows; the dedupe job normalizes and merges them later."""
+
+    now = datetime.utcnow()
+    values = [
+        {
+            "phone": row.phone.strip(),
+            "name": row.name,
+            "status": "pending",
+            "is_blacklisted": False,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for row in rows
+    ]
+    if values:
+        db.execute(insert(models.Member), values)
+        db.commit()
+    return len(values)
+
+
+def update_member(db: Session, member: models.Member, payload: schemas.MemberUpdate) -> models.Member:
+    if payload.name is not None:
+        member.name = payload.name
+    if payload.tier is not None:
+        member.tier = payload.tier or None
+    if payload.is_blacklisted is not None:
+        member.is_blacklisted = payload.is_blacklisted
+        if not payload.is_blacklisted:
+            member.blacklist_reason = None
+    if payload.blacklist_reason is not None:
+        member.blacklist_reason = payload.blacklist_reason
+    if payload.tags is not None:
+        member.tags = _resolve_tags(db, payload.tags)
+    db.add(member)
+    db.commit()
+    db.refresh(member)
+    return member
+
+
+def _log(db: Session, batch_id: str, action: str, member_id: int, snapshot: dict, survivor_id: Optional[int] = None) -> None:
+    db.add(
+        models.MemberMergeLog(
+            batch_id=batch_id,
+            action=action,
+            member_id=member_id,
+            survivor_id=survivor_id,
+            snapshot=json.dumps(snapshot),
+        )
+    )
+
+
+def _tag_ids(db: Session, member_ids: list[int]) -> dict[int, set[int]]:
+    links = models.member_tag_links.c
+    result: dict[int, set[int]] = {member_id: set() for member_id in member_ids}
+    for member_id, tag_id in db.execute(select(links.member_id, links.tag_id).where(links.member_id.in_(member_ids))):
+        result[member_id].add(tag_id)
+    return result
+
+
+def merge_members(db: Session, survivor_id: int, duplicate_ids: list[int], batch_id: str) -> int:
+    """Fold *duplicate_ids* into *survivor_id*, recording undo entries.
+
+    Tags are unioned onto the survivor and a blacklist flag on any duplicate
+    is carried over. The caller is responsible for committing.
+    """
+
+    member = models.Member
+    duplicate_ids = [member_id for member_id in duplicate_ids if member_id != survivor_id]
+    if not duplicate_ids:
+        return 0
+    rows = db.execute(
+        select(
+            member.id,
+            member.status,
+            member.phone_normalized,
+            member.is_blacklisted,
+            member.blacklist_reason,
+        ).where(member.id.in_([survivor_id, *duplicate_ids]))
+    ).all()
+    state = {row.id: row for row in rows}
+    survivor = state.get(survivor_id)
+    if survivor is None:
+        raise LookupError(f"Member {survivor_id} does not exist")
+    tags = _tag_ids(db, [survivor_id, *duplicate_ids])
+
+    added_tags: set[int] = set()
+    blacklist = (survivor.is_blacklisted, survivor.blacklist_reason)
+    merged = 0
+    for duplicate_id in duplicate_ids:
+        row = state.get(duplicate_id)
+        if row is None or row.status == "merged":
+            continue
+        _log(
+            db,
+            batch_id,
+            "merge",
+            duplicate_id,
+            {"status": row.status, "phone_normalized": row.phone_normalized},
+            survivor_id=survivor_id,
+        )
+        added_tags |= tags[duplicate_id] - tags[survivor_id]
+        if row.is_blacklisted and not blacklist[0]:
+            blacklist = (True, row.blacklist_reason)
+        merged += 1
+
+    if not merged:
+        return 0
+    _log(
+        db,
+        batch_id,
+        "absorb",
+        survivor_id,
+        {
+            "added_tag_ids": sorted(added_tags),
+            "is_blacklisted": survivor.is_blacklisted,
+            "blacklist_reason": survivor.blacklist_reason,
+        },
+    )
+    db.execute(
+        update(member)
+        .where(member.id.in_(duplicate_ids), member.status != "merged")
+        .values(status="merged", phone_normalized=None, merged_into_id=survivor_id, updated_at=datetime.utcnow())
+    )
+    if added_tags:
+        db.execute(
+            insert(models.member_tag_links),
+            [{"member_id": survivor_id, "tag_id": tag_id} for tag_id in sorted(added_tags)],
+        )
+    if blacklist != (survivor.is_blacklisted, survivor.blacklist_reason):
+        db.execute(
+            update(member)
+            .where(member.id == survivor_id)
+            .values(is_blacklisted=blacklist[0], blacklist_reason=blacklist[1], updated_at=datetime.utcnow())
+        )
+    return merged
+
+
+def run_dedupe(
+    db: Session, *, batch_size: int = 1000, on_batch: Optional[Callable[[DedupeResult], None]] = None
+) -> DedupeResult:
+    """Normalize pending members and merge duplicate phone numbers.
+
+    Pending rows are read in primary key order, ``batch_size`` at a time, and
+    grouped by normalized phone in a hash map. Each group is checked against
+    the unique phone index with one ``IN`` query per batch, so the work is
+    linear in the number of rows rather than pairwise. Every batch commits
+    separately under its own ``batch_id`` which can be passed to
+    :func:`undo_merge_batch`. *on_batch* is called after each commit.
+    """
+
+    member = models.Member
+    result = DedupeResult()
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(member.id, member.phone)
+            .where(member.status == "pending", member.id > last_id)
+            .order_by(member.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        result.scanned += len(rows)
+        batch_id = uuid.uuid4().hex
+
+        groups: dict[str, list[int]] = {}
+        invalid: list[int] = []
+        for member_id, phone in rows:
+            key = normalize_phone(phone)
+            if key is None:
+                invalid.append(member_id)
+            else:
+                groups.setdefault(key, []).append(member_id)
+
+        existing = dict(
+            db.execute(
+                select(member.phone_normalized, member.id).where(member.phone_normalized.in_(list(groups)))
+            ).all()
+        )
+        now = datetime.utcnow()
+        for key, member_ids in groups.items():
+            survivor_id = existing.get(key)
+            if survivor_id is None:
+                survivor_id = member_ids.pop(0)
+                _log(db, batch_id, "promote", survivor_id, {"status": "pending", "phone_normalized": None})
+                db.execute(
+                    update(member)
+                    .where(member.id == survivor_id)
+                    .values(status="active", phone_normalized=key, updated_at=now)
+                )
+                result.promoted += 1
+            if member_ids:
+                result.merged += merge_members(db, survivor_id, member_ids, batch_id)
+
+        for member_id in invalid:
+            _log(db, batch_id, "invalidate", member_id, {"status": "pending"})
+        if invalid:
+            db.execute(update(member).where(member.id.in_(invalid)).values(status="invalid", updated_at=now))
+            result.invalid += len(invalid)
+
+        db.commit()
+        result.batch_ids.append(batch_id)
+        if on_batch is not None:
+            on_batch(result)
+    return result
+
+
+def _undo_conflicts(db: Session, entries: list[models.MemberMergeLog]) -> list[dict[str, object]]:
+    """Merge entries whose phone number has since been taken by a member the undo leaves alone."""
+
+    member = models.Member
+    restored: dict[str, models.MemberMergeLog] = {}
+    released: set[int] = set()
+    for entry in entries:
+        snapshot = json.loads(entry.snapshot)
+        if entry.action == "merge" and snapshot["phone_normalized"]:
+            restored[snapshot["phone_normalized"]] = entry
+        elif entry.action == "promote":
+            released.add(entry.member_id)
+    if not restored:
+        return []
+    holders = db.execute(
+        select(member.phone_normalized, member.id).where(member.phone_normalized.in_(list(restored)))
+    ).all()
+    return [
+        {
+            "entry_id": restored[phone].id,
+            "member_id": restored[phone].member_id,
+            "phone_normalized": phone,
+            "held_by": holder_id,
+        }
+        for phone, holder_id in holders
+        if holder_id != restored[phone].member_id and holder_id not in released
+    ]
+
+
+def undo_merge_batch(db: Session, batch_id: str) -> int:
+    """Revert every change recorded for *batch_id* and return the number of entries undone.
+
+    Nothing is changed, and :class:`MergeUndoConflictError` lists the
+    offending entries, when a merged member's phone number now belongs to
+    someone else.
+    """
+
+    member = models.Member
+    entries = list(
+        db.scalars(
+            select(models.MemberMergeLog)
+            .where(models.MemberMergeLog.batch_id == batch_id, models.MemberMergeLog.undone_at.is_(None))
+            .order_by(models.MemberMergeLog.id.desc())
+        )
+    )
+    conflicts = _undo_conflicts(db, entries)
+    if conflicts:
+        raise MergeUndoConflictError(batch_id, conflicts)
+    now = datetime.utcnow()
+    try:
+        for entry in entries:
+            snapshot = json.loads(entry.snapshot)
+            if entry.action == "absorb":
+                if snapshot["added_tag_ids"]:
+                    links = models.member_tag_links.c
+                    db.execute(
+                        delete(models.member_tag_links).where(
+                            links.member_id == entry.member_id, links.tag_id.in_(snapshot["added_tag_ids"])
+                        )
+                    )
+                values = {"is_blacklisted": snapshot["is_blacklisted"], "blacklist_reason": snapshot["blacklist_reason"]}
+            elif entry.action == "merge":
+                values = {"status": snapshot["status"], "phone_normalized": snapshot["phone_normalized"], "merged_into_id": None}
+            else:
+                values = dict(snapshot)
+            db.execute(update(member).where(member.id == entry.member_id).values(updated_at=now, **values))
+            entry.undone_at = now
+        db.commit()
+    except IntegrityError as exc:
+        # A member took one of the phone numbers after the check above.
+        db.rollback()
+        raise MergeUndoConflictError(batch_id, _undo_conflicts(db, entries)) from exc
+    db.expire_all()
+    return len(entries)
+
+
+@jobs.handler("members.dedupe", max_attempts=1)
+def _dedupe_job(context: jobs.JobContext) -> dict:
+    batch_size = int(context.payload.get("batch_size", 1000))
+    with SessionLocal() as session:
+        pending = session.scalar(select(func.count()).select_from(models.Member).where(models.Member.status == "pending"))
+        result = run_dedupe(
+            session,
+            batch_size=batch_size,
+            on_batch=lambda partial: context.progress(partial.scanned / (pending or 1), f"{partial.scanned} scanned"),
+        )
+    return asdict(result)
+
+
+def _get_or_404(db: Session, member_id: int) -> models.Member:
+    member = get_member(db, member_id)
+    if not member:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found")
+    return member
+
+
+@router.get("", response_model=list[schemas.MemberMasked])
+def list_members(after_id: int = 0, limit: int = 50, db: Session = Depends(get_read_db)):
+    return list_members_masked(db, after_id=after_id, limit=min(limit, 500))
+
+
+@router.post("", response_model=schemas.MemberRead, status_code=status.HTTP_201_CREATED)
+def create_member_endpoint(
+    payload: schemas.MemberCreate,
+    principal: rbac.Principal = Depends(rbac.require_permission()),
+    db: Session = Depends(get_db),
+):
+    try:
+        return member_view(create_member(db, payload), principal)
+    except InvalidPhoneError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)) from exc
+    except DuplicatePhoneError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+
+
+@router.post("/import", status_code=status.HTTP_201_CREATED)
+def import_members_endpoint(rows: list[schemas.MemberImportRow], db: Session = Depends(get_db)) -> dict[str, int]:
+    return {"imported": import_members(db, rows)}
+
+
+@router.get("/lookup", response_model=schemas.MemberRead)
+def lookup_member(
+    phone: str, principal: rbac.Principal = Depends(rbac.require_permission()), db: Session = Depends(get_db)
+):
+    member = get_member_by_phone(db, phone)
+    if not member:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found")
+    return member_view(member, principal)
+
+
+@router.post("/dedupe", status_code=status.HTTP_202_ACCEPTED)
+def schedule_dedupe(batch_size: int = 1000, db: Session = Depends(get_db)) -> dict[str, object]:
+    job = jobs.enqueue(db, "members.dedupe", {"batch_size": batch_size})
+    return {"status": "scheduled", "job_id": job.id}
+
+
+@router.post("/merge", response_model=schemas.MemberMergeResult)
+def merge_members_endpoint(payload: schemas.MemberMergeRequest, db: Session = Depends(get_db)):
+    survivor = _get_or_404(db, payload.survivor_id)
+    if survivor.status != "active":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Survivor must be an active member")
+    batch_id = uuid.uuid4().hex
+    merged = merge_members(db, survivor.id, payload.duplicate_ids, batch_id)
+    db.commit()
+    return schemas.MemberMergeResult(batch_id=batch_id, merged=merged)
+
+
+@router.post("/merge-batches/{batch_id}/undo")
+def undo_merge_batch_endpoint(batch_id: str, db: Session = Depends(get_db)) -> dict[str, int]:
+    try:
+        restored = undo_merge_batch(db, batch_id)
+    except MergeUndoConflictError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail={"message": str(exc), "conflicts": exc.conflicts}
+        ) from exc
+    if not restored:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Merge batch not found")
+    return {"restored": restored}
+
+
+@router.get("/{member_id}", response_model=schemas.MemberRead)
+def get_member_endpoint(
+    member_id: int, principal: rbac.Principal = Depends(rbac.require_permission()), db: Session = Depends(get_db)
+):
+    return member_view(_get_or_404(db, member_id), principal)
+
+
+@router.put("/{member_id}", response_model=schemas.MemberRead)
+def update_member_endpoint(
+    member_id: int,
+    payload: schemas.MemberUpdate,
+    principal: rbac.Principal = Depends(rbac.require_permission()),
+    db: Session = Depends(get_db),
+):
+    return member_view(update_member(db, _get_or_404(db, member_id), payload), principal)
+
+
+__all__ = [
+    "DedupeResult",
+    "DuplicatePhoneError",
+    "InvalidPhoneError",
+    "MergeUndoConflictError",
+    "get_member_by_phone",
+    "import_members",
+    "list_members_masked",
+    "member_view",
+    "merge_members",
+    "normalize_phone",
+    "router",
+    "run_dedupe",
+    "undo_merge_batch",
+]
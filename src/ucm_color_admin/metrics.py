@@ -0,0 +1,515 @@
+"""Always-on service metrics in Prometheus text format.
+
+Everything is recorded into fixed-bucket :class:`Histogram` objects whose
+bucket arrays are allocated once, so an observation is a bisect, two
+additions and a lock. :class:`MetricsMiddleware` times each HTTP request
+per route template (not per raw path, so ``/users/1`` and ``/users/2``
+share a series), counts responses by status and tracks requests in
+flight and the peak number of busy threadpool workers. The database
+engine reports SQL statement durations by statement kind and how long
+sessions waited to check a connection out of the pool; :mod:`security`
+reports PBKDF2 time and :mod:`throttle` counts login attempts by
+outcome. ``GET /metrics`` (see :mod:`app`) renders it all for a
+Prometheus scraper. This module does not import FastAPI or anyio at import
+time, so CLI commands that hash passwords or open the database do not pay
+for loading the web stack.
+
+When several server processes share a port (``ucm-color-admin run
+--workers N``) each process only sees its own requests, so every worker
+also writes a snapshot to ``UCM_COLOR_METRICS_DIR`` once a second and
+``GET /metrics`` in any worker merges the snapshots of all of them.
+Counters and histograms of workers that have exited are kept so totals
+never go backwards; their gauges are dropped.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from .config import get_settings
+
+__all__ = [
+    "CONTENT_TYPE",
+    "Histogram",
+    "LOGIN_ATTEMPTS",
+    "LabelCounter",
+    "MetricsMiddleware",
+    "PBKDF2_SECONDS",
+    "TimedQueuePool",
+    "instrument_engine",
+    "render",
+    "start_exporter",
+    "stop_exporter",
+]
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#: Bucket upper bounds in seconds.
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+WAIT_BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+PBKDF2_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0)
+
+_STATEMENT_KINDS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+_EXPORT_SECONDS = 1.0
+#: A worker whose snapshot is older than this has exited; only its counters still count.
+_STALE_SECONDS = 5 * _EXPORT_SECONDS
+
+
+class Histogram:
+    """Cumulative-on-render histogram with preallocated buckets."""
+
+    __slots__ = ("bounds", "counts", "total", "_lock")
+
+    def __init__(self, bounds: Iterable[float]) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+
+    def snapshot(self) -> tuple[list[int], float]:
+        with self._lock:
+            return list(self.counts), self.total
+
+    def reset(self) -> None:
+        # Called in a freshly forked child, where another thread may have held the lock.
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+
+    def render(self, name: str, labels: str, lines: list[str]) -> None:
+        _render_histogram(name, labels, self.bounds, *self.snapshot(), lines)
+
+
+def _render_histogram(
+    name: str, labels: str, bounds: tuple[float, ...], counts: list[int], total: float, lines: list[str]
+) -> None:
+    prefix = f"{labels}," if labels else ""
+    running = 0
+    for bound, count in zip(bounds, counts):
+        running += count
+        lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {running}')
+    running += counts[-1]
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {running}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {total:.6f}")
+    lines.append(f"{name}_count{suffix} {running}")
+
+
+class LabelCounter:
+    """Monotonic counts split by a single label value."""
+
+    __slots__ = ("values", "_lock")
+
+    def __init__(self) -> None:
+        self.values: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label: str, amount: int = 1) -> None:
+        with self._lock:
+            self.values[label] = self.values.get(label, 0) + amount
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.values)
+
+    def reset(self) -> None:
+        self._lock = threading.Lock()
+        self.values = {}
+
+
+class _RouteStats:
+    __slots__ = ("histogram", "statuses")
+
+    def __init__(self) -> None:
+        self.histogram = Histogram(REQUEST_BUCKETS)
+        self.statuses: dict[int, int] = {}
+
+
+class _Registry:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.routes: dict[tuple[str, str], _RouteStats] = {}
+        # Keyed by id(route): routes live as long as the app and APIRoute is unhashable.
+        self.by_route: dict[int, dict[str, _RouteStats]] = {}
+        self.in_flight = 0
+        self.threadpool_peak = 0
+        self.sql: dict[str, Histogram] = {kind: Histogram(SQL_BUCKETS) for kind in (*_STATEMENT_KINDS, "OTHER")}
+        self.pool_wait = Histogram(WAIT_BUCKETS)
+        # Engines rather than pools: Engine.dispose() replaces the pool.
+        self.engines: list[Any] = []
+
+    def route_stats(self, route: Any, method: str) -> _RouteStats:
+        methods = self.by_route.get(id(route))
+        stats = methods.get(method) if methods is not None else None
+        if stats is None:
+            path = getattr(route, "path", None) or "<unmatched>"
+            with self.lock:
+                stats = self.routes.setdefault((method, path), _RouteStats())
+                self.by_route.setdefault(id(route), {})[method] = stats
+        return stats
+
+
+    def reset(self) -> None:
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.by_route = {}
+        self.in_flight = 0
+        self.threadpool_peak = 0
+        for histogram in self.sql.values():
+            histogram.reset()
+        self.pool_wait.reset()
+
+
+_registry = _Registry()
+
+PBKDF2_SECONDS = Histogram(PBKDF2_BUCKETS)
+LOGIN_ATTEMPTS = LabelCounter()
+
+
+def _reset_after_fork() -> None:
+    """A forked child starts counting from zero instead of re-reporting its parent's numbers."""
+
+    _registry.reset()
+    PBKDF2_SECONDS.reset()
+    LOGIN_ATTEMPTS.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _threadpool_limiter() -> Any:
+    from anyio import to_thread
+
+    return to_thread.current_default_thread_limiter()
+
+
+def _threadpool_usage(limiter: Any = None) -> tuple[int, int]:
+    # The limiter belongs to the event loop; threads outside it must pass it in.
+    limiter = limiter or _threadpool_limiter()
+    return limiter.borrowed_tokens, int(limiter.total_tokens)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = _registry
+        registry.in_flight += 1
+        busy, _ = _threadpool_usage()
+        if busy > registry.threadpool_peak:
+            registry.threadpool_peak = busy
+        status_code = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.in_flight -= 1
+            stats = registry.route_stats(scope.get("route"), scope["method"])
+            stats.histogram.observe(elapsed)
+            statuses = stats.statuses
+            statuses[status_code] = statuses.get(status_code, 0) + 1
+
+
+class TimedQueuePool(QueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _registry.pool_wait.observe(time.perf_counter() - started)
+
+
+def _statement_kind(statement: str) -> str:
+    for kind in _STATEMENT_KINDS:
+        if statement.startswith(kind):
+            return kind
+    return "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None:
+        context.ucm_metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = getattr(context, "ucm_metrics_started", None)
+    if started is not None:
+        _registry.sql[_statement_kind(statement)].observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine) -> None:
+    """Record SQL timings and pool usage for ``engine``."""
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    _registry.engines.append(engine)
+
+
+def _pools() -> list[QueuePool]:
+    return [engine.pool for engine in _registry.engines if isinstance(engine.pool, QueuePool)]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**values: Any) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in values.items())
+
+
+def _snapshot(reset_peak: bool, limiter: Any = None) -> dict[str, Any]:
+    """This process's metrics as plain data, the unit that workers exchange."""
+
+    registry = _registry
+    with registry.lock:
+        routes = list(registry.routes.items())
+    busy, total = _threadpool_usage(limiter)
+    peak = max(registry.threadpool_peak, busy)
+    if reset_peak:
+        # The peak covers the interval since the previous scrape or export.
+        registry.threadpool_peak = busy
+    pools = _pools()
+    return {
+        "pid": os.getpid(),
+        "written": time.time(),
+        "routes": [[method, path, *stats.histogram.snapshot(), stats.statuses.copy()] for (method, path), stats in routes],
+        "sql": {kind: histogram.snapshot() for kind, histogram in registry.sql.items()},
+        "pool_wait": registry.pool_wait.snapshot(),
+        "pbkdf2": PBKDF2_SECONDS.snapshot(),
+        "logins": LOGIN_ATTEMPTS.snapshot(),
+        "gauges": {
+            "in_flight": registry.in_flight,
+            "threadpool_busy": busy,
+            "threadpool_peak": peak,
+            "threadpool_size": total,
+            "pool_checked_out": sum(pool.checkedout() for pool in pools),
+            "pool_size": sum(pool.size() for pool in pools),
+        },
+    }
+
+
+def _add_histogram(target: dict[str, list], key: str, source) -> None:
+    counts, total = source
+    entry = target.setdefault(key, [[0] * len(counts), 0.0])
+    entry[0] = [left + right for left, right in zip(entry[0], counts)]
+    entry[1] += total
+
+
+def _merge(snapshots: list[dict[str, Any]], now: float) -> dict[str, Any]:
+    """Sum worker snapshots; the first one is this process's and always live."""
+
+    routes: dict[tuple[str, str], list] = {}
+    histograms: dict[str, list] = {}
+    sql: dict[str, list] = {}
+    logins: dict[str, int] = {}
+    gauges = dict.fromkeys(snapshots[0]["gauges"], 0)
+    live = 0
+    for index, snapshot in enumerate(snapshots):
+        for method, path, counts, total, statuses in snapshot["routes"]:
+            entry = routes.setdefault((method, path), [[0] * len(counts), 0.0, {}])
+            entry[0] = [left + right for left, right in zip(entry[0], counts)]
+            entry[1] += total
+            for code, count in statuses.items():
+                entry[2][int(code)] = entry[2].get(int(code), 0) + count
+        for kind, values in snapshot["sql"].items():
+            _add_histogram(sql, kind, values)
+        _add_histogram(histograms, "pool_wait", snapshot["pool_wait"])
+        _add_histogram(histograms, "pbkdf2", snapshot["pbkdf2"])
+        for outcome, count in snapshot.get("logins", {}).items():
+            logins[outcome] = logins.get(outcome, 0) + count
+        if index == 0 or now - snapshot["written"] < _STALE_SECONDS:
+            live += 1
+            for name, value in snapshot["gauges"].items():
+                gauges[name] += value
+    return {
+        "routes": [[method, path, *values] for (method, path), values in routes.items()],
+        "sql": sql,
+        "pool_wait": histograms["pool_wait"],
+        "pbkdf2": histograms["pbkdf2"],
+        "logins": logins,
+        "gauges": gauges,
+        "workers": live,
+    }
+
+
+def _worker_snapshots(directory: Path) -> list[dict[str, Any]]:
+    own = f"worker-{os.getpid()}.json"
+    snapshots = []
+    for path in directory.glob("worker-*.json"):
+        if path.name == own:
+            continue
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):  # pragma: no cover - removed or half-written
+            continue
+    return snapshots
+
+
+def render() -> str:
+    """Return all metrics in Prometheus text exposition format."""
+
+    snapshot = _snapshot(reset_peak=True)
+    directory = _exporter.directory if _exporter is not None else None
+    snapshot = _merge([snapshot, *(_worker_snapshots(directory) if directory else [])], time.time())
+    gauges = snapshot["gauges"]
+    lines: list[str] = []
+
+    lines.append("# HELP ucm_http_request_duration_seconds Time to serve HTTP requests by route template.")
+    lines.append("# TYPE ucm_http_request_duration_seconds histogram")
+    routes = sorted(snapshot["routes"], key=lambda route: (route[0], route[1]))
+    for method, path, counts, total, _ in routes:
+        _render_histogram(
+            "ucm_http_request_duration_seconds", _labels(method=method, route=path), REQUEST_BUCKETS, counts, total, lines
+        )
+
+    lines.append("# HELP ucm_http_responses_total HTTP responses by route template and status code.")
+    lines.append("# TYPE ucm_http_responses_total counter")
+    for method, path, _, _, statuses in routes:
+        for code, count in sorted(statuses.items()):
+            lines.append(f"ucm_http_responses_total{{{_labels(method=method, route=path, status=code)}}} {count}")
+
+    lines.append("# HELP ucm_http_requests_in_flight HTTP requests currently being served.")
+    lines.append("# TYPE ucm_http_requests_in_flight gauge")
+    lines.append(f"ucm_http_requests_in_flight {gauges['in_flight']}")
+
+    lines.append("# HELP ucm_server_workers Server processes reporting metrics.")
+    lines.append("# TYPE ucm_server_workers gauge")
+    lines.append(f"ucm_server_workers {snapshot['workers']}")
+
+    lines.append("# HELP ucm_threadpool_busy Worker threads running sync endpoints and dependencies.")
+    lines.append("# TYPE ucm_threadpool_busy gauge")
+    lines.append(f"ucm_threadpool_busy {gauges['threadpool_busy']}")
+    lines.append("# HELP ucm_threadpool_busy_peak Most busy worker threads seen at a request start since the last scrape.")
+    lines.append("# TYPE ucm_threadpool_busy_peak gauge")
+    lines.append(f"ucm_threadpool_busy_peak {gauges['threadpool_peak']}")
+    lines.append("# HELP ucm_threadpool_size Worker thread limit.")
+    lines.append("# TYPE ucm_threadpool_size gauge")
+    lines.append(f"ucm_threadpool_size {gauges['threadpool_size']}")
+
+    lines.append("# HELP ucm_db_pool_checked_out Database connections currently checked out.")
+    lines.append("# TYPE ucm_db_pool_checked_out gauge")
+    lines.append(f"ucm_db_pool_checked_out {gauges['pool_checked_out']}")
+    lines.append("# HELP ucm_db_pool_size Database pool size.")
+    lines.append("# TYPE ucm_db_pool_size gauge")
+    lines.append(f"ucm_db_pool_size {gauges['pool_size']}")
+    lines.append("# HELP ucm_db_pool_wait_seconds Time spent waiting to check out a database connection.")
+    lines.append("# TYPE ucm_db_pool_wait_seconds histogram")
+    _render_histogram("ucm_db_pool_wait_seconds", "", WAIT_BUCKETS, *snapshot["pool_wait"], lines)
+
+    lines.append("# HELP ucm_sql_statement_duration_seconds SQL statement execution time by statement kind.")
+    lines.append("# TYPE ucm_sql_statement_duration_seconds histogram")
+    for kind, (counts, total) in snapshot["sql"].items():
+        _render_histogram("ucm_sql_statement_duration_seconds", _labels(kind=kind), SQL_BUCKETS, counts, total, lines)
+
+    lines.append("# HELP ucm_pbkdf2_duration_seconds Time spent hashing or verifying passwords.")
+    lines.append("# TYPE ucm_pbkdf2_duration_seconds histogram")
+    _render_histogram("ucm_pbkdf2_duration_seconds", "", PBKDF2_BUCKETS, *snapshot["pbkdf2"], lines)
+
+    lines.append("# HELP ucm_login_attempts_total Console login attempts by outcome, including throttled ones.")
+    lines.append("# TYPE ucm_login_attempts_total counter")
+    for outcome, count in sorted(snapshot["logins"].items()):
+        lines.append(f"ucm_login_attempts_total{{{_labels(outcome=outcome)}}} {count}")
+
+    lines.append("")
+    return "\n".join(lines)
+
+
+class _Exporter:
+    """Writes this worker's snapshot for its siblings to merge."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.path = directory / f"worker-{os.getpid()}.json"
+        self.limiter = _threadpool_limiter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ucm-color-metrics-export", daemon=True)
+
+    def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.write()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self.write(final=True)
+
+    def write(self, final: bool = False) -> None:
+        snapshot = _snapshot(reset_peak=True, limiter=self.limiter)
+        if final:
+            # Keep the counters of an exiting worker but never its gauges.
+            snapshot["written"] = 0.0
+        temporary = self.path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(snapshot))
+        temporary.replace(self.path)
+
+    def _run(self) -> None:
+        while not self._stop.wait(_EXPORT_SECONDS):
+            try:
+                self.write()
+            except Exception:  # pragma: no cover - data directory unavailable
+                logger.exception("Failed to write metrics snapshot %s", self.path)
+
+
+_exporter: Optional[_Exporter] = None
+
+
+def start_exporter() -> None:
+    """Share this process's metrics when running as one of several workers.
+
+    Must be called from the server's event loop, e.g. the lifespan handler.
+    """
+
+    global _exporter
+    directory = get_settings().metrics_dir
+    if directory is None or _exporter is not None:
+        return
+    _exporter = _Exporter(directory)
+    _exporter.start()
+
+
+def stop_exporter() -> None:
+    global _exporter
+    if _exporter is None:
+        return
+    _exporter.stop()
+    _exporter = None
+
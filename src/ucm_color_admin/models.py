@@ -2,10 +2,25 @@
 
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 
-from sqlalchemy import Boolean, DateTime, Integer, String
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import (
+    DDL,
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Table,
+    Text,
+    event,
+)
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
 
@@ -24,6 +39,559 @@ class User(Base):
     is_superuser: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    roles: Mapped[list["Role"]] = relationship(secondary="user_roles", order_by="Role.name")
+    api_keys: Mapped[list["ApiKey"]] = relationship(back_populates="user", cascade="all, delete-orphan")
 
     def __repr__(self) -> str:  # pragma: no cover - debugging helper
         return f"<User username={self.username!r} active={self.is_active}>"
+
+
+user_roles = Table(
+    "user_roles",
+    Base.metadata,
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    Column("role_id", Integer, ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_user_roles_role_id", "role_id"),
+)
+
+
+class Role(Base):
+    """Named set of permissions that can be granted to users."""
+
+    __tablename__ = "roles"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    description: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    grants: Mapped[list["RolePermission"]] = relationship(
+        cascade="all, delete-orphan", lazy="selectin", order_by="RolePermission.permission"
+    )
+    users: Mapped[list[User]] = relationship(secondary=user_roles, viewonly=True)
+
+    @property
+    def permissions(self) -> list[str]:
+        return [grant.permission for grant in self.grants]
+
+
+class RolePermission(Base):
+    """One permission name granted by a role; names are defined in :mod:`rbac`."""
+
+    __tablename__ = "role_permissions"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    role_id: Mapped[int] = mapped_column(Integer, ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True)
+    permission: Mapped[str] = mapped_column(String(64), primary_key=True)
+
+
+class LoginThrottleWindow(Base):
+    """Failed-login counters shared by all server processes; see :mod:`throttle`."""
+
+    __tablename__ = "login_throttle"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    scope: Mapped[str] = mapped_column(String(8), primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    window: Mapped[int] = mapped_column(Integer, nullable=False)
+    current: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    previous: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ApiKey(Base):
+    """Credential for machine clients, acting with its owner's permissions.
+
+    Only the public ``prefix`` and a keyed hash of the secret are stored.
+    """
+
+    __tablename__ = "api_keys"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    prefix: Mapped[str] = mapped_column(String(16), unique=True, nullable=False)
+    secret_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    name: Mapped[str] = mapped_column(String(64), nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    revoked_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    user: Mapped[User] = relationship(back_populates="api_keys")
+
+
+class RbacState(Base):
+    """Single row whose generation changes whenever roles or grants change."""
+
+    __tablename__ = "rbac_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    generation: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class CacheGeneration(Base):
+    """Generation of a per-process cache, bumped whenever its source rows change."""
+
+    __tablename__ = "cache_generations"
+
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    generation: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+member_tag_links = Table(
+    "member_tag_links",
+    Base.metadata,
+    Column("member_id", Integer, ForeignKey("members.id", ondelete="CASCADE"), primary_key=True),
+    Column("tag_id", Integer, ForeignKey("member_tags.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_member_tag_links_tag_id", "tag_id"),
+)
+
+
+class MemberTag(Base):
+    """Free-form label attached to member profiles."""
+
+    __tablename__ = "member_tags"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+
+
+class Member(Base):
+    """A CRM member profile keyed by its normalized phone number.
+
+    ``phone_normalized`` carries a unique index so a register lookup is a
+    single index probe. Bulk imported rows start out ``pending`` with no
+    normalized phone until the dedupe job has processed them; merged rows
+    release their normalized phone and point at the surviving profile.
+    """
+
+    __tablename__ = "members"
+    __table_args__ = (Index("ix_members_status_id", "status", "id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    phone: Mapped[str] = mapped_column(String(32), nullable=False)
+    phone_normalized: Mapped[str | None] = mapped_column(String(20), unique=True, nullable=True)
+    name: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="active")
+    is_blacklisted: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    blacklist_reason: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    tier: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    merged_into_id: Mapped[int | None] = mapped_column(
+        Integer, ForeignKey("members.id"), nullable=True, index=True
+    )
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    tags: Mapped[list[MemberTag]] = relationship(secondary=member_tag_links, lazy="selectin", order_by=MemberTag.name)
+
+    def __repr__(self) -> str:  # pragma: no cover - debugging helper
+        return f"<Member phone={self.phone_normalized or self.phone!r} status={self.status}>"
+
+
+class MemberMergeLog(Base):
+    """Undo log entry written for every change applied by a merge batch."""
+
+    __tablename__ = "member_merge_log"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    batch_id: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
+    action: Mapped[str] = mapped_column(String(16), nullable=False)
+    member_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    survivor_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    snapshot: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    undone_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class LoyaltyRule(Base):
+    """Admin defined earn, redeem or tier rule for the points programme.
+
+    ``earn`` rules award ``points_per_yuan`` for matching lines, optionally
+    scoped to a store and/or category. ``tier`` rules define the lifetime
+    points ``threshold_points`` for a tier together with its earn
+    ``multiplier`` and member ``discount_percent``. ``redeem`` rules price a
+    point at ``cents_per_point`` and cap redemption at ``max_redeem_ratio``
+    of the payable amount.
+    """
+
+    __tablename__ = "loyalty_rules"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(64), nullable=False)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False, index=True)
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    store_id: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    category: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    tier: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    min_amount_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    points_per_yuan: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    multiplier: Mapped[float] = mapped_column(Float, nullable=False, default=1.0)
+    threshold_points: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    discount_percent: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    cents_per_point: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    max_redeem_ratio: Mapped[float] = mapped_column(Float, nullable=False, default=1.0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Promotion(Base):
+    """Marketing promotion: spend threshold (满减), percentage discount or coupon.
+
+    ``threshold`` promotions take ``discount_cents`` off once the eligible
+    lines reach ``threshold_cents``; ``percent`` promotions take
+    ``discount_percent`` off the eligible lines. Setting ``coupon_code``
+    makes either kind apply only when the code is presented. Scope columns
+    left empty match everything.
+    """
+
+    __tablename__ = "promotions"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(64), nullable=False)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    stackable: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    store_id: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    category: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    sku: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    tier: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    coupon_code: Mapped[str | None] = mapped_column(String(32), nullable=True, index=True)
+    threshold_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    discount_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    discount_percent: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    starts_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    ends_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ExportJob(Base):
+    """A queued compliance export request and its progress."""
+
+    __tablename__ = "export_jobs"
+    __table_args__ = (Index("ix_export_jobs_status_id", "status", "id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    masked: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    requested_by: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="queued")
+    row_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    file_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class Job(Base):
+    """A unit of background work claimed and run by a job worker."""
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_claim", "status", "priority", "run_at"),
+        Index("ix_jobs_schedule", "schedule_name", "status"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(64), nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="queued")
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=3)
+    run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    schedule_name: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    locked_by: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    lease_until: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    progress: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    progress_message: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    result: Mapped[str | None] = mapped_column(Text, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class JobSchedule(Base):
+    """A cron or fixed interval schedule that enqueues jobs of one kind."""
+
+    __tablename__ = "job_schedules"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    kind: Mapped[str] = mapped_column(String(64), nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    cron: Mapped[str] = mapped_column(String(64), nullable=False)
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    enabled: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    next_run_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    last_run_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class MemberPurchase(Base):
+    """One purchase in a member's history.
+
+    The table is ``WITHOUT ROWID`` with a ``(member_id, purchased_at,
+    order_id)`` primary key, so each member's history is stored contiguously
+    in time order and a page of history is a single range scan. The unique
+    ``(member_id, order_id)`` index makes an order count once per member
+    whatever timestamp a retry carries.
+    """
+
+    __tablename__ = "member_purchases"
+    __table_args__ = (
+        Index("ix_member_purchases_member_order", "member_id", "order_id", unique=True),
+        {"sqlite_with_rowid": False},
+    )
+
+    member_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    purchased_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    order_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    store_id: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    amount_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    item_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class MemberStats(Base):
+    """Lifetime aggregates per member, maintained as purchases are recorded."""
+
+    __tablename__ = "member_stats"
+
+    member_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    lifetime_spend_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    visit_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    item_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    first_purchase_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    last_purchase_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class Store(Base):
+    """Store master data used to group sales by region."""
+
+    __tablename__ = "stores"
+
+    store_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    name: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    region: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Order(Base):
+    """A sales order.
+
+    The composite indexes all end in ``(created_at, id)`` so every filter
+    combination supported by the order search can be answered by walking
+    one index in keyset order.
+    """
+
+    __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_created", "created_at", "id"),
+        Index("ix_orders_store_created", "store_id", "created_at", "id"),
+        Index("ix_orders_store_status_created", "store_id", "status", "created_at", "id"),
+        Index("ix_orders_status_created", "status", "created_at", "id"),
+        Index("ix_orders_channel_created", "channel", "created_at", "id"),
+        Index("ix_orders_member_created", "member_id", "created_at", "id"),
+        Index("ix_orders_closed", "closed_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    order_no: Mapped[str] = mapped_column(String(32), unique=True, nullable=False)
+    store_id: Mapped[str] = mapped_column(String(32), nullable=False)
+    channel: Mapped[str] = mapped_column(String(16), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="CREATED")
+    member_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    payment_method: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    total_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    item_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    closed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+
+    lines: Mapped[list["OrderLine"]] = relationship(
+        back_populates="order", lazy="selectin", cascade="all, delete-orphan", order_by="OrderLine.id"
+    )
+
+
+class OrderLine(Base):
+    """A single SKU line on an order.
+
+    ``unit_price_cents`` and ``cost_cents`` are per unit; ``amount_cents``
+    is the line total.
+    """
+
+    __tablename__ = "order_lines"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    order_id: Mapped[int] = mapped_column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
+    sku: Mapped[str] = mapped_column(String(64), nullable=False)
+    category: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    unit_price_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    amount_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    cost_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    order: Mapped[Order] = relationship(back_populates="lines")
+
+
+class OrderTransition(Base):
+    """Append-only log of order status changes."""
+
+    __tablename__ = "order_transitions"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    order_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    from_status: Mapped[str] = mapped_column(String(16), nullable=False)
+    to_status: Mapped[str] = mapped_column(String(16), nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    actor: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    source: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ReconciliationRollup(Base):
+    """Per day, store, channel and payment method totals of closed orders.
+
+    Maintained incrementally when orders close; ``payment_method`` is an
+    empty string for orders without one so it can be part of the key.
+    """
+
+    __tablename__ = "reconciliation_rollups"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    store_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    channel: Mapped[str] = mapped_column(String(16), primary_key=True)
+    payment_method: Mapped[str] = mapped_column(String(16), primary_key=True, default="")
+    order_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    gross_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    refund_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    net_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class RefundRequest(Base):
+    """A refund or void awaiting review.
+
+    ``idempotency_key`` is unique so a retried request finds the original
+    row, and ``response_json`` keeps the response returned the first time.
+    """
+
+    __tablename__ = "refund_requests"
+    __table_args__ = (Index("ix_refund_requests_status_id", "status", "id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    idempotency_key: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    order_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    kind: Mapped[str] = mapped_column(String(8), nullable=False)
+    amount_cents: Mapped[int] = mapped_column(Integer, nullable=False)
+    reason: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending")
+    requested_by: Mapped[str] = mapped_column(String(64), nullable=False)
+    first_reviewer: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    second_reviewer: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    review_note: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    response_json: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    decided_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class RefundLedgerEntry(Base):
+    """Compensating money movement posted when a refund or void is approved."""
+
+    __tablename__ = "refund_ledger"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    refund_id: Mapped[int] = mapped_column(Integer, unique=True, nullable=False)
+    order_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    kind: Mapped[str] = mapped_column(String(8), nullable=False)
+    amount_cents: Mapped[int] = mapped_column(Integer, nullable=False)
+    store_id: Mapped[str] = mapped_column(String(32), nullable=False)
+    channel: Mapped[str] = mapped_column(String(16), nullable=False)
+    payment_method: Mapped[str] = mapped_column(String(16), nullable=False, default="")
+    member_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class SalesHourly(Base):
+    """Materialized per store, per hour sales aggregates of closed orders."""
+
+    __tablename__ = "mv_sales_hourly"
+    __table_args__ = (Index("ix_mv_sales_hourly_hour", "hour"), {"sqlite_with_rowid": False})
+
+    store_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    hour: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    order_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sales_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    units: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    cost_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ProductDaily(Base):
+    """Materialized per store, per day, per SKU sales of closed orders."""
+
+    __tablename__ = "mv_product_daily"
+    __table_args__ = (Index("ix_mv_product_daily_day", "day"), {"sqlite_with_rowid": False})
+
+    store_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    sku: Mapped[str] = mapped_column(String(64), primary_key=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sales_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    cost_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class SketchBucket(Base):
+    """Serialized Count-Min/heavy-hitter sketch of SKU units for one store and hour."""
+
+    __tablename__ = "mv_sku_sketches"
+    __table_args__ = (Index("ix_mv_sku_sketches_hour", "hour"), {"sqlite_with_rowid": False})
+
+    store_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    hour: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    payload: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
+class ViewWatermark(Base):
+    """Refresh position of a materialized view in ``order_transitions``."""
+
+    __tablename__ = "mv_watermarks"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    last_transition_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    refreshed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class AuditEntry(Base):
+    """One audit event: who did what, to which object, and when.
+
+    The table is append-only; triggers reject updates and deletes.
+    """
+
+    __tablename__ = "audit_log"
+    __table_args__ = (
+        Index("ix_audit_log_actor_time", "actor", "occurred_at"),
+        Index("ix_audit_log_time", "occurred_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    occurred_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    actor: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    action: Mapped[str] = mapped_column(String(64), nullable=False)
+    target_type: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    target_id: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    ip: Mapped[str | None] = mapped_column(String(45), nullable=True)
+    detail: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+
+for _operation in ("UPDATE", "DELETE"):
+    event.listen(
+        AuditEntry.__table__,
+        "after_create",
+        DDL(
+            f"CREATE TRIGGER IF NOT EXISTS audit_log_no_{_operation.lower()} BEFORE {_operation} ON audit_log "
+            "BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END"
+        ),
+    )
@@ -0,0 +1,330 @@
+"""Order status workflow.
+
+Legal status changes are declared once in :data:`ORDER_STATES`. Transitions
+use optimistic concurrency: current ``(status, version)`` pairs are read
+without holding a write lock, then each change is written with ``UPDATE …
+WHERE id = ? AND version = ?``. A racing payment callback or delivery
+update therefore loses cleanly with a conflict instead of overwriting a
+newer status, and nothing blocks other writers while a batch is validated.
+Every applied change is appended to ``order_transitions``.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import models, rbac, schemas
+from .dependencies import get_db
+from .purchases import record_purchase
+from .reconciliation import record_closed_order
+
+router = APIRouter(prefix="/orders", tags=["orders"])
+
+_can_transition = rbac.require_permission("orders:write")
+
+_IN_CHUNK = 500
+_RETRIES = 3
+
+
+@dataclass(slots=True)
+class OrderSnapshot:
+    """The order columns transition hooks need, as of the transition."""
+
+    id: int
+    status: str
+    version: int
+    store_id: str
+    channel: str
+    payment_method: Optional[str]
+    member_id: Optional[int]
+    total_cents: int
+    item_count: int
+    created_at: datetime
+
+
+#: Hook signature: ``hook(db, order, entered_at)``; runs inside the transition's transaction.
+TransitionHook = Callable[[Session, OrderSnapshot, datetime], None]
+
+
+class OrderStateMachine:
+    """Declarative table of legal status changes plus on-enter hooks."""
+
+    def __init__(
+        self,
+        transitions: dict[str, Iterable[str]],
+        *,
+        terminal_timestamp: Optional[str] = None,
+        restricted: Iterable[str] = (),
+    ) -> None:
+        self.transitions = {state: frozenset(targets) for state, targets in transitions.items()}
+        self.terminal_timestamp = terminal_timestamp
+        #: States only reachable through a reviewed workflow, never through the generic transition API.
+        self.restricted = frozenset(restricted)
+        self._hooks: dict[str, list[TransitionHook]] = defaultdict(list)
+
+    @property
+    def states(self) -> frozenset[str]:
+        return frozenset(self.transitions)
+
+    def can(self, from_status: str, to_status: str) -> bool:
+        return to_status in self.transitions.get(from_status, ())
+
+    def on_enter(self, state: str) -> Callable[[TransitionHook], TransitionHook]:
+        def register(hook: TransitionHook) -> TransitionHook:
+            self._hooks[state].append(hook)
+            return hook
+
+        return register
+
+    def hooks_for(self, state: str) -> list[TransitionHook]:
+        return self._hooks.get(state, [])
+
+
+ORDER_STATES = OrderStateMachine(
+    {
+        "CREATED": ("PAID", "VOIDED"),
+        "PAID": ("READY", "VOIDED"),
+        "READY": ("HANDED_OVER", "DELIVERED", "VOIDED"),
+        "HANDED_OVER": ("CLOSED",),
+        "DELIVERED": ("CLOSED",),
+        "CLOSED": ("REFUNDED",),
+        "REFUNDED": (),
+        "VOIDED": (),
+    },
+    terminal_timestamp="CLOSED",
+    restricted=("REFUNDED", "VOIDED"),
+)
+
+
+@dataclass(slots=True)
+class TransitionResult:
+    applied: list[schemas.TransitionOutcome] = field(default_factory=list)
+    conflicts: list[schemas.TransitionOutcome] = field(default_factory=list)
+    rejected: list[schemas.TransitionOutcome] = field(default_factory=list)
+
+
+def load_snapshots(db: Session, order_ids: list[int]) -> dict[int, OrderSnapshot]:
+    """Read the current :class:`OrderSnapshot` of each order in *order_ids*."""
+
+    columns = [getattr(models.Order, name) for name in OrderSnapshot.__slots__]
+    snapshots: dict[int, OrderSnapshot] = {}
+    for start in range(0, len(order_ids), _IN_CHUNK):
+        chunk = order_ids[start:start + _IN_CHUNK]
+        for row in db.execute(select(*columns).where(models.Order.id.in_(chunk))):
+            snapshots[row.id] = OrderSnapshot(*row)
+    return snapshots
+
+
+def stage_transitions(
+    db: Session,
+    items: list[schemas.BulkTransitionItem],
+    *,
+    actor: Optional[str] = None,
+    source: Optional[str] = None,
+    machine: OrderStateMachine = ORDER_STATES,
+    current: Optional[dict[int, OrderSnapshot]] = None,
+    allow_restricted: bool = False,
+) -> TransitionResult:
+    """Write *items* into the open transaction without committing.
+
+    *current* holds snapshots read earlier; orders missing from it are
+    loaded first. Used by workflows that change an order's status together
+    with their own rows, such as refund approval.
+    """
+
+    if current is None:
+        current = load_snapshots(db, sorted({item.order_id for item in items}))
+    result = TransitionResult()
+    now = datetime.utcnow()
+    order = models.Order
+    log: list[dict[str, object]] = []
+    entered: list[tuple[str, OrderSnapshot]] = []
+
+    for item in items:
+        row = current.get(item.order_id)
+        if row is None:
+            result.rejected.append(schemas.TransitionOutcome(order_id=item.order_id, reason="not_found"))
+            continue
+        if item.expected_version is not None and item.expected_version != row.version:
+            result.conflicts.append(
+                schemas.TransitionOutcome(order_id=row.id, status=row.status, version=row.version, reason="version_mismatch")
+            )
+            continue
+        if not machine.can(row.status, item.to_status):
+            result.rejected.append(
+                schemas.TransitionOutcome(
+                    order_id=row.id,
+                    status=row.status,
+                    version=row.version,
+                    reason=f"illegal_transition:{row.status}->{item.to_status}",
+                )
+            )
+            continue
+        if item.to_status in machine.restricted and not allow_restricted:
+            result.rejected.append(
+                schemas.TransitionOutcome(
+                    order_id=row.id, status=row.status, version=row.version, reason=f"restricted:{item.to_status}"
+                )
+            )
+            continue
+
+        values: dict[str, object] = {"status": item.to_status, "version": row.version + 1, "updated_at": now}
+        if item.to_status == machine.terminal_timestamp:
+            values["closed_at"] = now
+        changed = db.execute(
+            update(order).where(order.id == row.id, order.version == row.version).values(**values)
+        ).rowcount
+        if not changed:
+            result.conflicts.append(schemas.TransitionOutcome(order_id=row.id, reason="concurrent_update"))
+            continue
+
+        new_row = replace(row, status=item.to_status, version=row.version + 1)
+        current[row.id] = new_row
+        log.append(
+            {
+                "order_id": row.id,
+                "from_status": row.status,
+                "to_status": item.to_status,
+                "version": new_row.version,
+                "actor": actor,
+                "source": source,
+                "created_at": now,
+            }
+        )
+        entered.append((item.to_status, new_row))
+        result.applied.append(schemas.TransitionOutcome(order_id=row.id, status=item.to_status, version=new_row.version))
+
+    if log:
+        db.execute(insert(models.OrderTransition), log)
+    for state, row in entered:
+        for hook in machine.hooks_for(state):
+            hook(db, row, now)
+    return result
+
+
+def _apply_once(
+    db: Session,
+    items: list[schemas.BulkTransitionItem],
+    *,
+    actor: Optional[str],
+    source: Optional[str],
+    machine: OrderStateMachine,
+) -> TransitionResult:
+    current = load_snapshots(db, sorted({item.order_id for item in items}))
+    # End the read transaction so the write phase starts with a fresh snapshot.
+    db.rollback()
+    result = stage_transitions(db, items, actor=actor, source=source, machine=machine, current=current)
+    db.commit()
+    return result
+
+
+def apply_transitions(
+    db: Session,
+    items: list[schemas.BulkTransitionItem],
+    *,
+    actor: Optional[str] = None,
+    source: Optional[str] = None,
+    machine: OrderStateMachine = ORDER_STATES,
+) -> TransitionResult:
+    """Apply a batch of status changes in one transaction.
+
+    Items for the same order are applied in sequence, so a batch may move an
+    order through several states. Items whose ``expected_version`` is stale
+    or whose row changed underneath are reported as conflicts; illegal
+    changes and unknown orders are rejected. Neither aborts the batch.
+    """
+
+    for attempt in range(_RETRIES):
+        try:
+            return _apply_once(db, items, actor=actor, source=source, machine=machine)
+        except OperationalError as exc:
+            db.rollback()
+            if "locked" not in str(exc) or attempt == _RETRIES - 1:
+                raise
+    raise AssertionError("unreachable")  # pragma: no cover
+
+
+@ORDER_STATES.on_enter("CLOSED")
+def _record_member_purchase(db: Session, order: OrderSnapshot, entered_at: datetime) -> None:
+    if order.member_id is not None:
+        record_purchase(
+            db,
+            member_id=order.member_id,
+            order_id=order.id,
+            amount_cents=order.total_cents,
+            item_count=order.item_count,
+            store_id=order.store_id,
+            purchased_at=entered_at,
+        )
+
+
+@ORDER_STATES.on_enter("CLOSED")
+def _rollup_closed_order(db: Session, order: OrderSnapshot, entered_at: datetime) -> None:
+    record_closed_order(
+        db,
+        day=entered_at.date(),
+        store_id=order.store_id,
+        channel=order.channel,
+        payment_method=order.payment_method,
+        total_cents=order.total_cents,
+    )
+
+
+@router.post("/transitions/bulk", response_model=schemas.BulkTransitionResult)
+def bulk_transition(
+    payload: schemas.BulkTransitionRequest,
+    principal: rbac.Principal = Depends(_can_transition),
+    db: Session = Depends(get_db),
+):
+    result = apply_transitions(db, payload.items, actor=principal.username, source=payload.source or "bulk")
+    return schemas.BulkTransitionResult(applied=result.applied, conflicts=result.conflicts, rejected=result.rejected)
+
+
+@router.post("/{order_id}/transitions", response_model=schemas.TransitionOutcome)
+def transition_order(
+    order_id: int,
+    payload: schemas.OrderTransitionRequest,
+    principal: rbac.Principal = Depends(_can_transition),
+    db: Session = Depends(get_db),
+):
+    item = schemas.BulkTransitionItem(order_id=order_id, **payload.model_dump())
+    result = apply_transitions(db, [item], actor=principal.username, source="api")
+    if result.applied:
+        return result.applied[0]
+    if result.conflicts:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=result.conflicts[0].model_dump())
+    outcome = result.rejected[0]
+    if outcome.reason == "not_found":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=outcome.model_dump())
+
+
+@router.get("/{order_id}/transitions", response_model=list[schemas.OrderTransitionRead])
+def order_transitions(order_id: int, db: Session = Depends(get_db)):
+    statement = (
+        select(models.OrderTransition)
+        .where(models.OrderTransition.order_id == order_id)
+        .order_by(models.OrderTransition.id)
+    )
+    return list(db.scalars(statement))
+
+
+__all__ = [
+    "ORDER_STATES",
+    "OrderSnapshot",
+    "OrderStateMachine",
+    "TransitionHook",
+    "TransitionResult",
+    "apply_transitions",
+    "load_snapshots",
+    "router",
+    "stage_transitions",
+]
@@ -0,0 +1,244 @@
+"""Order management store and multi-filter order search.
+
+Searches are planned by :func:`plan_order_query`: the filters decide which
+of the ``(…, created_at, id)`` composite indexes on ``orders`` should drive
+the query, and predicates on other indexed columns are written as
+expressions (``+member_id``, ``channel || ''``) so SQLite cannot pick a
+worse index for them. Results are paged with a ``(created_at, id)`` keyset
+cursor. Counts stop at :data:`COUNT_CAP` rows and are cached for a short
+time, so a count over a huge result set is reported as approximate instead
+of scanning it.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from dataclasses import astuple, dataclass
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import Select, func, literal, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from . import models, schemas
+from .dependencies import get_db, get_read_db
+from .purchases import InvalidCursorError, decode_cursor, encode_cursor
+
+router = APIRouter(prefix="/orders", tags=["orders"])
+
+COUNT_CAP = 10_000
+_COUNT_TTL = 30.0
+_count_cache: dict[tuple, tuple[float, int, bool]] = {}
+_count_lock = threading.Lock()
+
+
+class DuplicateOrderError(RuntimeError):
+    """Raised when an order number is already in use."""
+
+
+@dataclass(frozen=True, slots=True)
+class OrderFilter:
+    """Search criteria accepted by the order list."""
+
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    store_id: Optional[str] = None
+    channel: Optional[str] = None
+    status: Optional[str] = None
+    member_id: Optional[int] = None
+    min_amount_cents: Optional[int] = None
+    max_amount_cents: Optional[int] = None
+
+
+def choose_index(criteria: OrderFilter) -> str:
+    """Name the index that should drive a search for *criteria*."""
+
+    if criteria.member_id is not None:
+        return "ix_orders_member_created"
+    if criteria.store_id is not None:
+        return "ix_orders_store_status_created" if criteria.status is not None else "ix_orders_store_created"
+    if criteria.status is not None:
+        return "ix_orders_status_created"
+    if criteria.channel is not None:
+        return "ix_orders_channel_created"
+    return "ix_orders_created"
+
+
+def _unindexed(column: ColumnElement, numeric: bool = False) -> ColumnElement:
+    # SQLite only uses an index for bare column references.
+    return column + 0 if numeric else column.op("||")(literal(""))
+
+
+def plan_order_query(criteria: OrderFilter, statement: Select) -> tuple[str, Select]:
+    """Apply *criteria* to *statement* steering SQLite to the chosen index."""
+
+    order = models.Order
+    index = choose_index(criteria)
+    driving = {
+        "ix_orders_member_created": {"member_id"},
+        "ix_orders_store_status_created": {"store_id", "status"},
+        "ix_orders_store_created": {"store_id"},
+        "ix_orders_status_created": {"status"},
+        "ix_orders_channel_created": {"channel"},
+        "ix_orders_created": set(),
+    }[index]
+
+    for name in ("store_id", "channel", "status", "member_id"):
+        value = getattr(criteria, name)
+        if value is None:
+            continue
+        column = getattr(order, name)
+        if name not in driving:
+            column = _unindexed(column, numeric=name == "member_id")
+        statement = statement.where(column == value)
+    if criteria.start is not None:
+        statement = statement.where(order.created_at >= criteria.start)
+    if criteria.end is not None:
+        statement = statement.where(order.created_at < criteria.end)
+    if criteria.min_amount_cents is not None:
+        statement = statement.where(order.total_cents >= criteria.min_amount_cents)
+    if criteria.max_amount_cents is not None:
+        statement = statement.where(order.total_cents <= criteria.max_amount_cents)
+    return index, statement
+
+
+def create_order(db: Session, payload: schemas.OrderCreate) -> models.Order:
+    order = models.Order(
+        order_no=payload.order_no or uuid.uuid4().hex[:20].upper(),
+        store_id=payload.store_id,
+        channel=payload.channel,
+        status="CREATED",
+        member_id=payload.member_id,
+        payment_method=payload.payment_method,
+    )
+    for line in payload.lines:
+        order.lines.append(
+            models.OrderLine(
+                sku=line.sku,
+                category=line.category,
+                quantity=line.quantity,
+                unit_price_cents=line.unit_price_cents,
+                amount_cents=line.unit_price_cents * line.quantity,
+                cost_cents=line.cost_cents,
+            )
+        )
+    order.total_cents = sum(line.amount_cents for line in order.lines)
+    order.item_count = sum(line.quantity for line in order.lines)
+    db.add(order)
+    try:
+        db.commit()
+    except IntegrityError as exc:
+        db.rollback()
+        raise DuplicateOrderError(f"Order number '{order.order_no}' already exists") from exc
+    db.refresh(order)
+    return order
+
+
+def get_order(db: Session, order_id: int) -> Optional[models.Order]:
+    return db.get(models.Order, order_id)
+
+
+def query_orders(
+    db: Session, criteria: OrderFilter, *, cursor: Optional[str] = None, limit: int = 50
+) -> schemas.OrderPage:
+    """Return one page of orders matching *criteria*, newest first."""
+
+    order = models.Order
+    columns = [getattr(order, name) for name in schemas.OrderSummary.model_fields]
+    _, statement = plan_order_query(criteria, select(*columns))
+    if cursor:
+        before_at, before_id = decode_cursor(cursor)
+        statement = statement.where(tuple_(order.created_at, order.id) < tuple_(before_at, before_id))
+    statement = statement.order_by(order.created_at.desc(), order.id.desc()).limit(limit + 1)
+    rows = db.execute(statement).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return schemas.OrderPage(items=[schemas.OrderSummary.model_validate(row) for row in rows], next_cursor=next_cursor)
+
+
+def count_orders(db: Session, criteria: OrderFilter) -> schemas.OrderCount:
+    """Count matching orders, capped at :data:`COUNT_CAP` and cached briefly."""
+
+    key = astuple(criteria)
+    now = time.monotonic()
+    cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return schemas.OrderCount(count=cached[1], approximate=cached[2])
+
+    _, inner = plan_order_query(criteria, select(literal(1)).select_from(models.Order))
+    total = db.scalar(select(func.count()).select_from(inner.limit(COUNT_CAP + 1).subquery())) or 0
+    approximate = total > COUNT_CAP
+    count = COUNT_CAP if approximate else total
+    with _count_lock:
+        if len(_count_cache) > 1024:
+            _count_cache.clear()
+        _count_cache[key] = (now + _COUNT_TTL, count, approximate)
+    return schemas.OrderCount(count=count, approximate=approximate)
+
+
+def _criteria(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    store_id: Optional[str] = None,
+    channel: Optional[str] = None,
+    status: Optional[str] = None,
+    member_id: Optional[int] = None,
+    min_amount_cents: Optional[int] = None,
+    max_amount_cents: Optional[int] = None,
+) -> OrderFilter:
+    return OrderFilter(start, end, store_id, channel, status, member_id, min_amount_cents, max_amount_cents)
+
+
+@router.post("", response_model=schemas.OrderRead, status_code=status.HTTP_201_CREATED)
+def create_order_endpoint(payload: schemas.OrderCreate, db: Session = Depends(get_db)):
+    try:
+        return create_order(db, payload)
+    except DuplicateOrderError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+
+
+@router.get("", response_model=schemas.OrderPage)
+def list_orders(
+    criteria: OrderFilter = Depends(_criteria),
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    db: Session = Depends(get_read_db),
+):
+    try:
+        return query_orders(db, criteria, cursor=cursor, limit=min(max(limit, 1), 500))
+    except InvalidCursorError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+
+@router.get("/count", response_model=schemas.OrderCount)
+def count_orders_endpoint(criteria: OrderFilter = Depends(_criteria), db: Session = Depends(get_read_db)):
+    return count_orders(db, criteria)
+
+
+@router.get("/{order_id}", response_model=schemas.OrderRead)
+def get_order_endpoint(order_id: int, db: Session = Depends(get_db)):
+    order = get_order(db, order_id)
+    if not order:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    return order
+
+
+__all__ = [
+    "COUNT_CAP",
+    "DuplicateOrderError",
+    "OrderFilter",
+    "choose_index",
+    "count_orders",
+    "create_order",
+    "get_order",
+    "plan_order_query",
+    "query_orders",
+    "router",
+]
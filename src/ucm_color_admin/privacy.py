@@ -0,0 +1,78 @@
+"""Masking helpers for personal data.
+
+Masking happens where rows are selected: :func:`masked_member_columns`
+returns SQL expressions so SQLite masks a whole page or export in the same
+pass that reads it, and templates or serializers only ever see masked
+values. The Python helpers mirror the SQL rules for single values.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlalchemy import case, func, literal
+from sqlalchemy.sql.elements import ColumnElement, Label
+
+from . import models
+
+
+def mask_phone(value: Optional[str]) -> Optional[str]:
+    """Keep the first three and last four characters of a phone number."""
+
+    if value is None:
+        return None
+    if len(value) < 8:
+        return "****"
+    return f"{value[:3]}****{value[-4:]}"
+
+
+def mask_name(value: Optional[str]) -> Optional[str]:
+    """Keep the first character of a name."""
+
+    if not value:
+        return value
+    return f"{value[0]}{'*' if len(value) <= 2 else '**'}"
+
+
+def masked_phone_sql(column: ColumnElement[str]) -> ColumnElement[str]:
+    """SQL equivalent of :func:`mask_phone`."""
+
+    return case(
+        (func.length(column) < 8, literal("****")),
+        else_=func.substr(column, 1, 3).op("||")(literal("****")).op("||")(func.substr(column, -4)),
+    )
+
+
+def masked_name_sql(column: ColumnElement[str]) -> ColumnElement[str]:
+    """SQL equivalent of :func:`mask_name`."""
+
+    return case(
+        (func.coalesce(func.length(column), 0) == 0, column),
+        (func.length(column) <= 2, func.substr(column, 1, 1).op("||")(literal("*"))),
+        else_=func.substr(column, 1, 1).op("||")(literal("**")),
+    )
+
+
+def masked_member_columns(masked: bool = True) -> list[Label | ColumnElement]:
+    """Columns used for member lists and exports, masked unless told otherwise."""
+
+    member = models.Member
+    phone = func.coalesce(member.phone_normalized, member.phone)
+    return [
+        member.id,
+        (masked_phone_sql(phone) if masked else phone).label("phone"),
+        (masked_name_sql(member.name) if masked else member.name).label("name"),
+        member.status,
+        member.tier,
+        member.is_blacklisted,
+        member.created_at,
+    ]
+
+
+__all__ = [
+    "mask_name",
+    "mask_phone",
+    "masked_member_columns",
+    "masked_name_sql",
+    "masked_phone_sql",
+]
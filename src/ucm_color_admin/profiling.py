@@ -0,0 +1,317 @@
+"""Opt-in sampling profiler for live requests.
+
+Nothing here runs unless ``UCM_COLOR_PROFILING=true``; with it off the
+middleware is not installed and no thread or SQL hook exists.
+
+With it on, a profile is captured either for a single request, by a user
+holding ``system:profile`` who sends ``X-UCM-Profile: 1`` (or
+``?_profile=1``), or for a time window, by ``ucm-color-admin profile``,
+which drops a trigger file that every server process watches. While a
+capture is active a sampler thread reads the stacks of all busy threads
+every ``UCM_COLOR_PROFILE_INTERVAL_MS`` and the engine records a timeline
+of SQL statements. Other requests served by the same process at the same
+time are sampled too.
+
+Each capture is written to ``<data dir>/profiles`` as ``<name>.folded``
+(one ``frame;frame;frame count`` line per stack, readable by
+``flamegraph.pl`` and speedscope) and ``<name>.sql.json``.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from . import rbac
+from .config import Settings, get_settings
+from .database import SessionLocal, get_engine
+
+__all__ = [
+    "Capture",
+    "ProfilingMiddleware",
+    "profiles_dir",
+    "request_window",
+    "start_capture",
+    "start_window_watcher",
+    "stop_capture",
+    "stop_window_watcher",
+]
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-ucm-profile"
+RESULT_HEADER = b"x-ucm-profile-id"
+_WINDOW_FILE = "window.json"
+_IDLE_MODULES = ("threading.py", "queue.py", "selectors.py")
+_SQL_TEXT_LIMIT = 500
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+_lock = threading.Lock()
+_active: list["Capture"] = []
+_sampler: Optional[threading.Thread] = None
+
+
+def profiles_dir(settings: Optional[Settings] = None) -> Path:
+    settings = settings or get_settings()
+    return settings.data_dir / "profiles"
+
+
+class Capture:
+    """Stack samples and SQL statements collected between start and stop.
+
+    The sampler and the SQL hooks only touch captures in ``_active`` and only
+    while holding ``_lock``, so once :func:`stop_capture` has removed one it
+    can be written out without further locking.
+    """
+
+    def __init__(self, label: str) -> None:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        self.name = f"{stamp}-{_UNSAFE.sub('_', label)[:60]}-{os.getpid()}"
+        self.started = time.perf_counter()
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.sql: list[dict[str, object]] = []
+
+    def write(self, directory: Path) -> Path:
+        directory.mkdir(parents=True, exist_ok=True)
+        folded = directory / f"{self.name}.folded"
+        folded.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()))
+        (directory / f"{self.name}.sql.json").write_text(
+            json.dumps(
+                {
+                    "samples": self.samples,
+                    "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+                    "statements": self.sql,
+                },
+                indent=2,
+            )
+        )
+        return folded
+
+
+def _is_idle(frame) -> bool:
+    return frame.f_code.co_filename.endswith(_IDLE_MODULES)
+
+
+def _fold(frame, thread_name: str) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    frames.reverse()
+    return ";".join(frames)
+
+
+def _sample(interval: float) -> None:
+    global _sampler
+    own = threading.get_ident()
+    while True:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = [
+            _fold(frame, names.get(ident, str(ident)))
+            for ident, frame in sys._current_frames().items()
+            if ident != own and not _is_idle(frame)
+        ]
+        with _lock:
+            if not _active:
+                _sampler = None
+                return
+            for capture in _active:
+                capture.stacks.update(stacks)
+                capture.samples += 1
+        time.sleep(interval)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None:
+        context.ucm_profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = getattr(context, "ucm_profile_started", None)
+    if started is None:
+        return
+    finished = time.perf_counter()
+    thread = threading.current_thread().name
+    with _lock:
+        for capture in _active:
+            capture.sql.append(
+                {
+                    "offset_ms": round((started - capture.started) * 1000, 3),
+                    "duration_ms": round((finished - started) * 1000, 3),
+                    "thread": thread,
+                    "executemany": executemany,
+                    "statement": statement[:_SQL_TEXT_LIMIT],
+                }
+            )
+
+
+def start_capture(label: str) -> Capture:
+    """Begin sampling; the sampler thread and SQL hooks exist only while a capture is active."""
+
+    global _sampler
+    capture = Capture(label)
+    with _lock:
+        _active.append(capture)
+        if len(_active) == 1:
+            engine = get_engine()
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        if _sampler is None:
+            interval = max(get_settings().profile_interval_ms, 0.5) / 1000
+            _sampler = threading.Thread(target=_sample, args=(interval,), name="ucm-color-profiler", daemon=True)
+            _sampler.start()
+    return capture
+
+
+def stop_capture(capture: Capture) -> Path:
+    """Stop ``capture`` and write it to the profiles directory."""
+
+    with _lock:
+        if capture in _active:
+            _active.remove(capture)
+        if not _active:
+            engine = get_engine()
+            for name, listener in (
+                ("before_cursor_execute", _before_cursor_execute),
+                ("after_cursor_execute", _after_cursor_execute),
+            ):
+                if event.contains(engine, name, listener):
+                    event.remove(engine, name, listener)
+    return capture.write(profiles_dir())
+
+
+def _flagged(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER and value not in (b"", b"0"):
+            return True
+    query = scope.get("query_string", b"")
+    return b"_profile" in query and ("_profile", "1") in parse_qsl(query.decode("latin-1"))
+
+
+def _may_profile(scope) -> bool:
+    """Authenticate the caller; blocking database work, so run it in the threadpool."""
+
+    request = Request(scope)
+    with SessionLocal() as db:
+        principal = rbac.authenticate(request, db)
+    return principal is not None and principal.allows(rbac.permission_mask(("system:profile",)))
+
+
+class ProfilingMiddleware:
+    """Profile flagged requests from callers holding ``system:profile``."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not _flagged(scope) or not await run_in_threadpool(_may_profile, scope):
+            await self.app(scope, receive, send)
+            return
+
+        capture = start_capture(f"{scope['method']}{scope['path']}")
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (RESULT_HEADER, capture.name.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stop_capture(capture)
+
+
+def request_window(seconds: float, label: str = "window", settings: Optional[Settings] = None) -> Path:
+    """Ask every running server process to profile for ``seconds``."""
+
+    directory = profiles_dir(settings)
+    directory.mkdir(parents=True, exist_ok=True)
+    trigger = directory / _WINDOW_FILE
+    temporary = trigger.with_suffix(".tmp")
+    temporary.write_text(json.dumps({"until": time.time() + seconds, "label": label}))
+    temporary.replace(trigger)
+    return directory
+
+
+class _WindowWatcher:
+    def __init__(self, directory: Path) -> None:
+        self.trigger = directory / _WINDOW_FILE
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ucm-color-profile-window", daemon=True)
+        self._seen: Optional[float] = None
+        self._capture: Optional[Capture] = None
+        self._until = 0.0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+        if self._capture is not None:
+            stop_capture(self._capture)
+            self._capture = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(1.0):
+            try:
+                self._poll()
+            except Exception:  # pragma: no cover - unreadable trigger file
+                logger.exception("Failed to read profiling trigger %s", self.trigger)
+
+    def _poll(self) -> None:
+        now = time.time()
+        if self._capture is not None and now >= self._until:
+            path = stop_capture(self._capture)
+            self._capture = None
+            logger.info("Wrote profile %s", path)
+        try:
+            mtime = self.trigger.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._seen:
+            return
+        self._seen = mtime
+        request = json.loads(self.trigger.read_text())
+        if request["until"] <= now:
+            return
+        if self._capture is None:
+            self._capture = start_capture(str(request.get("label") or "window"))
+        self._until = max(self._until, request["until"])
+
+
+_watcher: Optional[_WindowWatcher] = None
+
+
+def start_window_watcher() -> None:
+    global _watcher
+    settings = get_settings()
+    if not settings.profiling_enabled or _watcher is not None:
+        return
+    _watcher = _WindowWatcher(profiles_dir(settings))
+    _watcher.start()
+
+
+def stop_window_watcher() -> None:
+    global _watcher
+    if _watcher is None:
+        return
+    _watcher.stop()
+    _watcher = None
@@ -0,0 +1,301 @@
+"""Promotion engine for spend thresholds (满减), discounts and coupons.
+
+Active promotions are compiled into a :class:`CompiledPromotions` plan with
+inverted indexes from SKU, category, member tier, store and coupon code to
+the promotions scoped to them. Each promotion is filed under its most
+selective scope, so pricing a basket only looks at the buckets for the
+basket's SKUs, categories, tier, store and presented coupons plus the
+unscoped promotions, instead of every active promotion. Like the loyalty
+plan, the compiled indexes are cached and rebuilt only after a promotion
+changes, tracked by the ``promotions`` generation in :mod:`generations`.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional, Sequence
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import generations, models, rbac, schemas
+from .dependencies import get_db
+
+router = APIRouter(prefix="/promotions", tags=["promotions"])
+
+_CACHE_NAME = "promotions"
+
+_can_manage = Depends(rbac.require_permission("promotions:manage"))
+
+_lock = threading.Lock()
+_compiled: Optional["CompiledPromotions"] = None
+_checked_at = 0.0
+
+
+@dataclass(frozen=True, slots=True)
+class _Promo:
+    id: int
+    name: str
+    kind: str
+    priority: int
+    stackable: bool
+    store_id: Optional[str]
+    category: Optional[str]
+    sku: Optional[str]
+    tier: Optional[str]
+    threshold_cents: int
+    discount_cents: int
+    rate: float
+    starts_at: Optional[datetime]
+    ends_at: Optional[datetime]
+
+
+@dataclass(slots=True)
+class BasketTotals:
+    """Line amounts of one basket summed by SKU and category."""
+
+    subtotal: int
+    by_sku: dict[str, int]
+    by_category: dict[str, int]
+    by_pair: dict[tuple[str, str], int]
+
+    @classmethod
+    def of(cls, basket: schemas.Basket) -> "BasketTotals":
+        by_sku: dict[str, int] = defaultdict(int)
+        by_category: dict[str, int] = defaultdict(int)
+        by_pair: dict[tuple[str, str], int] = defaultdict(int)
+        subtotal = 0
+        for line in basket.lines:
+            amount = line.amount_cents
+            subtotal += amount
+            if line.sku is not None:
+                by_sku[line.sku] += amount
+            if line.category is not None:
+                by_category[line.category] += amount
+                if line.sku is not None:
+                    by_pair[(line.sku, line.category)] += amount
+        return cls(subtotal, dict(by_sku), dict(by_category), dict(by_pair))
+
+    def eligible(self, sku: Optional[str], category: Optional[str]) -> int:
+        if sku is None:
+            return self.subtotal if category is None else self.by_category.get(category, 0)
+        if category is None:
+            return self.by_sku.get(sku, 0)
+        return self.by_pair.get((sku, category), 0)
+
+
+def _freeze(bucket: dict[Optional[str], list[_Promo]]) -> dict[Optional[str], tuple[_Promo, ...]]:
+    return {key: tuple(values) for key, values in bucket.items()}
+
+
+class CompiledPromotions:
+    """Eligibility indexes built from a snapshot of the active promotions."""
+
+    __slots__ = ("generation", "promotions", "_global", "_by_store", "_by_tier", "_by_category", "_by_sku", "_by_coupon")
+
+    def __init__(self, promotions: Iterable[models.Promotion], generation: int = 0) -> None:
+        self.generation = generation
+        buckets: dict[str, dict[Optional[str], list[_Promo]]] = {
+            name: defaultdict(list) for name in ("global", "store", "tier", "category", "sku", "coupon")
+        }
+        compiled: list[_Promo] = []
+        for row in promotions:
+            if not row.is_active:
+                continue
+            promo = _Promo(
+                row.id,
+                row.name,
+                row.kind,
+                row.priority,
+                row.stackable,
+                row.store_id,
+                row.category,
+                row.sku,
+                row.tier,
+                row.threshold_cents,
+                row.discount_cents,
+                row.discount_percent / 100.0,
+                row.starts_at,
+                row.ends_at,
+            )
+            if row.coupon_code:
+                buckets["coupon"][row.coupon_code].append(promo)
+            elif row.sku:
+                buckets["sku"][row.sku].append(promo)
+            elif row.category:
+                buckets["category"][row.category].append(promo)
+            elif row.tier:
+                buckets["tier"][row.tier].append(promo)
+            elif row.store_id:
+                buckets["store"][row.store_id].append(promo)
+            else:
+                buckets["global"][None].append(promo)
+            compiled.append(promo)
+        self.promotions = tuple(compiled)
+        self._global = tuple(buckets["global"].get(None, ()))
+        self._by_store = _freeze(buckets["store"])
+        self._by_tier = _freeze(buckets["tier"])
+        self._by_category = _freeze(buckets["category"])
+        self._by_sku = _freeze(buckets["sku"])
+        self._by_coupon = _freeze(buckets["coupon"])
+
+    def candidates(self, basket: schemas.PricingRequest, totals: Optional[BasketTotals] = None) -> list[_Promo]:
+        """Promotions that could apply to *basket*, looked up from the indexes."""
+
+        totals = totals or BasketTotals.of(basket)
+        found: list[_Promo] = list(self._global)
+        if basket.store_id is not None:
+            found.extend(self._by_store.get(basket.store_id, ()))
+        if basket.member_tier is not None:
+            found.extend(self._by_tier.get(basket.member_tier, ()))
+        for sku in totals.by_sku:
+            found.extend(self._by_sku.get(sku, ()))
+        for category in totals.by_category:
+            found.extend(self._by_category.get(category, ()))
+        for code in set(basket.coupon_codes):
+            found.extend(self._by_coupon.get(code, ()))
+        return found
+
+    @staticmethod
+    def discount_for(promo: _Promo, basket: schemas.PricingRequest, totals: BasketTotals, now: datetime) -> int:
+        if promo.store_id is not None and promo.store_id != basket.store_id:
+            return 0
+        if promo.tier is not None and promo.tier != basket.member_tier:
+            return 0
+        if (promo.starts_at is not None and now < promo.starts_at) or (promo.ends_at is not None and now >= promo.ends_at):
+            return 0
+        eligible = totals.eligible(promo.sku, promo.category)
+        if eligible <= 0 or eligible < promo.threshold_cents:
+            return 0
+        if promo.kind == "threshold":
+            return min(promo.discount_cents, eligible)
+        return int(eligible * promo.rate)
+
+    def price(self, basket: schemas.PricingRequest, now: Optional[datetime] = None) -> schemas.PricedBasket:
+        """Apply the best exclusive promotion plus every stackable one."""
+
+        now = now or datetime.utcnow()
+        totals = BasketTotals.of(basket)
+        subtotal = totals.subtotal
+        candidates = self.candidates(basket, totals)
+        best: Optional[tuple[int, int, _Promo]] = None
+        stacked: list[tuple[int, _Promo]] = []
+        for promo in candidates:
+            discount = self.discount_for(promo, basket, totals, now)
+            if discount <= 0:
+                continue
+            if promo.stackable:
+                stacked.append((discount, promo))
+            elif best is None or (discount, promo.priority) > best[:2]:
+                best = (discount, promo.priority, promo)
+
+        chosen = ([(best[0], best[2])] if best else []) + sorted(stacked, key=lambda item: -item[1].priority)
+        applied: list[schemas.AppliedPromotion] = []
+        remaining = subtotal
+        for discount, promo in chosen:
+            discount = min(discount, remaining)
+            if discount <= 0:
+                break
+            remaining -= discount
+            applied.append(schemas.AppliedPromotion(promotion_id=promo.id, name=promo.name, discount_cents=discount))
+        return schemas.PricedBasket(
+            subtotal_cents=subtotal,
+            discount_cents=subtotal - remaining,
+            total_cents=remaining,
+            applied=applied,
+            candidates=len(candidates),
+        )
+
+
+def invalidate_promotions() -> None:
+    """Discard this process's indexes; the next caller rebuilds them."""
+
+    global _compiled
+    with _lock:
+        _compiled = None
+
+
+def get_compiled_promotions(db: Session) -> CompiledPromotions:
+    """Return the cached indexes, rebuilding them from the database when the stored generation moved."""
+
+    global _compiled, _checked_at
+    plan = _compiled
+    now = time.monotonic()
+    if plan is not None and now - _checked_at < generations.RECHECK_SECONDS:
+        return plan
+    generation = generations.current(db, _CACHE_NAME)
+    with _lock:
+        if _compiled is None or _compiled.generation != generation:
+            active = select(models.Promotion).where(models.Promotion.is_active.is_(True))
+            _compiled = CompiledPromotions(db.scalars(active), generation=generation)
+        _checked_at = now
+        return _compiled
+
+
+def _commit(db: Session) -> None:
+    generations.bump(db, _CACHE_NAME)
+    db.commit()
+    invalidate_promotions()
+
+
+def _apply(promotion: models.Promotion, payload: schemas.PromotionCreate) -> None:
+    for name, value in payload.model_dump().items():
+        setattr(promotion, name, value)
+
+
+def _get_promotion_or_404(db: Session, promotion_id: int) -> models.Promotion:
+    promotion = db.get(models.Promotion, promotion_id)
+    if not promotion:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Promotion not found")
+    return promotion
+
+
+@router.get("", response_model=list[schemas.PromotionRead])
+def list_promotions(db: Session = Depends(get_db)) -> Sequence[models.Promotion]:
+    return list(db.scalars(select(models.Promotion).order_by(models.Promotion.id)))
+
+
+@router.post(
+    "", response_model=schemas.PromotionRead, status_code=status.HTTP_201_CREATED, dependencies=[_can_manage]
+)
+def create_promotion(payload: schemas.PromotionCreate, db: Session = Depends(get_db)):
+    promotion = models.Promotion()
+    _apply(promotion, payload)
+    db.add(promotion)
+    _commit(db)
+    db.refresh(promotion)
+    return promotion
+
+
+@router.put("/{promotion_id}", response_model=schemas.PromotionRead, dependencies=[_can_manage])
+def update_promotion(promotion_id: int, payload: schemas.PromotionCreate, db: Session = Depends(get_db)):
+    promotion = _get_promotion_or_404(db, promotion_id)
+    _apply(promotion, payload)
+    _commit(db)
+    db.refresh(promotion)
+    return promotion
+
+
+@router.delete("/{promotion_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[_can_manage])
+def delete_promotion(promotion_id: int, db: Session = Depends(get_db)) -> None:
+    db.delete(_get_promotion_or_404(db, promotion_id))
+    _commit(db)
+
+
+@router.post("/price", response_model=schemas.PricedBasket)
+def price_basket(basket: schemas.PricingRequest, db: Session = Depends(get_db)):
+    return get_compiled_promotions(db).price(basket)
+
+
+__all__ = [
+    "BasketTotals",
+    "CompiledPromotions",
+    "get_compiled_promotions",
+    "invalidate_promotions",
+    "router",
+]
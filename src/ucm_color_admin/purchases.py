@@ -0,0 +1,212 @@
+"""Member purchase history and lifetime aggregates.
+
+History rows live in the ``member_purchases`` table clustered on
+``(member_id, purchased_at, order_id)`` and are paged with an opaque
+keyset cursor, so reading page *n* of a heavy shopper's history costs the
+same as reading page one. ``member_stats`` is updated in the same
+transaction as each recorded purchase, which keeps a profile load to a
+primary key lookup.
+"""
+
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func, literal, select, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import models, rbac, schemas
+from .dependencies import get_db
+from .members import member_view
+
+router = APIRouter(prefix="/members", tags=["members"])
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(purchased_at: datetime, order_id: int) -> str:
+    raw = f"{purchased_at.isoformat()}|{order_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        stamp, order_id = raw.split("|", 1)
+        return datetime.fromisoformat(stamp), int(order_id)
+    except ValueError as exc:
+        raise InvalidCursorError("Invalid cursor") from exc
+
+
+def record_purchase(
+    db: Session,
+    *,
+    member_id: int,
+    order_id: int,
+    amount_cents: int,
+    item_count: int = 0,
+    store_id: Optional[str] = None,
+    purchased_at: Optional[datetime] = None,
+) -> bool:
+    """Append a purchase and fold it into the member aggregates.
+
+    Recording the same order twice is a no-op, even when the retry carries
+    a different ``purchased_at``: the insert is skipped on the unique
+    ``(member_id, order_id)`` index and the aggregates are only updated when
+    a row was actually inserted. Returns ``True`` when the purchase was new.
+    The caller commits.
+    """
+
+    purchased_at = purchased_at or datetime.utcnow()
+    inserted = db.execute(
+        insert(models.MemberPurchase)
+        .values(
+            member_id=member_id,
+            purchased_at=purchased_at,
+            order_id=order_id,
+            store_id=store_id,
+            amount_cents=amount_cents,
+            item_count=item_count,
+        )
+        # Untargeted, so a clash on either the primary key or the order index skips the row.
+        .on_conflict_do_nothing()
+    ).rowcount
+    if not inserted:
+        return False
+    stats = models.MemberStats.__table__.c
+    statement = insert(models.MemberStats).values(
+        member_id=member_id,
+        lifetime_spend_cents=amount_cents,
+        visit_count=1,
+        item_count=item_count,
+        first_purchase_at=purchased_at,
+        last_purchase_at=purchased_at,
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[stats.member_id],
+            set_={
+                "lifetime_spend_cents": stats.lifetime_spend_cents + statement.excluded.lifetime_spend_cents,
+                "visit_count": stats.visit_count + 1,
+                "item_count": stats.item_count + statement.excluded.item_count,
+                "first_purchase_at": func.min(stats.first_purchase_at, statement.excluded.first_purchase_at),
+                "last_purchase_at": func.max(stats.last_purchase_at, statement.excluded.last_purchase_at),
+            },
+        )
+    )
+    return True
+
+
+def adjust_spend(db: Session, member_id: int, delta_cents: int) -> None:
+    """Apply a spend correction (for example a refund) to the aggregates."""
+
+    stats = models.MemberStats.__table__.c
+    db.execute(
+        models.MemberStats.__table__.update()
+        .where(stats.member_id == member_id)
+        .values(lifetime_spend_cents=stats.lifetime_spend_cents + delta_cents)
+    )
+
+
+def history_member_ids(db: Session, member_id: int) -> list[int]:
+    """Return *member_id* plus every profile merged into it, directly or through an earlier merge."""
+
+    member = models.Member
+    tree = select(literal(member_id).label("id")).cte("history", recursive=True)
+    tree = tree.union(select(member.id).where(member.merged_into_id == tree.c.id))
+    merged = db.scalars(select(tree.c.id).where(tree.c.id != member_id)).all()
+    return [member_id, *merged]
+
+
+def list_purchases(
+    db: Session, member_ids: list[int], *, cursor: Optional[str] = None, limit: int = 50
+) -> schemas.PurchasePage:
+    """Return one page of history, newest first, continuing after *cursor*."""
+
+    purchase = models.MemberPurchase
+    statement = select(purchase).where(purchase.member_id.in_(member_ids))
+    if cursor:
+        before_at, before_id = decode_cursor(cursor)
+        statement = statement.where(tuple_(purchase.purchased_at, purchase.order_id) < tuple_(before_at, before_id))
+    rows = list(
+        db.scalars(statement.order_by(purchase.purchased_at.desc(), purchase.order_id.desc()).limit(limit + 1))
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].purchased_at, rows[-1].order_id)
+    return schemas.PurchasePage(
+        items=[schemas.PurchaseRead.model_validate(row) for row in rows], next_cursor=next_cursor
+    )
+
+
+def member_stats(db: Session, member_ids: list[int]) -> schemas.MemberStatsRead:
+    """Combine the stored aggregates of *member_ids* (a survivor and its merges)."""
+
+    rows = db.scalars(select(models.MemberStats).where(models.MemberStats.member_id.in_(member_ids))).all()
+    if not rows:
+        return schemas.MemberStatsRead()
+    spend = sum(row.lifetime_spend_cents for row in rows)
+    visits = sum(row.visit_count for row in rows)
+    firsts = [row.first_purchase_at for row in rows if row.first_purchase_at]
+    lasts = [row.last_purchase_at for row in rows if row.last_purchase_at]
+    return schemas.MemberStatsRead(
+        lifetime_spend_cents=spend,
+        visit_count=visits,
+        item_count=sum(row.item_count for row in rows),
+        average_ticket_cents=spend // visits if visits else 0,
+        first_purchase_at=min(firsts) if firsts else None,
+        last_purchase_at=max(lasts) if lasts else None,
+    )
+
+
+def _get_member_or_404(db: Session, member_id: int) -> models.Member:
+    member = db.get(models.Member, member_id)
+    if not member:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found")
+    return member
+
+
+@router.get("/{member_id}/profile", response_model=schemas.MemberProfile)
+def member_profile(
+    member_id: int, principal: rbac.Principal = Depends(rbac.require_permission()), db: Session = Depends(get_db)
+):
+    member = _get_member_or_404(db, member_id)
+    stats = member_stats(db, history_member_ids(db, member.id))
+    return schemas.MemberProfile(member=member_view(member, principal), stats=stats)
+
+
+@router.get("/{member_id}/purchases", response_model=schemas.PurchasePage)
+def member_purchases(member_id: int, cursor: Optional[str] = None, limit: int = 50, db: Session = Depends(get_db)):
+    member = _get_member_or_404(db, member_id)
+    try:
+        return list_purchases(db, history_member_ids(db, member.id), cursor=cursor, limit=min(max(limit, 1), 500))
+    except InvalidCursorError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+
+@router.post("/{member_id}/purchases", status_code=status.HTTP_201_CREATED)
+def add_purchase(member_id: int, payload: schemas.PurchaseCreate, db: Session = Depends(get_db)) -> dict[str, bool]:
+    member = _get_member_or_404(db, member_id)
+    created = record_purchase(db, member_id=member.id, **payload.model_dump())
+    db.commit()
+    return {"created": created}
+
+
+__all__ = [
+    "InvalidCursorError",
+    "adjust_spend",
+    "decode_cursor",
+    "encode_cursor",
+    "history_member_ids",
+    "list_purchases",
+    "member_stats",
+    "record_purchase",
+    "router",
+]
@@ -0,0 +1,468 @@
+"""Roles and permissions.
+
+Permissions are defined in code (:data:`PERMISSIONS`) and each one owns a
+fixed bit. Roles grant permission names and users hold any number of
+roles; superusers implicitly hold every permission.
+
+The first time a user is seen, their roles are folded into one integer
+mask and cached for the process as a :class:`Principal`, so authorizing a
+request is a dictionary lookup and a bit test rather than a join over
+``user_roles`` and ``role_permissions``. Changing a role, a grant or a
+user bumps the generation stored in ``rbac_state``. The process that made
+the change drops its cache immediately; other processes read the
+generation at most every ``_RECHECK_SECONDS`` and recompile when it moved.
+
+The console session cookie is ``<username>.<expiry>.<signature>``, signed
+with HMAC-SHA256 under ``UCM_COLOR_SESSION_SECRET`` (or a generated
+``session.secret`` file in the data directory). A cookie that was not
+issued by :func:`sign_session`, or has expired, identifies nobody.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hmac
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional, Sequence
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import apikeys, audit, models, schemas, security
+from .config import Settings, get_settings
+from .dependencies import get_db
+
+router = APIRouter(tags=["roles"])
+
+SESSION_COOKIE = "ucm_color_admin_user"
+SESSION_MAX_AGE = 60 * 60 * 8  # 8 hours
+
+#: Every permission the application checks, with a short description.
+PERMISSIONS: dict[str, str] = {
+    "users:read": "List and view users",
+    "users:write": "Create, edit and delete users",
+    "roles:manage": "Manage roles and assign them to users",
+    "audit:read": "Query the audit log",
+    "jobs:manage": "View, queue and cancel background jobs and schedules",
+    "system:profile": "Profile live requests",
+    "refunds:request": "Request refunds and voids",
+    "refunds:review": "Approve or reject refund and void requests",
+    "exports:unmasked": "View, export and download member data without masking",
+    "members:read": "View members and their purchase history",
+    "members:write": "Create, import, merge and edit members and record purchases",
+    "orders:read": "View orders and their transition history",
+    "orders:write": "Record orders and move them between states",
+    "loyalty:manage": "Create, edit and delete loyalty rules",
+    "promotions:manage": "Create, edit and delete promotions",
+    "analytics:read": "View sales analytics, pivots, heatmaps and reconciliation reports",
+    "analytics:refresh": "Refresh materialized views and rebuild analytics snapshots",
+    "reconciliation:run": "Rebuild reconciliation rollups from orders",
+    "stores:manage": "Edit store master data",
+}
+
+_BITS: dict[str, int] = {name: 1 << index for index, name in enumerate(PERMISSIONS)}
+ALL_PERMISSIONS = (1 << len(_BITS)) - 1
+
+_RECHECK_SECONDS = 1.0
+_STATE_ID = 1
+
+_lock = threading.Lock()
+_cache: Optional["PermissionCache"] = None
+_session_key: Optional[bytes] = None
+
+
+class UnknownPermissionError(RuntimeError):
+    """Raised when a role grants a permission name that is not defined."""
+
+
+class DuplicateRoleError(RuntimeError):
+    """Raised when a role name is already taken."""
+
+
+class UnknownRoleError(RuntimeError):
+    """Raised when assigning a role that does not exist."""
+
+
+def permission_mask(names: Iterable[str]) -> int:
+    mask = 0
+    for name in names:
+        bit = _BITS.get(name)
+        if bit is None:
+            raise UnknownPermissionError(f"Unknown permission '{name}'")
+        mask |= bit
+    return mask
+
+
+def permission_names(mask: int) -> list[str]:
+    return [name for name, bit in _BITS.items() if mask & bit]
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """An authenticated user with their compiled permission mask."""
+
+    user_id: int
+    username: str
+    is_superuser: bool
+    mask: int
+
+    def allows(self, mask: int) -> bool:
+        return self.is_superuser or self.mask & mask == mask
+
+    @property
+    def permissions(self) -> list[str]:
+        return permission_names(ALL_PERMISSIONS if self.is_superuser else self.mask)
+
+
+class PermissionCache:
+    """Compiled role masks and principals for one generation of ``rbac_state``."""
+
+    __slots__ = ("generation", "checked_at", "_role_masks", "_principals")
+
+    def __init__(self, generation: int) -> None:
+        self.generation = generation
+        self.checked_at = time.monotonic()
+        self._role_masks: Optional[dict[int, int]] = None
+        self._principals: dict[str, Principal] = {}
+
+    def role_masks(self, db: Session) -> dict[int, int]:
+        masks = self._role_masks
+        if masks is None:
+            masks = {}
+            grants = db.execute(select(models.RolePermission.role_id, models.RolePermission.permission))
+            for role_id, permission in grants:
+                # Grants for permissions removed from the code simply stop counting.
+                masks[role_id] = masks.get(role_id, 0) | _BITS.get(permission, 0)
+            self._role_masks = masks
+        return masks
+
+    def principal(self, db: Session, username: str) -> Optional[Principal]:
+        principal = self._principals.get(username)
+        if principal is not None:
+            return principal
+        user = models.User
+        row = db.execute(
+            select(user.id, user.is_superuser, user.is_active).where(user.username == username)
+        ).first()
+        if row is None or not row.is_active:
+            return None
+        masks = self.role_masks(db)
+        mask = 0
+        for role_id in db.scalars(select(models.user_roles.c.role_id).where(models.user_roles.c.user_id == row.id)):
+            mask |= masks.get(role_id, 0)
+        principal = Principal(user_id=row.id, username=username, is_superuser=row.is_superuser, mask=mask)
+        self._principals[username] = principal
+        return principal
+
+
+def get_permission_cache(db: Session) -> PermissionCache:
+    """Return this process's cache, recompiling it when the stored generation moved."""
+
+    global _cache
+    cache = _cache
+    now = time.monotonic()
+    if cache is not None and now - cache.checked_at < _RECHECK_SECONDS:
+        return cache
+    generation = db.scalar(select(models.RbacState.generation).where(models.RbacState.id == _STATE_ID)) or 0
+    with _lock:
+        if _cache is None or _cache.generation != generation:
+            _cache = PermissionCache(generation)
+        _cache.checked_at = now
+        return _cache
+
+
+def bump_generation(db: Session) -> None:
+    """Record that roles, grants or users changed. The caller commits, then calls :func:`invalidate_permissions`."""
+
+    state = models.RbacState
+    statement = sqlite_insert(state).values(id=_STATE_ID, generation=1)
+    db.execute(
+        statement.on_conflict_do_update(index_elements=[state.id], set_={"generation": state.generation + 1})
+    )
+
+
+def invalidate_permissions() -> None:
+    """Discard this process's compiled permissions; the next request recompiles them."""
+
+    global _cache
+    with _lock:
+        _cache = None
+
+
+def _commit(db: Session) -> None:
+    bump_generation(db)
+    db.commit()
+    invalidate_permissions()
+
+
+def load_session_secret(settings: Optional[Settings] = None) -> bytes:
+    """Return the session signing key, creating a private key file on first use."""
+
+    settings = settings or get_settings()
+    if settings.session_secret:
+        return settings.session_secret.encode("utf-8")
+    return security.load_secret_file(settings.data_dir / "session.secret")
+
+
+def _session_signature(payload: str) -> str:
+    global _session_key
+    if _session_key is None:
+        with _lock:
+            if _session_key is None:
+                _session_key = load_session_secret()
+    digest = security.keyed_digest(payload, _session_key)
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def sign_session(username: str, max_age: int = SESSION_MAX_AGE) -> str:
+    """Return a session cookie value for ``username`` that expires after ``max_age`` seconds."""
+
+    name = base64.urlsafe_b64encode(username.encode("utf-8")).decode().rstrip("=")
+    payload = f"{name}.{int(time.time()) + max_age}"
+    return f"{payload}.{_session_signature(payload)}"
+
+
+def session_username(request: Request) -> Optional[str]:
+    """Return the user named by a valid, unexpired session cookie, if any."""
+
+    value = request.cookies.get(SESSION_COOKIE)
+    if not value:
+        return None
+    payload, _, signature = value.rpartition(".")
+    if not payload or not hmac.compare_digest(signature, _session_signature(payload)):
+        return None
+    name, _, expires = payload.partition(".")
+    try:
+        if int(expires) < time.time():
+            return None
+        return base64.urlsafe_b64decode(name + "=" * (-len(name) % 4)).decode("utf-8")
+    except (ValueError, binascii.Error):
+        return None
+
+
+def authenticate(request: Request, db: Session) -> Optional[Principal]:
+    """Resolve the caller of ``request`` and remember it as the audit actor.
+
+    An API key, when sent, takes precedence over the session cookie; an
+    invalid key does not fall back to the cookie.
+    """
+
+    principal = getattr(request.state, "principal", None)
+    if principal is not None:
+        return principal
+    token = apikeys.request_token(request)
+    username = apikeys.lookup(db, token) if token else session_username(request)
+    if not username:
+        return None
+    principal = get_permission_cache(db).principal(db, username)
+    if principal is not None:
+        request.state.principal = principal
+        request.state.actor = principal.username
+    return principal
+
+
+def require_permission(*names: str) -> Callable[..., Principal]:
+    """Dependency factory: reject callers that lack any of ``names``."""
+
+    mask = permission_mask(names)
+    missing = ", ".join(names)
+
+    def dependency(request: Request, db: Session = Depends(get_db)) -> Principal:
+        principal = authenticate(request, db)
+        if principal is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+        if not principal.allows(mask):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Requires permission: {missing}")
+        return principal
+
+    return dependency
+
+
+_SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def require_method_permission(read: Optional[str], write: str) -> Callable[..., Principal]:
+    """Router dependency: ``read`` for GET/HEAD requests, ``write`` for everything else.
+
+    With ``read=None`` reading only requires a signed-in caller.
+    """
+
+    can_read = require_permission(*((read,) if read else ()))
+    can_write = require_permission(write)
+
+    def dependency(request: Request, db: Session = Depends(get_db)) -> Principal:
+        check = can_read if request.method in _SAFE_METHODS else can_write
+        return check(request, db)
+
+    return dependency
+
+
+def _apply(role: models.Role, payload: schemas.RoleCreate) -> None:
+    permission_mask(payload.permissions)
+    role.name = payload.name
+    role.description = payload.description
+    wanted = dict.fromkeys(payload.permissions)
+    role.grants = [grant for grant in role.grants if grant.permission in wanted]
+    held = {grant.permission for grant in role.grants}
+    role.grants.extend(models.RolePermission(permission=name) for name in wanted if name not in held)
+
+
+def save_role(db: Session, role: models.Role, payload: schemas.RoleCreate) -> models.Role:
+    _apply(role, payload)
+    db.add(role)
+    try:
+        db.flush()
+    except IntegrityError as exc:
+        db.rollback()
+        raise DuplicateRoleError(f"Role '{payload.name}' already exists") from exc
+    _commit(db)
+    return role
+
+
+def delete_role(db: Session, role: models.Role) -> None:
+    db.execute(models.user_roles.delete().where(models.user_roles.c.role_id == role.id))
+    db.delete(role)
+    _commit(db)
+
+
+def set_user_roles(db: Session, user: models.User, names: Sequence[str]) -> None:
+    wanted = list(dict.fromkeys(names))
+    roles = list(db.scalars(select(models.Role).where(models.Role.name.in_(wanted)))) if wanted else []
+    unknown = set(wanted) - {role.name for role in roles}
+    if unknown:
+        raise UnknownRoleError(f"Unknown role(s): {', '.join(sorted(unknown))}")
+    user.roles = roles
+    _commit(db)
+
+
+def effective_permissions(db: Session, user: models.User) -> schemas.EffectivePermissions:
+    masks = get_permission_cache(db).role_masks(db)
+    mask = ALL_PERMISSIONS if user.is_superuser else 0
+    for role in user.roles:
+        mask |= masks.get(role.id, 0)
+    return schemas.EffectivePermissions(
+        user_id=user.id,
+        username=user.username,
+        is_superuser=user.is_superuser,
+        roles=[role.name for role in user.roles],
+        permissions=permission_names(mask),
+    )
+
+
+def _get_role_or_404(db: Session, role_id: int) -> models.Role:
+    role = db.get(models.Role, role_id)
+    if not role:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Role not found")
+    return role
+
+
+def _get_user_or_404(db: Session, user_id: int) -> models.User:
+    user = db.get(models.User, user_id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return user
+
+
+_manage_roles = Depends(require_permission("roles:manage"))
+
+
+@router.get("/roles/permissions", response_model=list[schemas.PermissionRead], dependencies=[_manage_roles])
+def list_permissions() -> list[schemas.PermissionRead]:
+    return [schemas.PermissionRead(name=name, description=text) for name, text in PERMISSIONS.items()]
+
+
+@router.get("/roles", response_model=list[schemas.RoleRead], dependencies=[_manage_roles])
+def list_roles(db: Session = Depends(get_db)) -> Sequence[models.Role]:
+    return list(db.scalars(select(models.Role).order_by(models.Role.name)))
+
+
+@router.post(
+    "/roles", response_model=schemas.RoleRead, status_code=status.HTTP_201_CREATED, dependencies=[_manage_roles]
+)
+def create_role(payload: schemas.RoleCreate, request: Request, db: Session = Depends(get_db)):
+    try:
+        role = save_role(db, models.Role(), payload)
+    except UnknownPermissionError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)) from exc
+    except DuplicateRoleError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+    audit.record_request(
+        request, "role.create", target_type="role", target_id=role.id, detail=payload.model_dump(exclude_none=True)
+    )
+    return role
+
+
+@router.put("/roles/{role_id}", response_model=schemas.RoleRead, dependencies=[_manage_roles])
+def update_role(role_id: int, payload: schemas.RoleCreate, request: Request, db: Session = Depends(get_db)):
+    role = _get_role_or_404(db, role_id)
+    try:
+        save_role(db, role, payload)
+    except UnknownPermissionError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)) from exc
+    except DuplicateRoleError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+    audit.record_request(
+        request, "role.update", target_type="role", target_id=role_id, detail=payload.model_dump(exclude_none=True)
+    )
+    return role
+
+
+@router.delete("/roles/{role_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[_manage_roles])
+def delete_role_endpoint(role_id: int, request: Request, db: Session = Depends(get_db)) -> None:
+    role = _get_role_or_404(db, role_id)
+    name = role.name
+    delete_role(db, role)
+    audit.record_request(request, "role.delete", target_type="role", target_id=role_id, detail={"name": name})
+
+
+@router.get("/users/{user_id}/permissions", response_model=schemas.EffectivePermissions, dependencies=[_manage_roles])
+def get_user_permissions(user_id: int, db: Session = Depends(get_db)):
+    return effective_permissions(db, _get_user_or_404(db, user_id))
+
+
+@router.put("/users/{user_id}/roles", response_model=schemas.EffectivePermissions, dependencies=[_manage_roles])
+def update_user_roles(
+    user_id: int, payload: schemas.UserRolesUpdate, request: Request, db: Session = Depends(get_db)
+):
+    user = _get_user_or_404(db, user_id)
+    try:
+        set_user_roles(db, user, payload.roles)
+    except UnknownRoleError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)) from exc
+    audit.record_request(request, "user.roles", target_type="user", target_id=user_id, detail={"roles": payload.roles})
+    return effective_permissions(db, user)
+
+
+__all__ = [
+    "ALL_PERMISSIONS",
+    "DuplicateRoleError",
+    "PERMISSIONS",
+    "PermissionCache",
+    "Principal",
+    "SESSION_COOKIE",
+    "SESSION_MAX_AGE",
+    "UnknownPermissionError",
+    "UnknownRoleError",
+    "authenticate",
+    "bump_generation",
+    "delete_role",
+    "effective_permissions",
+    "get_permission_cache",
+    "invalidate_permissions",
+    "load_session_secret",
+    "permission_mask",
+    "permission_names",
+    "require_method_permission",
+    "require_permission",
+    "router",
+    "save_role",
+    "session_username",
+    "set_user_roles",
+    "sign_session",
+]
@@ -0,0 +1,287 @@
+"""Channel and payment method reconciliation.
+
+Closed orders are folded into ``reconciliation_rollups`` (one row per day,
+store, channel and payment method) in the same transaction that closes
+them, so reports and exports read a few rollup rows instead of scanning
+``orders``. :func:`verify_day` recomputes a single day from the raw orders
+to check, and optionally rebuild, the rollups. Approved refunds are
+subtracted on the day they are approved.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+from datetime import date, datetime, time, timedelta
+from typing import Iterator, Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .database import ReadSessionLocal
+from .dependencies import get_db, get_read_db
+
+router = APIRouter(prefix="/reconciliation", tags=["reconciliation"])
+
+_FETCH_SIZE = 1000
+_AMOUNTS = ("order_count", "gross_cents", "refund_cents", "net_cents")
+
+
+def record_closed_order(
+    db: Session,
+    *,
+    day: date,
+    store_id: str,
+    channel: str,
+    payment_method: Optional[str],
+    total_cents: int,
+) -> None:
+    """Add one closed order to its rollup row. The caller commits."""
+
+    rollup = models.ReconciliationRollup.__table__.c
+    statement = sqlite_insert(models.ReconciliationRollup).values(
+        day=day,
+        store_id=store_id,
+        channel=channel,
+        payment_method=payment_method or "",
+        order_count=1,
+        gross_cents=total_cents,
+        refund_cents=0,
+        net_cents=total_cents,
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[rollup.day, rollup.store_id, rollup.channel, rollup.payment_method],
+            set_={
+                "order_count": rollup.order_count + 1,
+                "gross_cents": rollup.gross_cents + statement.excluded.gross_cents,
+                "net_cents": rollup.net_cents + statement.excluded.gross_cents,
+            },
+        )
+    )
+
+
+def record_refund(
+    db: Session,
+    *,
+    day: date,
+    store_id: str,
+    channel: str,
+    payment_method: Optional[str],
+    refund_cents: int,
+) -> None:
+    """Subtract an approved refund from its rollup row. The caller commits."""
+
+    rollup = models.ReconciliationRollup.__table__.c
+    statement = sqlite_insert(models.ReconciliationRollup).values(
+        day=day,
+        store_id=store_id,
+        channel=channel,
+        payment_method=payment_method or "",
+        order_count=0,
+        gross_cents=0,
+        refund_cents=refund_cents,
+        net_cents=-refund_cents,
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[rollup.day, rollup.store_id, rollup.channel, rollup.payment_method],
+            set_={
+                "refund_cents": rollup.refund_cents + statement.excluded.refund_cents,
+                "net_cents": rollup.net_cents - statement.excluded.refund_cents,
+            },
+        )
+    )
+
+
+def _rollup_query(start: date, end: date, store_id: Optional[str]) -> Select:
+    rollup = models.ReconciliationRollup
+    statement = select(rollup).where(rollup.day >= start, rollup.day <= end)
+    if store_id is not None:
+        statement = statement.where(rollup.store_id == store_id)
+    return statement
+
+
+def reconciliation_report(
+    db: Session, start: date, end: date, *, store_id: Optional[str] = None
+) -> schemas.ReconciliationReport:
+    """Totals per channel and payment method for the days ``start``..``end``."""
+
+    rollup = models.ReconciliationRollup
+    statement = select(
+        rollup.channel,
+        rollup.payment_method,
+        *(func.sum(getattr(rollup, name)).label(name) for name in _AMOUNTS),
+    ).where(rollup.day >= start, rollup.day <= end)
+    if store_id is not None:
+        statement = statement.where(rollup.store_id == store_id)
+    statement = statement.group_by(rollup.channel, rollup.payment_method).order_by(
+        rollup.channel, rollup.payment_method
+    )
+    totals = [schemas.ReconciliationTotal.model_validate(row._mapping) for row in db.execute(statement)]
+    return schemas.ReconciliationReport(start=start, end=end, store_id=store_id, totals=totals)
+
+
+def iter_rollup_csv(start: date, end: date, *, store_id: Optional[str] = None) -> Iterator[str]:
+    """Yield the rollup rows for ``start``..``end`` as CSV text chunks."""
+
+    rollup = models.ReconciliationRollup
+    columns = [column.key for column in rollup.__table__.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    statement = _rollup_query(start, end, store_id).order_by(
+        rollup.day, rollup.store_id, rollup.channel, rollup.payment_method
+    )
+    with ReadSessionLocal() as session:
+        result = session.scalars(statement.execution_options(yield_per=_FETCH_SIZE))
+        for partition in result.partitions():
+            writer.writerows([getattr(row, name) for name in columns] for row in partition)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def recompute_day(db: Session, day: date) -> dict[tuple[str, str, str], dict[str, int]]:
+    """Rebuild the rollup values for *day* from the orders closed and refunds approved on it."""
+
+    order = models.Order
+    payment = func.coalesce(order.payment_method, "")
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+    statement = (
+        select(
+            order.store_id,
+            order.channel,
+            payment.label("payment_method"),
+            func.count().label("order_count"),
+            func.sum(order.total_cents).label("gross_cents"),
+        )
+        .where(order.closed_at >= start, order.closed_at < end)
+        .group_by(order.store_id, order.channel, payment)
+    )
+    totals = {
+        (row.store_id, row.channel, row.payment_method): {
+            "order_count": row.order_count,
+            "gross_cents": row.gross_cents,
+            "refund_cents": 0,
+            "net_cents": row.gross_cents,
+        }
+        for row in db.execute(statement)
+    }
+
+    ledger = models.RefundLedgerEntry
+    refunds = (
+        select(ledger.store_id, ledger.channel, ledger.payment_method, func.sum(ledger.amount_cents).label("amount"))
+        .where(ledger.kind == "refund", ledger.created_at >= start, ledger.created_at < end)
+        .group_by(ledger.store_id, ledger.channel, ledger.payment_method)
+    )
+    for row in db.execute(refunds):
+        values = totals.setdefault(
+            (row.store_id, row.channel, row.payment_method), dict.fromkeys(_AMOUNTS, 0)
+        )
+        values["refund_cents"] += row.amount
+        values["net_cents"] -= row.amount
+    return totals
+
+
+def verify_day(db: Session, day: date, *, repair: bool = False) -> schemas.ReconciliationCheck:
+    """Compare the stored rollups for *day* with a recomputation.
+
+    With ``repair`` the day's rollups are replaced by the recomputed values.
+    """
+
+    expected = recompute_day(db, day)
+    stored = {
+        (row.store_id, row.channel, row.payment_method): {name: getattr(row, name) for name in _AMOUNTS}
+        for row in db.scalars(_rollup_query(day, day, None))
+    }
+    empty = dict.fromkeys(_AMOUNTS, 0)
+    mismatches = [
+        schemas.ReconciliationMismatch(
+            store_id=key[0],
+            channel=key[1],
+            payment_method=key[2],
+            field=name,
+            rollup=stored.get(key, empty)[name],
+            recomputed=expected.get(key, empty)[name],
+        )
+        for key in sorted(expected.keys() | stored.keys())
+        for name in _AMOUNTS
+        if stored.get(key, empty)[name] != expected.get(key, empty)[name]
+    ]
+    repaired = False
+    if repair and mismatches:
+        rollup = models.ReconciliationRollup
+        db.execute(delete(rollup).where(rollup.day == day))
+        if expected:
+            db.execute(
+                insert(rollup),
+                [
+                    {"day": day, "store_id": store, "channel": channel, "payment_method": method, **values}
+                    for (store, channel, method), values in expected.items()
+                ],
+            )
+        db.commit()
+        repaired = True
+    return schemas.ReconciliationCheck(
+        day=day, ok=not mismatches, groups=len(expected.keys() | stored.keys()), mismatches=mismatches, repaired=repaired
+    )
+
+
+def _range(start: Optional[date], end: Optional[date]) -> tuple[date, date]:
+    end = end or datetime.utcnow().date()
+    return start or end, end
+
+
+@router.get("", response_model=schemas.ReconciliationReport)
+def reconciliation_endpoint(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    store_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    start, end = _range(start, end)
+    return reconciliation_report(db, start, end, store_id=store_id)
+
+
+@router.get("/export")
+def export_reconciliation(
+    start: Optional[date] = None, end: Optional[date] = None, store_id: Optional[str] = None
+) -> StreamingResponse:
+    start, end = _range(start, end)
+    filename = f"reconciliation-{start:%Y%m%d}-{end:%Y%m%d}.csv"
+    return StreamingResponse(
+        iter_rollup_csv(start, end, store_id=store_id),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/verify", response_model=schemas.ReconciliationCheck)
+def verify_endpoint(day: date, db: Session = Depends(get_read_db)):
+    return verify_day(db, day)
+
+
+@router.post("/verify", response_model=schemas.ReconciliationCheck)
+def repair_endpoint(day: date, db: Session = Depends(get_db)):
+    """Recompute *day* and replace its rollups if they differ."""
+
+    return verify_day(db, day, repair=True)
+
+
+__all__ = [
+    "iter_rollup_csv",
+    "reconciliation_report",
+    "recompute_day",
+    "record_closed_order",
+    "record_refund",
+    "router",
+    "verify_day",
+]
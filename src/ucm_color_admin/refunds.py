@@ -0,0 +1,372 @@
+"""Refund and void requests with review.
+
+Requesting needs the ``refunds:request`` permission and reviewing
+``refunds:review``; the requester and reviewers are the signed-in
+principals, never names taken from the request body. Nobody can review
+their own request. Requests are created with an ``Idempotency-Key``; the key has a unique
+index and the first response is stored on the row, so a retried request is
+answered from a single index lookup and can never create a second refund.
+Pending requests form a review queue paged on ``(status, id)``. When
+``refund_dual_review`` is enabled two different reviewers, neither of them
+the requester, must approve. The final approval posts the ledger entry,
+the order status change, the reconciliation rollup and the member spend
+correction in one transaction.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, rbac, schemas
+from .config import Settings, get_settings
+from .dependencies import get_db
+from .order_states import OrderSnapshot, load_snapshots, stage_transitions
+from .purchases import adjust_spend
+from .reconciliation import record_refund
+
+router = APIRouter(prefix="/refunds", tags=["refunds"])
+
+VOIDABLE_STATES = frozenset({"CREATED", "PAID", "READY"})
+
+
+class RefundError(RuntimeError):
+    """Base class for refund workflow errors."""
+
+
+class IdempotencyKeyReusedError(RefundError):
+    """Raised when an idempotency key is replayed with a different request."""
+
+
+class RefundNotAllowedError(RefundError):
+    """Raised when the order cannot be refunded or voided as requested."""
+
+
+class RefundReviewError(RefundError):
+    """Raised when a review is not allowed for this reviewer or request state."""
+
+
+def refunded_cents(db: Session, order_id: int) -> int:
+    ledger = models.RefundLedgerEntry
+    return db.scalar(select(func.coalesce(func.sum(ledger.amount_cents), 0)).where(ledger.order_id == order_id)) or 0
+
+
+def _check_amount(order: OrderSnapshot, kind: str, amount_cents: Optional[int], already: int) -> int:
+    if kind == "void":
+        if order.status not in VOIDABLE_STATES:
+            raise RefundNotAllowedError(f"Order {order.id} is {order.status}; only open orders can be voided")
+        return 0 if order.status == "CREATED" else order.total_cents
+    if order.status != "CLOSED":
+        raise RefundNotAllowedError(f"Order {order.id} is {order.status}; only closed orders can be refunded")
+    remaining = order.total_cents - already
+    amount = remaining if amount_cents is None else amount_cents
+    if amount <= 0 or amount > remaining:
+        raise RefundNotAllowedError(f"Refund of {amount} cents exceeds the {remaining} cents left on order {order.id}")
+    return amount
+
+
+def find_replay(
+    db: Session, idempotency_key: str, payload: schemas.RefundCreate, requested_by: str
+) -> Optional[str]:
+    """Return the stored response for *idempotency_key*, if it was used before."""
+
+    refund = models.RefundRequest
+    row = db.execute(
+        select(refund.order_id, refund.kind, refund.amount_cents, refund.requested_by, refund.response_json).where(
+            refund.idempotency_key == idempotency_key
+        )
+    ).first()
+    if row is None:
+        return None
+    if (row.order_id, row.kind, row.requested_by) != (payload.order_id, payload.kind, requested_by) or (
+        payload.amount_cents is not None and payload.amount_cents != row.amount_cents
+    ):
+        raise IdempotencyKeyReusedError(f"Idempotency key '{idempotency_key}' was used for a different request")
+    return row.response_json
+
+
+def create_refund(
+    db: Session, idempotency_key: str, payload: schemas.RefundCreate, requested_by: str
+) -> tuple[str, bool]:
+    """Queue a refund or void for review on behalf of *requested_by*.
+
+    Returns the JSON response and whether it was replayed from an earlier
+    request with the same key.
+    """
+
+    replay = find_replay(db, idempotency_key, payload, requested_by)
+    if replay is not None:
+        return replay, True
+
+    order = load_snapshots(db, [payload.order_id]).get(payload.order_id)
+    if order is None:
+        raise RefundNotAllowedError(f"Order {payload.order_id} not found")
+    amount = _check_amount(order, payload.kind, payload.amount_cents, refunded_cents(db, order.id))
+    request = models.RefundRequest(
+        idempotency_key=idempotency_key,
+        order_id=order.id,
+        kind=payload.kind,
+        amount_cents=amount,
+        reason=payload.reason,
+        requested_by=requested_by,
+        status="pending",
+    )
+    db.add(request)
+    try:
+        db.flush()
+    except IntegrityError:
+        # A concurrent retry with the same key won the insert.
+        db.rollback()
+        replay = find_replay(db, idempotency_key, payload, requested_by)
+        if replay is None:
+            raise
+        return replay, True
+    request.response_json = schemas.RefundRead.model_validate(request).model_dump_json()
+    db.commit()
+    return request.response_json, False
+
+
+def get_refund(db: Session, refund_id: int) -> Optional[models.RefundRequest]:
+    return db.get(models.RefundRequest, refund_id)
+
+
+def list_refund_queue(
+    db: Session, *, status: str = "pending", after: Optional[int] = None, limit: int = 50
+) -> schemas.RefundPage:
+    """Page through requests in *status*, oldest first, using the ``(status, id)`` index."""
+
+    refund = models.RefundRequest
+    statement = select(refund).where(refund.status == status)
+    if after is not None:
+        statement = statement.where(refund.id > after)
+    rows = list(db.scalars(statement.order_by(refund.id).limit(limit + 1)))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return schemas.RefundPage(items=[schemas.RefundRead.model_validate(row) for row in rows], next_cursor=next_cursor)
+
+
+def _pending_or_error(db: Session, refund_id: int, reviewer: str) -> models.RefundRequest:
+    request = get_refund(db, refund_id)
+    if request is None:
+        raise RefundReviewError(f"Refund request {refund_id} not found")
+    if request.status != "pending":
+        raise RefundReviewError(f"Refund request {refund_id} is already {request.status}")
+    if reviewer == request.requested_by:
+        raise RefundReviewError("The requester cannot review their own refund")
+    return request
+
+
+def approve_refund(
+    db: Session,
+    refund_id: int,
+    review: schemas.RefundReview,
+    reviewer: str,
+    *,
+    settings: Optional[Settings] = None,
+) -> models.RefundRequest:
+    """Record *reviewer*'s approval and, once enough reviewers agreed, post the refund."""
+
+    settings = settings or get_settings()
+    request = _pending_or_error(db, refund_id, reviewer)
+    refund = models.RefundRequest
+    now = datetime.utcnow()
+    guard = update(refund).where(refund.id == refund_id, refund.status == "pending")
+
+    if settings.refund_dual_review:
+        if request.first_reviewer is None:
+            changed = db.execute(
+                guard.where(refund.first_reviewer.is_(None)).values(first_reviewer=reviewer, review_note=review.note)
+            ).rowcount
+            if not changed:
+                db.rollback()
+                raise RefundReviewError(f"Refund request {refund_id} was reviewed concurrently")
+            db.commit()
+            db.refresh(request)
+            return request
+        if request.first_reviewer == reviewer:
+            raise RefundReviewError("A second, different reviewer must approve this refund")
+        values = {"second_reviewer": reviewer}
+        guard = guard.where(refund.first_reviewer == request.first_reviewer)
+    else:
+        values = {"first_reviewer": reviewer}
+
+    # Claiming the request first takes the write lock, so the order and
+    # ledger reads below cannot be invalidated by a concurrent approval.
+    claimed = db.execute(guard.values(status="approved", decided_at=now, review_note=review.note, **values)).rowcount
+    if not claimed:
+        db.rollback()
+        raise RefundReviewError(f"Refund request {refund_id} was decided concurrently")
+    try:
+        _post_refund(db, request, reviewer)
+    except Exception:
+        db.rollback()
+        raise
+    db.commit()
+    db.refresh(request)
+    return request
+
+
+def _post_refund(db: Session, request: models.RefundRequest, reviewer: str) -> None:
+    db.refresh(request)
+    current = load_snapshots(db, [request.order_id])
+    order = current.get(request.order_id)
+    if order is None:
+        raise RefundNotAllowedError(f"Order {request.order_id} not found")
+    already = refunded_cents(db, order.id)
+    _check_amount(order, request.kind, request.amount_cents if request.kind == "refund" else None, already)
+
+    target = "VOIDED" if request.kind == "void" else None
+    if request.kind == "refund" and already + request.amount_cents == order.total_cents:
+        target = "REFUNDED"
+    if target is not None:
+        result = stage_transitions(
+            db,
+            [schemas.BulkTransitionItem(order_id=order.id, to_status=target, expected_version=order.version)],
+            actor=reviewer,
+            source="refund",
+            current=current,
+            allow_restricted=True,
+        )
+        if not result.applied:
+            outcome = (result.conflicts or result.rejected)[0]
+            raise RefundNotAllowedError(f"Order {order.id} could not move to {target}: {outcome.reason}")
+
+    now = datetime.utcnow()
+    db.add(
+        models.RefundLedgerEntry(
+            refund_id=request.id,
+            order_id=order.id,
+            kind=request.kind,
+            amount_cents=request.amount_cents,
+            store_id=order.store_id,
+            channel=order.channel,
+            payment_method=order.payment_method or "",
+            member_id=order.member_id,
+            created_at=now,
+        )
+    )
+    if request.kind == "refund":
+        record_refund(
+            db,
+            day=now.date(),
+            store_id=order.store_id,
+            channel=order.channel,
+            payment_method=order.payment_method,
+            refund_cents=request.amount_cents,
+        )
+        if order.member_id is not None:
+            adjust_spend(db, order.member_id, -request.amount_cents)
+
+
+def reject_refund(db: Session, refund_id: int, review: schemas.RefundReview, reviewer: str) -> models.RefundRequest:
+    request = _pending_or_error(db, refund_id, reviewer)
+    refund = models.RefundRequest
+    changed = db.execute(
+        update(refund)
+        .where(refund.id == refund_id, refund.status == "pending")
+        .values(status="rejected", decided_at=datetime.utcnow(), review_note=review.note, second_reviewer=reviewer)
+    ).rowcount
+    if not changed:
+        db.rollback()
+        raise RefundReviewError(f"Refund request {refund_id} was decided concurrently")
+    db.commit()
+    db.refresh(request)
+    return request
+
+
+_can_request = rbac.require_permission("refunds:request")
+_can_review = rbac.require_permission("refunds:review")
+_REVIEW_MASK = rbac.permission_mask(("refunds:review",))
+
+
+@router.post("", response_model=schemas.RefundRead, status_code=status.HTTP_201_CREATED)
+def create_refund_endpoint(
+    payload: schemas.RefundCreate,
+    idempotency_key: str = Header(..., alias="Idempotency-Key", min_length=1, max_length=64),
+    principal: rbac.Principal = Depends(_can_request),
+    db: Session = Depends(get_db),
+) -> Response:
+    try:
+        body, replayed = create_refund(db, idempotency_key, payload, principal.username)
+    except IdempotencyKeyReusedError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+    except RefundNotAllowedError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)) from exc
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return Response(body, status_code=status.HTTP_201_CREATED, media_type="application/json", headers=headers)
+
+
+@router.get("/queue", response_model=schemas.RefundPage, dependencies=[Depends(_can_review)])
+def refund_queue(
+    status: str = "pending", after: Optional[int] = None, limit: int = 50, db: Session = Depends(get_db)
+):
+    return list_refund_queue(db, status=status, after=after, limit=min(max(limit, 1), 500))
+
+
+@router.get("/{refund_id}", response_model=schemas.RefundRead)
+def get_refund_endpoint(
+    refund_id: int, principal: rbac.Principal = Depends(rbac.require_permission()), db: Session = Depends(get_db)
+):
+    request = get_refund(db, refund_id)
+    if request is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Refund request not found")
+    if request.requested_by != principal.username and not principal.allows(_REVIEW_MASK):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Requires permission: refunds:review")
+    return request
+
+
+def _review(
+    action, db: Session, refund_id: int, review: schemas.RefundReview, principal: rbac.Principal
+) -> models.RefundRequest:
+    if get_refund(db, refund_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Refund request not found")
+    try:
+        return action(db, refund_id, review, principal.username)
+    except RefundNotAllowedError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)) from exc
+    except RefundReviewError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+
+
+@router.post("/{refund_id}/approve", response_model=schemas.RefundRead)
+def approve_refund_endpoint(
+    refund_id: int,
+    review: schemas.RefundReview,
+    principal: rbac.Principal = Depends(_can_review),
+    db: Session = Depends(get_db),
+):
+    return _review(approve_refund, db, refund_id, review, principal)
+
+
+@router.post("/{refund_id}/reject", response_model=schemas.RefundRead)
+def reject_refund_endpoint(
+    refund_id: int,
+    review: schemas.RefundReview,
+    principal: rbac.Principal = Depends(_can_review),
+    db: Session = Depends(get_db),
+):
+    return _review(reject_refund, db, refund_id, review, principal)
+
+
+__all__ = [
+    "IdempotencyKeyReusedError",
+    "RefundError",
+    "RefundNotAllowedError",
+    "RefundReviewError",
+    "VOIDABLE_STATES",
+    "approve_refund",
+    "create_refund",
+    "find_replay",
+    "get_refund",
+    "list_refund_queue",
+    "refunded_cents",
+    "reject_refund",
+    "router",
+]
@@ -0,0 +1,50 @@
+"""JSON responses for large list endpoints that skip response models.
+
+FastAPI validates every returned object against the route's
+``response_model`` and serializes the validated copy, which for a page of
+a thousand users costs far more than the query. The list endpoints
+instead select plain columns into dicts that already have the shape of
+the schema and return a :class:`FastJSONResponse`, which FastAPI passes
+through untouched; ``response_model`` stays on the route so the OpenAPI
+schema does not change. The encoder is orjson when it is installed (the
+``fast-json`` extra) and the standard library otherwise.
+
+Setting ``UCM_COLOR_FAST_JSON=false`` switches the endpoints back to the
+validated path, e.g. to check that both produce the same output.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from typing import Any
+
+from starlette.responses import Response
+
+try:  # orjson is an optional dependency (``pip install ucm-color-admin[fast-json]``)
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without the extra
+    orjson = None
+
+__all__ = ["FastJSONResponse", "dumps"]
+
+
+def _default(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode ``content`` compactly, with datetimes as ISO 8601 like Pydantic."""
+
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode()
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -2,10 +2,11 @@
 
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Optional
+import json
+from datetime import date, datetime
+from typing import Any, Literal, Optional
 
-from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator
 
 
 class UserBase(BaseModel):
@@ -36,9 +37,612 @@ class UserRead(UserBase):
     updated_at: datetime
 
 
+class PermissionRead(BaseModel):
+    name: str
+    description: str
+
+
+class RoleCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=64)
+    description: Optional[str] = Field(None, max_length=255)
+    permissions: list[str] = Field(default_factory=list)
+
+
+class RoleRead(RoleCreate):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class UserRolesUpdate(BaseModel):
+    roles: list[str] = Field(default_factory=list)
+
+
+class EffectivePermissions(BaseModel):
+    user_id: int
+    username: str
+    is_superuser: bool
+    roles: list[str]
+    permissions: list[str]
+
+
+class ApiKeyCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=64)
+    expires_in_days: Optional[int] = Field(None, ge=1, le=3650)
+
+
+class ApiKeyRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    prefix: str
+    name: str
+    created_at: datetime
+    expires_at: Optional[datetime]
+    revoked_at: Optional[datetime]
+
+
+class ApiKeyCreated(ApiKeyRead):
+    key: str = Field(..., description="Full key; shown only once")
+
+
 class DownloadEntry(BaseModel):
     """Metadata returned for downloadable installer archives."""
 
     filename: str = Field(..., min_length=1, max_length=255)
     url: str = Field(..., min_length=1)
     size: int = Field(..., ge=0)
+
+
+class MemberBase(BaseModel):
+    name: Optional[str] = Field(None, max_length=64)
+    is_blacklisted: bool = False
+    blacklist_reason: Optional[str] = Field(None, max_length=255)
+
+
+class MemberCreate(MemberBase):
+    phone: str = Field(..., min_length=5, max_length=32)
+    tags: list[str] = Field(default_factory=list)
+
+
+class MemberImportRow(BaseModel):
+    phone: str = Field(..., min_length=1, max_length=32)
+    name: Optional[str] = Field(None, max_length=64)
+
+
+class MemberUpdate(BaseModel):
+    name: Optional[str] = Field(None, max_length=64)
+    tier: Optional[str] = Field(None, max_length=32)
+    is_blacklisted: Optional[bool] = None
+    blacklist_reason: Optional[str] = Field(None, max_length=255)
+    tags: Optional[list[str]] = None
+
+
+class MemberRead(MemberBase):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    phone: str
+    phone_normalized: Optional[str]
+    status: str
+    tier: Optional[str]
+    merged_into_id: Optional[int]
+    tags: list[str]
+    created_at: datetime
+    updated_at: datetime
+
+    @field_validator("tags", mode="before")
+    @classmethod
+    def _tag_names(cls, value: Any) -> Any:
+        return [getattr(tag, "name", tag) for tag in value or ()]
+
+
+class MemberMasked(BaseModel):
+    """Member row as shown in lists, with personal data masked in SQL."""
+
+    id: int
+    phone: str
+    name: Optional[str]
+    status: str
+    tier: Optional[str]
+    is_blacklisted: bool
+
+
+class PurchaseCreate(BaseModel):
+    order_id: int
+    store_id: Optional[str] = Field(None, max_length=32)
+    amount_cents: int
+    item_count: int = Field(0, ge=0)
+    purchased_at: datetime
+
+
+class PurchaseRead(PurchaseCreate):
+    model_config = ConfigDict(from_attributes=True)
+
+    member_id: int
+
+
+class PurchasePage(BaseModel):
+    items: list[PurchaseRead]
+    next_cursor: Optional[str] = None
+
+
+class MemberStatsRead(BaseModel):
+    lifetime_spend_cents: int = 0
+    visit_count: int = 0
+    item_count: int = 0
+    average_ticket_cents: int = 0
+    first_purchase_at: Optional[datetime] = None
+    last_purchase_at: Optional[datetime] = None
+
+
+class MemberProfile(BaseModel):
+    member: MemberRead
+    stats: MemberStatsRead
+
+
+class MemberMergeRequest(BaseModel):
+    survivor_id: int
+    duplicate_ids: list[int] = Field(..., min_length=1)
+
+
+class MemberMergeResult(BaseModel):
+    batch_id: str
+    merged: int
+
+
+class LoyaltyRuleBase(BaseModel):
+    name: str = Field(..., min_length=1, max_length=64)
+    kind: Literal["earn", "redeem", "tier"]
+    priority: int = 0
+    is_active: bool = True
+    store_id: Optional[str] = Field(None, max_length=32)
+    category: Optional[str] = Field(None, max_length=64)
+    tier: Optional[str] = Field(None, max_length=32)
+    min_amount_cents: int = Field(0, ge=0)
+    points_per_yuan: float = Field(0.0, ge=0)
+    multiplier: float = Field(1.0, ge=0)
+    threshold_points: int = Field(0, ge=0)
+    discount_percent: float = Field(0.0, ge=0, le=100)
+    cents_per_point: float = Field(0.0, ge=0)
+    max_redeem_ratio: float = Field(1.0, ge=0, le=1)
+
+
+class LoyaltyRuleCreate(LoyaltyRuleBase):
+    pass
+
+
+class LoyaltyRuleRead(LoyaltyRuleBase):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class BasketLine(BaseModel):
+    sku: Optional[str] = Field(None, max_length=64)
+    category: Optional[str] = Field(None, max_length=64)
+    quantity: int = Field(1, ge=1)
+    amount_cents: int = Field(..., ge=0)
+
+
+class Basket(BaseModel):
+    store_id: Optional[str] = Field(None, max_length=32)
+    member_tier: Optional[str] = Field(None, max_length=32)
+    lines: list[BasketLine] = Field(default_factory=list)
+
+
+class BasketScore(BaseModel):
+    points: int
+    line_points: list[int]
+    discount_percent: float
+
+
+class OrderBatch(BaseModel):
+    orders: dict[str, Basket]
+
+
+class OrderBatchScore(BaseModel):
+    total_points: int
+    orders: dict[str, int]
+
+
+class RedeemQuoteRequest(BaseModel):
+    store_id: Optional[str] = Field(None, max_length=32)
+    points: int = Field(..., ge=0)
+    payable_cents: int = Field(..., ge=0)
+
+
+class RedeemQuote(BaseModel):
+    points_used: int
+    value_cents: int
+
+
+class PromotionBase(BaseModel):
+    name: str = Field(..., min_length=1, max_length=64)
+    kind: Literal["threshold", "percent"]
+    priority: int = 0
+    stackable: bool = False
+    is_active: bool = True
+    store_id: Optional[str] = Field(None, max_length=32)
+    category: Optional[str] = Field(None, max_length=64)
+    sku: Optional[str] = Field(None, max_length=64)
+    tier: Optional[str] = Field(None, max_length=32)
+    coupon_code: Optional[str] = Field(None, max_length=32)
+    threshold_cents: int = Field(0, ge=0)
+    discount_cents: int = Field(0, ge=0)
+    discount_percent: float = Field(0.0, ge=0, le=100)
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+
+
+class PromotionCreate(PromotionBase):
+    pass
+
+
+class PromotionRead(PromotionBase):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class PricingRequest(Basket):
+    coupon_codes: list[str] = Field(default_factory=list, max_length=20)
+
+
+class AppliedPromotion(BaseModel):
+    promotion_id: int
+    name: str
+    discount_cents: int
+
+
+class PricedBasket(BaseModel):
+    subtotal_cents: int
+    discount_cents: int
+    total_cents: int
+    applied: list[AppliedPromotion]
+    candidates: int
+
+
+class ExportJobCreate(BaseModel):
+    kind: Literal["members"] = "members"
+    masked: bool = True
+
+
+class ExportJobRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    kind: str
+    masked: bool
+    requested_by: Optional[str]
+    status: str
+    row_count: int
+    file_name: Optional[str]
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+
+class JobCreate(BaseModel):
+    kind: str = Field(..., min_length=1, max_length=64)
+    payload: dict[str, Any] = Field(default_factory=dict)
+    priority: int = 0
+    run_at: Optional[datetime] = None
+    max_attempts: Optional[int] = Field(None, ge=1, le=20)
+
+
+class JobRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    kind: str
+    payload: dict[str, Any]
+    status: str
+    priority: int
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    schedule_name: Optional[str]
+    progress: float
+    progress_message: Optional[str]
+    result: Any = None
+    error: Optional[str]
+    cancel_requested: bool
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    @field_validator("payload", "result", mode="before")
+    @classmethod
+    def _decode_json(cls, value: Any) -> Any:
+        return json.loads(value) if isinstance(value, str) else value
+
+
+class JobScheduleUpdate(BaseModel):
+    kind: str = Field(..., min_length=1, max_length=64)
+    cron: str = Field(..., min_length=1, max_length=64)
+    payload: dict[str, Any] = Field(default_factory=dict)
+    priority: int = 0
+    enabled: bool = True
+
+
+class JobScheduleRead(JobScheduleUpdate):
+    model_config = ConfigDict(from_attributes=True)
+
+    name: str
+    next_run_at: Optional[datetime]
+    last_run_at: Optional[datetime]
+    updated_at: datetime
+
+    @field_validator("payload", mode="before")
+    @classmethod
+    def _decode_json(cls, value: Any) -> Any:
+        return json.loads(value) if isinstance(value, str) else value
+
+
+class OrderLineCreate(BaseModel):
+    sku: str = Field(..., min_length=1, max_length=64)
+    category: Optional[str] = Field(None, max_length=64)
+    quantity: int = Field(1, ge=1)
+    unit_price_cents: int = Field(..., ge=0)
+    cost_cents: int = Field(0, ge=0, description="Cost of one unit; margins multiply it by quantity")
+
+
+class OrderLineRead(OrderLineCreate):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    amount_cents: int
+
+
+class OrderCreate(BaseModel):
+    order_no: Optional[str] = Field(None, min_length=1, max_length=32)
+    store_id: str = Field(..., min_length=1, max_length=32)
+    channel: str = Field(..., min_length=1, max_length=16)
+    member_id: Optional[int] = None
+    payment_method: Optional[str] = Field(None, max_length=16)
+    lines: list[OrderLineCreate] = Field(..., min_length=1)
+
+
+class OrderSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    order_no: str
+    store_id: str
+    channel: str
+    status: str
+    member_id: Optional[int]
+    payment_method: Optional[str]
+    total_cents: int
+    item_count: int
+    created_at: datetime
+    closed_at: Optional[datetime]
+    version: int
+
+
+class OrderRead(OrderSummary):
+    lines: list[OrderLineRead]
+
+
+class OrderPage(BaseModel):
+    items: list[OrderSummary]
+    next_cursor: Optional[str] = None
+
+
+class OrderCount(BaseModel):
+    count: int
+    approximate: bool
+
+
+class OrderTransitionRequest(BaseModel):
+    to_status: str = Field(..., min_length=1, max_length=16)
+    expected_version: Optional[int] = Field(None, ge=1)
+
+
+class BulkTransitionItem(OrderTransitionRequest):
+    order_id: int
+
+
+class BulkTransitionRequest(BaseModel):
+    items: list[BulkTransitionItem] = Field(..., min_length=1, max_length=10_000)
+    source: Optional[str] = Field(None, max_length=32)
+
+
+class TransitionOutcome(BaseModel):
+    order_id: int
+    status: Optional[str] = None
+    version: Optional[int] = None
+    reason: Optional[str] = None
+
+
+class BulkTransitionResult(BaseModel):
+    applied: list[TransitionOutcome]
+    conflicts: list[TransitionOutcome]
+    rejected: list[TransitionOutcome]
+
+
+class OrderTransitionRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    order_id: int
+    from_status: str
+    to_status: str
+    version: int
+    actor: Optional[str]
+    source: Optional[str]
+    created_at: datetime
+
+
+class ReconciliationTotal(BaseModel):
+    channel: str
+    payment_method: str
+    order_count: int
+    gross_cents: int
+    refund_cents: int
+    net_cents: int
+
+
+class ReconciliationReport(BaseModel):
+    start: date
+    end: date
+    store_id: Optional[str] = None
+    totals: list[ReconciliationTotal]
+
+
+class ReconciliationMismatch(BaseModel):
+    store_id: str
+    channel: str
+    payment_method: str
+    field: str
+    rollup: int
+    recomputed: int
+
+
+class ReconciliationCheck(BaseModel):
+    day: date
+    ok: bool
+    groups: int
+    mismatches: list[ReconciliationMismatch]
+    repaired: bool = False
+
+
+class RefundCreate(BaseModel):
+    order_id: int
+    kind: Literal["refund", "void"] = "refund"
+    amount_cents: Optional[int] = Field(None, gt=0)
+    reason: Optional[str] = Field(None, max_length=255)
+
+
+class RefundReview(BaseModel):
+    note: Optional[str] = Field(None, max_length=255)
+
+
+class RefundRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    idempotency_key: str
+    order_id: int
+    kind: str
+    amount_cents: int
+    reason: Optional[str]
+    status: str
+    requested_by: str
+    first_reviewer: Optional[str]
+    second_reviewer: Optional[str]
+    review_note: Optional[str]
+    created_at: datetime
+    decided_at: Optional[datetime]
+
+
+class RefundPage(BaseModel):
+    items: list[RefundRead]
+    next_cursor: Optional[int] = None
+
+
+class SalesKpis(BaseModel):
+    start: datetime
+    end: datetime
+    store_id: Optional[str] = None
+    order_count: int
+    sales_cents: int
+    units: int
+    average_ticket_cents: int
+    units_per_transaction: float
+    gross_margin_cents: int
+    gross_margin_rate: float
+    refreshed_at: Optional[datetime] = None
+
+
+class HourlySales(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    store_id: str
+    hour: datetime
+    order_count: int
+    sales_cents: int
+    units: int
+
+
+class TopProduct(BaseModel):
+    sku: str
+    quantity: int
+    sales_cents: int
+
+
+class RefreshResult(BaseModel):
+    transitions: int
+    orders: int
+    watermark: int
+
+
+class SkuUnits(BaseModel):
+    sku: str
+    quantity: int
+    error: int = 0
+
+
+class HeatmapCell(BaseModel):
+    weekday: int
+    hour: int
+    quantity: int
+    top: list[SkuUnits]
+
+
+class Heatmap(BaseModel):
+    start: datetime
+    end: datetime
+    store_id: Optional[str] = None
+    region: Optional[str] = None
+    sku: Optional[str] = None
+    exact: bool
+    cells: list[HeatmapCell]
+
+
+class TopSkus(BaseModel):
+    start: datetime
+    end: datetime
+    store_id: Optional[str] = None
+    region: Optional[str] = None
+    exact: bool
+    items: list[SkuUnits]
+
+
+class StoreUpdate(BaseModel):
+    name: Optional[str] = Field(None, max_length=128)
+    region: Optional[str] = Field(None, max_length=64)
+
+
+class StoreRead(StoreUpdate):
+    model_config = ConfigDict(from_attributes=True)
+
+    store_id: str
+    updated_at: datetime
+
+
+class PivotRow(BaseModel):
+    keys: dict[str, Any]
+    value: int
+
+
+class PivotResult(BaseModel):
+    engine: Literal["sql", "columnar"]
+    measure: str
+    dims: list[str]
+    as_of: Optional[datetime] = None
+    rows: list[PivotRow]
+
+
+class ColumnarSnapshotInfo(BaseModel):
+    name: str
+    rows: int
+    as_of: datetime
+    build_seconds: float
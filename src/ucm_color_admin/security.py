@@ -6,8 +6,13 @@ import base64
 import hashlib
 import hmac
 import os
+import tempfile
+import time
+from pathlib import Path
 from typing import Tuple
 
+from .metrics import PBKDF2_SECONDS
+
 _ITERATIONS = 390_000
 _ALGORITHM = "sha256"
 _SALT_BYTES = 16
@@ -25,7 +30,9 @@ def hash_password(password: str) -> str:
     """Return a salted PBKDF2 hash for *password*."""
 
     salt = os.urandom(_SALT_BYTES)
+    started = time.perf_counter()
     digest = hashlib.pbkdf2_hmac(_ALGORITHM, password.encode("utf-8"), salt, _ITERATIONS)
+    PBKDF2_SECONDS.observe(time.perf_counter() - started)
     return f"{base64.b64encode(salt).decode()}:{base64.b64encode(digest).decode()}"
 
 
@@ -33,5 +40,52 @@ def verify_password(password: str, stored_hash: str) -> bool:
     """Verify *password* against the stored hash."""
 
     salt, digest = _split(stored_hash)
+    started = time.perf_counter()
     check = hashlib.pbkdf2_hmac(_ALGORITHM, password.encode("utf-8"), salt, _ITERATIONS)
+    PBKDF2_SECONDS.observe(time.perf_counter() - started)
     return hmac.compare_digest(digest, check)
+
+
+def keyed_digest(secret: str, key: bytes) -> bytes:
+    """Return HMAC-SHA256 of *secret* under *key*.
+
+    Suitable for long random secrets such as API keys, which need no key
+    stretching, so verification costs microseconds instead of PBKDF2's
+    hundreds of milliseconds.
+    """
+
+    return hmac.new(key, secret.encode("utf-8"), hashlib.sha256).digest()
+
+
+class InvalidSecretError(RuntimeError):
+    """Raised when a secret file exists but does not hold a usable key."""
+
+
+def load_secret_file(path: Path) -> bytes:
+    """Return the random key stored in *path*, creating it readable only by the owner on first use.
+
+    The key is written and fsynced under a temporary name and then linked
+    into place, so a concurrent reader sees either no file or the whole key.
+    """
+
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, staging = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+        try:
+            with os.fdopen(fd, "w") as handle:
+                handle.write(os.urandom(32).hex())
+                handle.flush()
+                os.fsync(handle.fileno())
+            try:
+                os.link(staging, path)
+            except FileExistsError:  # another process created it first
+                pass
+        finally:
+            os.unlink(staging)
+    try:
+        key = bytes.fromhex(path.read_text().strip())
+    except ValueError as exc:
+        raise InvalidSecretError(f"{path} does not contain a hex encoded key") from exc
+    if not key:
+        raise InvalidSecretError(f"{path} is empty; delete it to generate a new key")
+    return key
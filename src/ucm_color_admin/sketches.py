@@ -0,0 +1,356 @@
+"""Streaming top-N and time-of-day heatmaps from mergeable SKU sketches.
+
+Every store and closed hour gets one :class:`SkuSketch`: a Count-Min sketch
+of units sold per SKU plus a small heavy-hitter list. The materialized view
+refresh updates the sketches as orders close. Because two sketches with the
+same shape merge by adding their counters, a region, a week or a
+weekday/hour heatmap cell is answered by folding bucket sketches into one.
+Memory stays bounded no matter how many SKUs or orders are involved.
+Estimates only over-count, by at most ``e / width`` of the units in the
+merged buckets; ``exact=true`` recomputes the same answer from order lines
+for validation. Both widen ``start`` and ``end`` to whole hours, the
+granularity of the buckets, so they count the same orders.
+"""
+
+from __future__ import annotations
+
+import math
+import struct
+import zlib
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from operator import add
+from typing import Iterable, Iterator, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import Integer, cast, delete, func, select, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .dependencies import get_read_db
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+WIDTH = 512
+DEPTH = 4
+CAPACITY = 20
+_HEADER = struct.Struct("<BHBHq")
+_VERSION = 1
+_SEPARATOR = "\x1f"
+_IN_CHUNK = 250
+
+Bucket = tuple[str, datetime]
+
+
+class SkuSketch:
+    """Count-Min sketch of units per SKU with a bounded heavy-hitter list."""
+
+    __slots__ = ("width", "depth", "capacity", "total", "counters", "heavy")
+
+    def __init__(self, width: int = WIDTH, depth: int = DEPTH, capacity: int = CAPACITY) -> None:
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self.total = 0
+        self.counters = array("q", bytes(8 * width * depth))
+        self.heavy: dict[str, int] = {}
+
+    def _cells(self, sku: str) -> list[int]:
+        digest = int.from_bytes(blake2b(sku.encode("utf-8"), digest_size=8).digest(), "little")
+        first, step, width = digest & 0xFFFFFFFF, (digest >> 32) | 1, self.width
+        return [row * width + (first + row * step) % width for row in range(self.depth)]
+
+    def add(self, sku: str, units: int = 1) -> None:
+        counters = self.counters
+        cells = self._cells(sku)
+        for cell in cells:
+            counters[cell] += units
+        self.total += units
+        self._offer(sku, min(counters[cell] for cell in cells))
+
+    def estimate(self, sku: str) -> int:
+        counters = self.counters
+        return min(counters[cell] for cell in self._cells(sku))
+
+    def error_bound(self) -> int:
+        """Upper bound on how far any estimate may exceed the true count."""
+
+        return math.ceil(math.e / self.width * self.total)
+
+    def _offer(self, sku: str, estimate: int) -> None:
+        heavy = self.heavy
+        if sku in heavy or len(heavy) < self.capacity:
+            heavy[sku] = estimate
+            return
+        smallest = min(heavy, key=heavy.__getitem__)
+        if estimate > heavy[smallest]:
+            del heavy[smallest]
+            heavy[sku] = estimate
+
+    def merge(self, other: "SkuSketch") -> "SkuSketch":
+        """Add *other* into this sketch in place and return it."""
+
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge sketches of different shapes")
+        self.counters = array("q", map(add, self.counters, other.counters))
+        self.total += other.total
+        candidates = {sku: self.estimate(sku) for sku in self.heavy.keys() | other.heavy.keys()}
+        self.heavy = dict(sorted(candidates.items(), key=lambda item: -item[1])[: self.capacity])
+        return self
+
+    def top(self, limit: int) -> list[tuple[str, int]]:
+        estimates = ((sku, self.estimate(sku)) for sku in self.heavy)
+        return sorted(estimates, key=lambda item: (-item[1], item[0]))[:limit]
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(_VERSION, self.width, self.depth, self.capacity, self.total)
+        return zlib.compress(header + self.counters.tobytes() + _SEPARATOR.join(self.heavy).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "SkuSketch":
+        raw = zlib.decompress(payload)
+        version, width, depth, capacity, total = _HEADER.unpack_from(raw)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported sketch version {version}")
+        sketch = cls(width, depth, capacity)
+        sketch.total = total
+        offset = _HEADER.size + 8 * width * depth
+        sketch.counters = array("q", raw[_HEADER.size:offset])
+        names = raw[offset:].decode("utf-8")
+        sketch.heavy = {sku: sketch.estimate(sku) for sku in names.split(_SEPARATOR)} if names else {}
+        return sketch
+
+
+def record(db: Session, units: dict[Bucket, dict[str, int]]) -> None:
+    """Add units sold per SKU into the (store, hour) sketches; does not commit."""
+
+    if not units:
+        return
+    bucket = models.SketchBucket
+    keys = list(units)
+    sketches: dict[Bucket, SkuSketch] = {}
+    for start in range(0, len(keys), _IN_CHUNK):
+        chunk = keys[start:start + _IN_CHUNK]
+        for row in db.execute(
+            select(bucket.store_id, bucket.hour, bucket.payload).where(tuple_(bucket.store_id, bucket.hour).in_(chunk))
+        ):
+            sketches[(row.store_id, row.hour)] = SkuSketch.from_bytes(row.payload)
+    rows = []
+    for key, counts in units.items():
+        sketch = sketches.get(key) or SkuSketch()
+        for sku, quantity in counts.items():
+            sketch.add(sku, quantity)
+        rows.append({"store_id": key[0], "hour": key[1], "payload": sketch.to_bytes()})
+    statement = insert(bucket)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[bucket.store_id, bucket.hour], set_={"payload": statement.excluded.payload}
+        ),
+        rows,
+    )
+
+
+def prune(db: Session, before: datetime) -> int:
+    """Drop sketches for hours before *before*; does not commit."""
+
+    return db.execute(delete(models.SketchBucket).where(models.SketchBucket.hour < before)).rowcount
+
+
+def _store_ids(db: Session, store_id: Optional[str], region: Optional[str]) -> Optional[list[str]]:
+    if store_id is not None:
+        return [store_id]
+    if region is not None:
+        return list(db.scalars(select(models.Store.store_id).where(models.Store.region == region)))
+    return None
+
+
+def _buckets(
+    db: Session, start: datetime, end: datetime, stores: Optional[list[str]]
+) -> Iterator[tuple[datetime, SkuSketch]]:
+    bucket = models.SketchBucket
+    statement = select(bucket.hour, bucket.payload).where(bucket.hour >= start, bucket.hour < end)
+    if stores is not None:
+        statement = statement.where(bucket.store_id.in_(stores))
+    for row in db.execute(statement.execution_options(yield_per=500)):
+        yield row.hour, SkuSketch.from_bytes(row.payload)
+
+
+def _units(sketch: SkuSketch, limit: int) -> list[schemas.SkuUnits]:
+    error = sketch.error_bound()
+    return [schemas.SkuUnits(sku=sku, quantity=quantity, error=error) for sku, quantity in sketch.top(limit)]
+
+
+def _exact_lines(start: datetime, end: datetime, stores: Optional[list[str]], sku: Optional[str]):
+    order, line = models.Order, models.OrderLine
+    statement = (
+        select()
+        .select_from(line)
+        .join(order, order.id == line.order_id)
+        .where(order.closed_at >= start, order.closed_at < end)
+    )
+    if stores is not None:
+        statement = statement.where(order.store_id.in_(stores))
+    if sku is not None:
+        statement = statement.where(line.sku == sku)
+    return statement
+
+
+def _whole_hours(start: datetime, end: datetime) -> tuple[datetime, datetime]:
+    """Widen ``[start, end)`` to hour boundaries, the granularity of the sketch buckets."""
+
+    start = start.replace(minute=0, second=0, microsecond=0)
+    floor = end.replace(minute=0, second=0, microsecond=0)
+    return start, floor if floor == end else floor + timedelta(hours=1)
+
+
+def heatmap(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    *,
+    store_id: Optional[str] = None,
+    region: Optional[str] = None,
+    sku: Optional[str] = None,
+    limit: int = 5,
+    exact: bool = False,
+) -> schemas.Heatmap:
+    """Units sold per weekday (0 = Monday) and hour, with each cell's top SKUs.
+
+    With *sku* set, each cell reports that SKU's units instead.
+    """
+
+    start, end = _whole_hours(start, end)
+    stores = _store_ids(db, store_id, region)
+    cells: dict[tuple[int, int], tuple[int, list[schemas.SkuUnits]]] = {}
+    if stores == []:
+        cells = {}
+    elif exact:
+        order, line = models.Order, models.OrderLine
+        weekday = (cast(func.strftime("%w", order.closed_at), Integer) + 6) % 7
+        hour = cast(func.strftime("%H", order.closed_at), Integer)
+        statement = _exact_lines(start, end, stores, sku).add_columns(
+            weekday.label("weekday"), hour.label("hour"), line.sku, func.sum(line.quantity).label("quantity")
+        ).group_by(weekday, hour, line.sku)
+        grouped: dict[tuple[int, int], list[tuple[str, int]]] = defaultdict(list)
+        for row in db.execute(statement):
+            grouped[(row.weekday, row.hour)].append((row.sku, row.quantity))
+        for key, counts in grouped.items():
+            counts.sort(key=lambda item: (-item[1], item[0]))
+            top = [] if sku else [schemas.SkuUnits(sku=name, quantity=quantity) for name, quantity in counts[:limit]]
+            cells[key] = (sum(quantity for _, quantity in counts), top)
+    elif sku is not None:
+        totals: dict[tuple[int, int], int] = defaultdict(int)
+        for hour, sketch in _buckets(db, start, end, stores):
+            totals[(hour.weekday(), hour.hour)] += sketch.estimate(sku)
+        cells = {key: (quantity, []) for key, quantity in totals.items() if quantity}
+    else:
+        merged: dict[tuple[int, int], SkuSketch] = {}
+        for hour, sketch in _buckets(db, start, end, stores):
+            key = (hour.weekday(), hour.hour)
+            merged[key] = merged[key].merge(sketch) if key in merged else sketch
+        cells = {key: (sketch.total, _units(sketch, limit)) for key, sketch in merged.items() if sketch.total}
+    return schemas.Heatmap(
+        start=start,
+        end=end,
+        store_id=store_id,
+        region=region,
+        sku=sku,
+        exact=exact,
+        cells=[
+            schemas.HeatmapCell(weekday=weekday, hour=hour, quantity=quantity, top=top)
+            for (weekday, hour), (quantity, top) in sorted(cells.items())
+        ],
+    )
+
+
+def top_skus(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    *,
+    store_id: Optional[str] = None,
+    region: Optional[str] = None,
+    hours: Iterable[int] = (),
+    limit: int = 10,
+    exact: bool = False,
+) -> schemas.TopSkus:
+    """Best selling SKUs by units, optionally only for some hours of the day."""
+
+    start, end = _whole_hours(start, end)
+    stores = _store_ids(db, store_id, region)
+    wanted = set(hours)
+    items: list[schemas.SkuUnits] = []
+    if stores == []:
+        items = []
+    elif exact:
+        order, line = models.Order, models.OrderLine
+        quantity = func.sum(line.quantity).label("quantity")
+        statement = _exact_lines(start, end, stores, None).add_columns(line.sku, quantity)
+        if wanted:
+            statement = statement.where(cast(func.strftime("%H", order.closed_at), Integer).in_(wanted))
+        statement = statement.group_by(line.sku).order_by(quantity.desc(), line.sku).limit(limit)
+        items = [schemas.SkuUnits(sku=row.sku, quantity=row.quantity) for row in db.execute(statement)]
+    else:
+        merged: Optional[SkuSketch] = None
+        for hour, sketch in _buckets(db, start, end, stores):
+            if wanted and hour.hour not in wanted:
+                continue
+            merged = sketch if merged is None else merged.merge(sketch)
+        items = _units(merged, limit) if merged is not None else []
+    return schemas.TopSkus(start=start, end=end, store_id=store_id, region=region, exact=exact, items=items)
+
+
+def _window(start: Optional[datetime], end: Optional[datetime]) -> tuple[datetime, datetime]:
+    end = end or datetime.utcnow()
+    return start or end - timedelta(days=7), end
+
+
+@router.get("/heatmap", response_model=schemas.Heatmap)
+def heatmap_endpoint(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    store_id: Optional[str] = None,
+    region: Optional[str] = None,
+    sku: Optional[str] = None,
+    limit: int = 5,
+    exact: bool = False,
+    db: Session = Depends(get_read_db),
+):
+    if store_id is not None and region is not None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Pass store_id or region, not both")
+    start, end = _window(start, end)
+    return heatmap(
+        db, start, end, store_id=store_id, region=region, sku=sku, limit=min(max(limit, 0), CAPACITY), exact=exact
+    )
+
+
+@router.get("/top-skus", response_model=schemas.TopSkus)
+def top_skus_endpoint(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    store_id: Optional[str] = None,
+    region: Optional[str] = None,
+    hour: list[int] = Query(default=[]),
+    limit: int = 10,
+    exact: bool = False,
+    db: Session = Depends(get_read_db),
+):
+    if store_id is not None and region is not None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Pass store_id or region, not both")
+    start, end = _window(start, end)
+    return top_skus(
+        db, start, end, store_id=store_id, region=region, hours=hour, limit=min(max(limit, 1), CAPACITY), exact=exact
+    )
+
+
+__all__ = [
+    "SkuSketch",
+    "heatmap",
+    "prune",
+    "record",
+    "router",
+    "top_skus",
+]
@@ -0,0 +1,31 @@
+"""Store master data (name and region) used by BI grouping."""
+
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .dependencies import get_db
+
+router = APIRouter(prefix="/stores", tags=["stores"])
+
+
+@router.get("", response_model=list[schemas.StoreRead])
+def list_stores(db: Session = Depends(get_db)):
+    return list(db.scalars(select(models.Store).order_by(models.Store.store_id)))
+
+
+@router.put("/{store_id}", response_model=schemas.StoreRead)
+def upsert_store(store_id: str, payload: schemas.StoreUpdate, db: Session = Depends(get_db)):
+    store = db.get(models.Store, store_id) or models.Store(store_id=store_id)
+    store.name = payload.name
+    store.region = payload.region
+    db.add(store)
+    db.commit()
+    db.refresh(store)
+    return store
+
+
+__all__ = ["router"]
@@ -0,0 +1,272 @@
+"""Failed-login throttling per client IP and per username.
+
+Every password check costs a full PBKDF2 computation, so a burst of
+guesses would keep every core busy. :func:`get_login_throttle` returns a
+:class:`LoginThrottle` that the login form consults *before* verifying a
+password: once an IP address or a username has collected too many
+failures within ``UCM_COLOR_LOGIN_WINDOW_SECONDS`` the attempt is rejected
+without hashing anything.
+
+The check and the count are one atomic step: every admitted attempt takes
+a slot up front, before its password is hashed, so concurrent guesses
+cannot all pass the check while the first one is still hashing. A failed
+attempt simply keeps its slot; a successful one hands its address slot
+back and clears its username's count.
+
+Failures are counted with a sliding window approximated from two fixed
+windows (the previous window's count weighted by how much of it still
+overlaps, plus the current count), which needs three integers per key.
+By default the counters live in memory, one set per server process, and
+the least recently used keys are evicted beyond ``MAX_KEYS``; with
+``UCM_COLOR_LOGIN_THROTTLE_SHARED=true`` they are kept in the
+``login_throttle`` table so every worker sees the same counts.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Protocol
+
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import metrics, models
+from .config import Settings, get_settings
+from .database import get_engine
+
+__all__ = [
+    "LoginThrottle",
+    "MAX_KEYS",
+    "Rejection",
+    "SlidingWindowCounter",
+    "SqliteWindowCounter",
+    "get_login_throttle",
+]
+
+#: Keys remembered per scope by the in-memory counters.
+MAX_KEYS = 100_000
+_PRUNE_EVERY = 1000
+
+
+def _estimate(state: tuple[int, int, int], index: int, fraction: float) -> tuple[float, int, int]:
+    """Return the weighted count and the (current, previous) counts rolled to window ``index``."""
+
+    window, current, previous = state
+    if window == index - 1:
+        current, previous = 0, current
+    elif window != index:
+        current, previous = 0, 0
+    return previous * (1 - fraction) + current, current, previous
+
+
+def _retry_after(limit: int, current: int, previous: int, fraction: float, seconds: int) -> float:
+    if current >= limit or not previous:
+        return (1 - fraction) * seconds
+    # The previous window's weight decays linearly; find when the estimate drops below the limit.
+    return max((1 - (limit - current) / previous - fraction) * seconds, 0.0)
+
+
+class _Counter(Protocol):
+    def acquire(self, key: str, now: float) -> float: ...
+
+    def release(self, key: str, now: float) -> None: ...
+
+    def reset(self, key: str) -> None: ...
+
+
+class SlidingWindowCounter:
+    """Per-key failure counts held in memory with LRU eviction."""
+
+    def __init__(self, limit: int, seconds: int, max_keys: int = MAX_KEYS) -> None:
+        self.limit = limit
+        self.seconds = seconds
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._windows: OrderedDict[str, tuple[int, int, int]] = OrderedDict()
+
+    def _position(self, now: float) -> tuple[int, float]:
+        index, offset = divmod(now, self.seconds)
+        return int(index), offset / self.seconds
+
+    def acquire(self, key: str, now: float) -> float:
+        """Count an attempt for ``key`` and return ``0``, or the seconds to wait if it is over the limit."""
+
+        index, fraction = self._position(now)
+        with self._lock:
+            state = self._windows.pop(key, (index, 0, 0))
+            estimate, current, previous = _estimate(state, index, fraction)
+            if self.limit > 0 and estimate >= self.limit:
+                self._windows[key] = state
+                return _retry_after(self.limit, current, previous, fraction, self.seconds)
+            self._windows[key] = (index, current + 1, previous)
+            if len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+        return 0.0
+
+    def release(self, key: str, now: float) -> None:
+        """Give back an attempt counted by :meth:`acquire`."""
+
+        index, _ = self._position(now)
+        with self._lock:
+            state = self._windows.get(key)
+            if state is not None and state[0] >= index - 1 and state[1] > 0:
+                self._windows[key] = (state[0], state[1] - 1, state[2])
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._windows.pop(key, None)
+
+
+class SqliteWindowCounter:
+    """The same counts kept in the ``login_throttle`` table, shared by all workers."""
+
+    def __init__(self, scope: str, limit: int, seconds: int) -> None:
+        self.scope = scope
+        self.limit = limit
+        self.seconds = seconds
+        self._writes = 0
+
+    def _position(self, now: float) -> tuple[int, float]:
+        index, offset = divmod(now, self.seconds)
+        return int(index), offset / self.seconds
+
+    def _load(self, connection, key: str) -> Optional[tuple[int, int, int]]:
+        table = models.LoginThrottleWindow
+        row = connection.execute(
+            select(table.window, table.current, table.previous).where(table.scope == self.scope, table.key == key)
+        ).first()
+        return tuple(row) if row is not None else None
+
+    def acquire(self, key: str, now: float) -> float:
+        index, fraction = self._position(now)
+        table = models.LoginThrottleWindow
+        # Roll the stored window forward and count the attempt in one statement, so that
+        # SQLite's write lock makes the limit check and the increment atomic across workers.
+        rolled_current = case((table.window == index, table.current), else_=0)
+        rolled_previous = case(
+            (table.window == index, table.previous),
+            (table.window == index - 1, table.current),
+            else_=0,
+        )
+        statement = (
+            sqlite_insert(table)
+            .values(scope=self.scope, key=key, window=index, current=1, previous=0)
+            .on_conflict_do_update(
+                index_elements=[table.scope, table.key],
+                set_={"window": index, "current": rolled_current + 1, "previous": rolled_previous},
+                where=(rolled_previous * (1 - fraction) + rolled_current < self.limit) if self.limit > 0 else None,
+            )
+        )
+        with get_engine().begin() as connection:
+            admitted = connection.execute(statement).rowcount > 0
+            if not admitted:
+                state = self._load(connection, key)
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 0:
+                # Rows two windows old no longer contribute to any estimate.
+                connection.execute(delete(table).where(table.scope == self.scope, table.window < index - 1))
+        if admitted or state is None:
+            return 0.0
+        _, current, previous = _estimate(state, index, fraction)
+        return _retry_after(self.limit, current, previous, fraction, self.seconds)
+
+    def release(self, key: str, now: float) -> None:
+        index, _ = self._position(now)
+        table = models.LoginThrottleWindow
+        with get_engine().begin() as connection:
+            connection.execute(
+                update(table)
+                .where(
+                    table.scope == self.scope,
+                    table.key == key,
+                    table.window >= index - 1,
+                    table.current > 0,
+                )
+                .values(current=table.current - 1)
+            )
+
+    def reset(self, key: str) -> None:
+        table = models.LoginThrottleWindow
+        with get_engine().begin() as connection:
+            connection.execute(delete(table).where(table.scope == self.scope, table.key == key))
+
+
+@dataclass(frozen=True, slots=True)
+class Rejection:
+    scope: str
+    retry_after: int
+
+
+class LoginThrottle:
+    """Failure limits for one client address and for one username."""
+
+    def __init__(self, by_ip: _Counter, by_user: _Counter) -> None:
+        self.by_ip = by_ip
+        self.by_user = by_user
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "LoginThrottle":
+        seconds = max(settings.login_window_seconds, 1)
+        if settings.login_throttle_shared:
+            return cls(
+                SqliteWindowCounter("ip", settings.login_max_failures_per_ip, seconds),
+                SqliteWindowCounter("user", settings.login_max_failures_per_user, seconds),
+            )
+        return cls(
+            SlidingWindowCounter(settings.login_max_failures_per_ip, seconds),
+            SlidingWindowCounter(settings.login_max_failures_per_user, seconds),
+        )
+
+    def check(self, ip: Optional[str], username: str) -> Optional[Rejection]:
+        """Take a slot for an attempt, or return why it must be refused.
+
+        An admitted attempt counts as a failure until :meth:`succeeded`
+        says otherwise, so call this before the password is hashed.
+        """
+
+        now = time.time()
+        if ip:
+            wait = self.by_ip.acquire(ip, now)
+            if wait:
+                metrics.LOGIN_ATTEMPTS.inc("throttled_ip")
+                return Rejection("ip", math.ceil(wait))
+        wait = self.by_user.acquire(_normalize(username), now)
+        if wait:
+            if ip:
+                self.by_ip.release(ip, now)
+            metrics.LOGIN_ATTEMPTS.inc("throttled_user")
+            return Rejection("user", math.ceil(wait))
+        return None
+
+    def failed(self, ip: Optional[str], username: str) -> None:
+        # The slot taken by check() already counts this failure.
+        metrics.LOGIN_ATTEMPTS.inc("failure")
+
+    def succeeded(self, ip: Optional[str], username: str) -> None:
+        # The address only gets this attempt's slot back, not its earlier failures:
+        # one valid account must not unlock guessing at others.
+        metrics.LOGIN_ATTEMPTS.inc("success")
+        if ip:
+            self.by_ip.release(ip, time.time())
+        self.by_user.reset(_normalize(username))
+
+
+def _normalize(username: str) -> str:
+    return username.strip().lower()[:255]
+
+
+_throttle: Optional[LoginThrottle] = None
+_throttle_lock = threading.Lock()
+
+
+def get_login_throttle() -> LoginThrottle:
+    global _throttle
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                _throttle = LoginThrottle.from_settings(get_settings())
+    return _throttle
@@ -2,24 +2,51 @@
 
 from __future__ import annotations
 
+import hashlib
 from dataclasses import dataclass
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional
 from urllib.parse import quote_plus
 
 from fastapi import APIRouter, Depends, Form, Request, status
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache, pass_context
+from markupsafe import Markup
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
-from . import crud, schemas
+from . import __version__, audit, crud, exports, jobs, models, rbac, schemas, sketches, throttle
+from .config import get_settings
 from .dependencies import get_db
 
 router = APIRouter(prefix="/web", include_in_schema=False)
 _templates_dir = Path(__file__).with_name("templates")
-templates = Jinja2Templates(directory=str(_templates_dir))
-_SESSION_COOKIE = "ucm_color_admin_user"
-_SESSION_AGE = 60 * 60 * 8  # 8 hours
+
+
+def _bytecode_cache() -> Optional[FileSystemBytecodeCache]:
+    """Keep compiled templates under the data directory so restarts skip compilation."""
+
+    directory = get_settings().data_dir / "template-cache"
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+    except OSError:  # pragma: no cover - read-only data directory
+        return None
+    return FileSystemBytecodeCache(str(directory))
+
+
+templates = Jinja2Templates(directory=str(_templates_dir), bytecode_cache=_bytecode_cache())
+_SESSION_COOKIE = rbac.SESSION_COOKIE
+_SESSION_AGE = rbac.SESSION_MAX_AGE
+# Changes whenever the package or any template does, so stale validators never match.
+_TEMPLATES_VERSION = hashlib.blake2b(
+    repr(
+        (__version__, sorted((path.name, path.stat().st_mtime_ns) for path in _templates_dir.glob("*.html")))
+    ).encode(),
+    digest_size=8,
+).hexdigest()
+_FRAGMENT_LIMIT = 1024
 
 _CATALOG_SAMPLE = [
     {
@@ -124,6 +151,12 @@ _MODULES: list[Module] = [
             "会员的等级设和优惠设置",
             "会员清费历史记录",
         ],
+        menu=(
+            MenuItem(
+                label="会员",
+                children=(MenuItem(label="导出申请", href="/web/exports"),),
+            ),
+        ),
     ),
     Module(
         id="orders",
@@ -145,6 +178,12 @@ _MODULES: list[Module] = [
             "报表与看板：销售额、客单价、UPT、毛利（估）、TOPN 商品/时段热力",
             "门店/区域多维透视：store_id 分区 + 物化视图刷新（分钟级）",
         ],
+        menu=(
+            MenuItem(
+                label="报表",
+                children=(MenuItem(label="时段热力", href="/web/heatmap"),),
+            ),
+        ),
     ),
     Module(
         id="system",
@@ -155,20 +194,94 @@ _MODULES: list[Module] = [
             "任务：导入任务、批处理、定时刷新",
             "用户登录和验证",
         ],
+        menu=(
+            MenuItem(
+                label="系统",
+                children=(MenuItem(label="后台任务", href="/web/jobs"),),
+            ),
+        ),
     ),
 ]
 
 
+_fragments: dict[tuple[str, str, int], Markup] = {}
+
+
+def _role_key(principal: Optional[rbac.Principal]) -> int:
+    if principal is None:
+        return 0
+    return rbac.ALL_PERMISSIONS if principal.is_superuser else principal.mask
+
+
+@pass_context
+def _fragment(context, name: str) -> Markup:
+    """Render ``_<name>.html`` once per active module and role.
+
+    ``_MODULES`` never changes at runtime, so the navigation and checklist
+    markup only varies with the highlighted module and, potentially, the
+    caller's permissions.
+    """
+
+    active_module = context.get("active_module") or "dashboard"
+    request = context.get("request")
+    role = _role_key(getattr(request.state, "principal", None) if request is not None else None)
+    key = (name, active_module, role)
+    html = _fragments.get(key)
+    if html is None:
+        template = templates.get_template(f"_{name}.html")
+        html = Markup(template.render(modules=_MODULES, active_module=active_module, role=role))
+        if len(_fragments) < _FRAGMENT_LIMIT:
+            _fragments[key] = html
+    return html
+
+
+templates.env.globals["fragment"] = _fragment
+
+
 def _current_user(request: Request, db: Session) -> Optional[schemas.UserRead]:
-    username = request.cookies.get(_SESSION_COOKIE)
+    username = rbac.session_username(request)
     if not username:
         return None
     user = crud.get_user_by_username(db, username)
     if not user:
         return None
+    request.state.actor = user.username
+    rbac.authenticate(request, db)
     return schemas.UserRead.model_validate(user)
 
 
+def _etag(request: Request, user: schemas.UserRead, *data_version: object) -> str:
+    """Weak validator covering everything a page renders from."""
+
+    principal = getattr(request.state, "principal", None)
+    parts = (_TEMPLATES_VERSION, request.url.path, request.url.query, user.username, _role_key(principal), data_version)
+    return 'W/"%s"' % hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def _cache_headers(etag: str) -> dict[str, str]:
+    # Browsers must revalidate every time; an unchanged page costs a 304.
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    candidates = {candidate.strip() for candidate in header.split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+    return None
+
+
+def _users_version(db: Session) -> tuple:
+    return tuple(db.execute(select(func.count(models.User.id), func.max(models.User.updated_at))).one())
+
+
+def _allowed(request: Request, db: Session, permission: str) -> bool:
+    principal = rbac.authenticate(request, db)
+    return principal is not None and principal.allows(rbac.permission_mask((permission,)))
+
+
 @router.get("/login", response_class=HTMLResponse)
 def login_page(request: Request, message: str | None = None, db: Session = Depends(get_db)):
     current_user = _current_user(request, db)
@@ -192,17 +305,39 @@ def login_submit(
     password: str = Form(...),
     db: Session = Depends(get_db),
 ):
+    limiter = throttle.get_login_throttle()
+    client_ip = request.client.host if request.client else None
+    # Take a slot before authenticate_user so a flood of guesses, even concurrent ones,
+    # never reaches PBKDF2 beyond the limit.
+    rejection = limiter.check(client_ip, username)
+    if rejection is not None:
+        audit.record_request(
+            request,
+            "auth.login_throttled",
+            target_type="user",
+            detail={"username": username, "scope": rejection.scope},
+        )
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": "登录失败次数过多，请稍后再试", "message": None},
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(rejection.retry_after)},
+        )
     user = crud.authenticate_user(db, username=username, password=password)
     if not user:
+        limiter.failed(client_ip, username)
+        audit.record_request(request, "auth.login_failed", target_type="user", detail={"username": username})
         return templates.TemplateResponse(
             "login.html",
             {"request": request, "error": "用户名或密码错误", "message": None},
             status_code=status.HTTP_401_UNAUTHORIZED,
         )
+    limiter.succeeded(client_ip, username)
+    audit.record_request(request, "auth.login", actor=user.username, target_type="user", target_id=user.id)
     response = RedirectResponse(url="/web/dashboard", status_code=status.HTTP_303_SEE_OTHER)
     response.set_cookie(
         key=_SESSION_COOKIE,
-        value=user.username,
+        value=rbac.sign_session(user.username),
         httponly=True,
         samesite="lax",
         max_age=_SESSION_AGE,
@@ -211,7 +346,10 @@ def login_submit(
 
 
 @router.get("/logout")
-def logout() -> RedirectResponse:
+def logout(request: Request) -> RedirectResponse:
+    username = rbac.session_username(request)
+    if username:
+        audit.record_request(request, "auth.logout", actor=username, target_type="user")
     response = RedirectResponse(url="/web/login", status_code=status.HTTP_303_SEE_OTHER)
     response.delete_cookie(_SESSION_COOKIE)
     return response
@@ -234,6 +372,10 @@ def dashboard(request: Request, db: Session = Depends(get_db)):
     module_ids = {module.id for module in _MODULES}
     if active_module not in module_ids:
         active_module = _MODULES[0].id
+    etag = _etag(request, user)
+    cached = _not_modified(request, etag)
+    if cached is not None:
+        return cached
     return templates.TemplateResponse(
         "dashboard.html",
         {
@@ -242,6 +384,7 @@ def dashboard(request: Request, db: Session = Depends(get_db)):
             "active_module": active_module,
             "current_user": user,
         },
+        headers=_cache_headers(etag),
     )
 
 
@@ -250,6 +393,10 @@ def catalog_page(request: Request, q: str | None = None, db: Session = Depends(g
     user = _current_user(request, db)
     if not user:
         return RedirectResponse(url="/web/login?error=login_required", status_code=status.HTTP_303_SEE_OTHER)
+    etag = _etag(request, user)
+    cached = _not_modified(request, etag)
+    if cached is not None:
+        return cached
     query = (q or "").strip().lower()
     products = [
         product
@@ -269,6 +416,7 @@ def catalog_page(request: Request, q: str | None = None, db: Session = Depends(g
             "modules": _MODULES,
             "active_module": "catalog",
         },
+        headers=_cache_headers(etag),
     )
 
 
@@ -293,6 +441,10 @@ def forms_page(request: Request, message: str | None = None, db: Session = Depen
     user = _current_user(request, db)
     if not user:
         return RedirectResponse(url="/web/login?error=login_required", status_code=status.HTTP_303_SEE_OTHER)
+    etag = _etag(request, user, _users_version(db))
+    cached = _not_modified(request, etag)
+    if cached is not None:
+        return cached
     users = crud.list_users(db, limit=200)
     return templates.TemplateResponse(
         "forms.html",
@@ -304,6 +456,7 @@ def forms_page(request: Request, message: str | None = None, db: Session = Depen
             "modules": _MODULES,
             "active_module": "forms",
         },
+        headers=_cache_headers(etag),
     )
 
 
@@ -329,6 +482,8 @@ def create_user(
 ):
     if not _current_user(request, db):
         return RedirectResponse(url="/web/login?error=login_required", status_code=status.HTTP_303_SEE_OTHER)
+    if not _allowed(request, db, "users:write"):
+        return _redirect_with_message("没有权限执行该操作")
     payload = schemas.UserCreate(
         username=username,
         password=password,
@@ -338,10 +493,18 @@ def create_user(
         is_superuser=_bool_from_form(is_superuser),
     )
     try:
-        crud.create_user(db, payload)
+        created = crud.create_user(db, payload)
         msg = "成功创建用户"
     except crud.DuplicateUsernameError:
         msg = "用户名已存在"
+    else:
+        audit.record_request(
+            request,
+            "user.create",
+            target_type="user",
+            target_id=created.id,
+            detail={"username": created.username, "is_superuser": created.is_superuser},
+        )
     return _redirect_with_message(msg)
 
 
@@ -358,6 +521,8 @@ def update_user(
 ):
     if not _current_user(request, db):
         return RedirectResponse(url="/web/login?error=login_required", status_code=status.HTTP_303_SEE_OTHER)
+    if not _allowed(request, db, "users:write"):
+        return _redirect_with_message("没有权限执行该操作")
     user = crud.get_user(db, user_id)
     if not user:
         return _redirect_with_message("用户不存在")
@@ -369,6 +534,7 @@ def update_user(
         password=password or None,
     )
     crud.update_user(db, user, payload)
+    audit.record_request(request, "user.update", target_type="user", target_id=user_id, detail=audit.user_changes(payload))
     return _redirect_with_message("用户已更新")
 
 
@@ -380,10 +546,128 @@ def delete_user(
 ):
     if not _current_user(request, db):
         return RedirectResponse(url="/web/login?error=login_required", status_code=status.HTTP_303_SEE_OTHER)
+    if not _allowed(request, db, "users:write"):
+        return _redirect_with_message("没有权限执行该操作")
     user = crud.get_user(db, user_id)
     if not user:
         msg = "用户不存在"
     else:
+        username = user.username
         crud.delete_user(db, user)
+        audit.record_request(request, "user.delete", target_type="user", target_id=user_id, detail={"username": username})
         msg = "用户已删除"
     return _redirect_with_message(msg)
+
+
+@router.get("/exports", response_class=HTMLResponse)
+def exports_page(request: Request, message: str | None = None, db: Session = Depends(get_db)):
+    user = _current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/web/login?error=login_required", status_code=status.HTTP_303_SEE_OTHER)
+    principal = getattr(request.state, "principal", None)
+    return templates.TemplateResponse(
+        "exports.html",
+        {
+            "request": request,
+            "jobs": exports.list_exports(db, limit=100, requested_by=exports.visible_owner(principal)),
+            "message": message,
+            "current_user": user,
+            "can_export_unmasked": exports.may_export_unmasked(principal),
+            "modules": _MODULES,
+            "active_module": "crm",
+        },
+    )
+
+
+@router.post("/exports")
+def request_export(
+    request: Request,
+    masked: str = Form("true"),
+    db: Session = Depends(get_db),
+):
+    user = _current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/web/login?error=login_required", status_code=status.HTTP_303_SEE_OTHER)
+    principal = getattr(request.state, "principal", None)
+    job = exports.submit_export(
+        db,
+        schemas.ExportJobCreate(masked=_bool_from_form(masked) or not exports.may_export_unmasked(principal)),
+        user.username,
+    )
+    message = quote_plus(f"导出申请 #{job.id} 已提交")
+    return RedirectResponse(url=f"/web/exports?message={message}", status_code=status.HTTP_303_SEE_OTHER)
+
+
+_WEEKDAYS = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+
+
+@router.get("/heatmap", response_class=HTMLResponse)
+def heatmap_page(
+    request: Request,
+    days: int = 7,
+    store_id: str | None = None,
+    region: str | None = None,
+    sku: str | None = None,
+    exact: bool = False,
+    db: Session = Depends(get_db),
+):
+    user = _current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/web/login?error=login_required", status_code=status.HTTP_303_SEE_OTHER)
+    end = datetime.utcnow()
+    days = min(max(days, 1), 366)
+    filters = {"store_id": store_id or None, "region": None if store_id else region or None, "sku": sku or None}
+    result = sketches.heatmap(db, end - timedelta(days=days), end, exact=exact, **filters)
+    top = sketches.top_skus(
+        db, result.start, end, store_id=filters["store_id"], region=filters["region"], exact=exact
+    )
+    grid = {(cell.weekday, cell.hour): cell for cell in result.cells}
+    return templates.TemplateResponse(
+        "heatmap.html",
+        {
+            "request": request,
+            "heatmap": result,
+            "grid": grid,
+            "peak": max((cell.quantity for cell in result.cells), default=0),
+            "top": top,
+            "days": days,
+            "weekdays": _WEEKDAYS,
+            "current_user": user,
+            "modules": _MODULES,
+            "active_module": "marketing",
+        },
+    )
+
+
+@router.get("/jobs", response_class=HTMLResponse)
+def jobs_page(request: Request, message: str | None = None, db: Session = Depends(get_db)):
+    user = _current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/web/login?error=login_required", status_code=status.HTTP_303_SEE_OTHER)
+    if not _allowed(request, db, "jobs:manage"):
+        return RedirectResponse(url="/web/dashboard?module=system", status_code=status.HTTP_303_SEE_OTHER)
+    return templates.TemplateResponse(
+        "jobs.html",
+        {
+            "request": request,
+            "jobs": jobs.list_jobs(db, limit=100),
+            "schedules": list(db.scalars(select(models.JobSchedule).order_by(models.JobSchedule.name))),
+            "message": message,
+            "current_user": user,
+            "modules": _MODULES,
+            "active_module": "system",
+        },
+    )
+
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(request: Request, job_id: int, db: Session = Depends(get_db)):
+    user = _current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/web/login?error=login_required", status_code=status.HTTP_303_SEE_OTHER)
+    if not _allowed(request, db, "jobs:manage"):
+        message = quote_plus("没有权限执行该操作")
+        return RedirectResponse(url=f"/web/jobs?message={message}", status_code=status.HTTP_303_SEE_OTHER)
+    job = jobs.cancel_job(db, job_id)
+    message = quote_plus(f"任务 #{job_id} 已请求取消" if job else f"任务 #{job_id} 不存在")
+    return RedirectResponse(url=f"/web/jobs?message={message}", status_code=status.HTTP_303_SEE_OTHER)
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import delete
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _database(tmp_path_factory):
+    """Point the application at a throwaway data directory for the whole run."""
+
+    directory = tmp_path_factory.mktemp("ucm-color")
+    patch = pytest.MonkeyPatch()
+    patch.setenv("UCM_COLOR_DB", str(directory / "test.sqlite3"))
+    patch.setenv("UCM_COLOR_DATA_DIR", str(directory / "data"))
+    patch.setenv("UCM_COLOR_INSTALLER_DIR", str(directory / "installers"))
+    patch.setenv("UCM_COLOR_JOB_WORKERS", "0")
+
+    from ucm_color_admin.config import get_settings
+    from ucm_color_admin.database import init_database
+
+    get_settings.cache_clear()
+    init_database()
+    yield
+    patch.undo()
+    get_settings.cache_clear()
+
+
+@pytest.fixture
+def db():
+    from ucm_color_admin import models
+    from ucm_color_admin.database import SessionLocal
+
+    with SessionLocal() as session:
+        yield session
+    with SessionLocal() as session:
+        session.execute(delete(models.Job))
+        session.execute(delete(models.JobSchedule))
+        session.commit()
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from ucm_color_admin import jobs, models
+from ucm_color_admin.database import SessionLocal
+
+
+@jobs.handler("test.ok")
+def _ok(context: jobs.JobContext) -> dict[str, int]:
+    return {"attempt": context.attempt}
+
+
+@jobs.handler("test.fail", max_attempts=3)
+def _fail(context: jobs.JobContext) -> None:
+    raise ValueError(f"attempt {context.attempt}")
+
+
+@jobs.handler("test.cancel_self")
+def _cancel_self(context: jobs.JobContext) -> None:
+    with SessionLocal() as session:
+        jobs.cancel_job(session, context.job_id)
+    context.progress(0.5, "halfway")
+    raise AssertionError("progress() should have raised JobCancelledError")
+
+
+@jobs.handler("test.cancel_then_fail")
+def _cancel_then_fail(context: jobs.JobContext) -> None:
+    with SessionLocal() as session:
+        jobs.cancel_job(session, context.job_id)
+    raise ValueError("failed after cancellation was requested")
+
+
+def _reload(db, job_id: int) -> models.Job:
+    db.expire_all()
+    return db.get(models.Job, job_id)
+
+
+def _make_due(db, job_id: int) -> None:
+    job = db.get(models.Job, job_id)
+    job.run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+
+# Claiming
+
+
+def test_concurrent_claims_hand_a_job_to_exactly_one_worker(db):
+    job = jobs.enqueue(db, "test.ok")
+    start = threading.Barrier(8)
+    claimed = []
+
+    def claim(index: int) -> None:
+        with SessionLocal() as session:
+            start.wait()
+            row = jobs._claim(session, f"worker-{index}")
+        if row is not None:
+            claimed.append((index, row.id))
+
+    threads = [threading.Thread(target=claim, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(claimed) == 1
+    index, job_id = claimed[0]
+    assert job_id == job.id
+    stored = _reload(db, job.id)
+    assert stored.status == "running"
+    assert stored.locked_by == f"worker-{index}"
+    assert stored.attempts == 1
+
+
+def test_claim_prefers_priority_and_skips_future_jobs(db):
+    later = jobs.enqueue(db, "test.ok", run_at=datetime.utcnow() + timedelta(hours=1), priority=100)
+    low = jobs.enqueue(db, "test.ok", priority=0)
+    high = jobs.enqueue(db, "test.ok", priority=10)
+
+    assert jobs._claim(db, "w").id == high.id
+    assert jobs._claim(db, "w").id == low.id
+    assert jobs._claim(db, "w") is None
+    assert _reload(db, later.id).status == "queued"
+
+
+def test_run_next_records_the_result(db):
+    job = jobs.enqueue(db, "test.ok")
+
+    assert jobs.run_next("w") is True
+    assert jobs.run_next("w") is False
+
+    stored = _reload(db, job.id)
+    assert stored.status == "succeeded"
+    assert stored.result == '{"attempt": 1}'
+    assert stored.progress == 1.0
+    assert stored.locked_by is None
+    assert stored.finished_at is not None
+
+
+# Leases
+
+
+def test_expired_lease_is_requeued_and_claimed_again(db):
+    job = jobs.enqueue(db, "test.ok")
+    assert jobs._claim(db, "dead-worker").id == job.id
+
+    assert jobs.requeue_expired(db) == 0
+    assert jobs.requeue_expired(db, datetime.utcnow() + timedelta(seconds=jobs._LEASE_SECONDS + 1)) == 1
+
+    stored = _reload(db, job.id)
+    assert stored.status == "queued"
+    assert stored.locked_by is None
+    assert stored.lease_until is None
+
+    row = jobs._claim(db, "new-worker")
+    assert row.id == job.id
+    assert row.attempts == 2
+
+
+def test_worker_that_lost_its_lease_does_not_overwrite_the_new_owner(db):
+    job = jobs.enqueue(db, "test.ok")
+    jobs._claim(db, "old-worker")
+    jobs.requeue_expired(db, datetime.utcnow() + timedelta(seconds=jobs._LEASE_SECONDS + 1))
+    jobs._claim(db, "new-worker")
+
+    context = jobs.JobContext(job.id, "test.ok", {}, 1, "old-worker")
+    context.progress(0.9)
+
+    stored = _reload(db, job.id)
+    assert stored.locked_by == "new-worker"
+    assert stored.progress == 0.0
+
+
+# Retries
+
+
+def test_failures_back_off_exponentially_until_max_attempts(db):
+    job = jobs.enqueue(db, "test.fail")
+    delays = []
+    for _ in range(2):
+        before = datetime.utcnow()
+        assert jobs.run_next("w") is True
+        stored = _reload(db, job.id)
+        assert stored.status == "queued"
+        assert stored.finished_at is None
+        delays.append((stored.run_at - before).total_seconds())
+        # Not due yet: the backoff keeps it out of reach.
+        assert jobs.run_next("w") is False
+        _make_due(db, job.id)
+
+    assert delays[0] == pytest.approx(jobs._BACKOFF_SECONDS, abs=1)
+    assert delays[1] == pytest.approx(jobs._BACKOFF_SECONDS * 2, abs=1)
+
+    assert jobs.run_next("w") is True
+    stored = _reload(db, job.id)
+    assert stored.status == "failed"
+    assert stored.attempts == 3
+    assert stored.error == "ValueError: attempt 3"
+    assert stored.finished_at is not None
+
+
+def test_backoff_is_capped(db, monkeypatch):
+    monkeypatch.setattr(jobs, "_MAX_BACKOFF_SECONDS", 7)
+    job = jobs.enqueue(db, "test.fail", max_attempts=5)
+    for _ in range(3):
+        jobs.run_next("w")
+        _make_due(db, job.id)
+    before = datetime.utcnow()
+    jobs.run_next("w")
+    assert (_reload(db, job.id).run_at - before).total_seconds() == pytest.approx(7, abs=1)
+
+
+# Cancellation
+
+
+def test_cancelling_a_queued_job_stops_it_from_running(db):
+    job = jobs.enqueue(db, "test.ok")
+    cancelled = jobs.cancel_job(db, job.id)
+
+    assert cancelled.status == "cancelled"
+    assert cancelled.finished_at is not None
+    assert jobs.run_next("w") is False
+    assert _reload(db, job.id).attempts == 0
+
+
+def test_running_job_stops_at_its_next_progress_report(db):
+    job = jobs.enqueue(db, "test.cancel_self")
+
+    assert jobs.run_next("w") is True
+
+    stored = _reload(db, job.id)
+    assert stored.status == "cancelled"
+    assert stored.progress_message == "halfway"
+    assert stored.finished_at is not None
+
+
+def test_failed_job_with_cancellation_requested_is_not_retried(db):
+    job = jobs.enqueue(db, "test.cancel_then_fail")
+
+    assert jobs.run_next("w") is True
+
+    stored = _reload(db, job.id)
+    assert stored.status == "cancelled"
+    assert stored.attempts == 1
+
+
+def test_cancelling_a_finished_job_changes_nothing(db):
+    job = jobs.enqueue(db, "test.ok")
+    jobs.run_next("w")
+
+    assert jobs.cancel_job(db, job.id).status == "succeeded"
+    assert jobs.cancel_job(db, job.id + 1000) is None
+
+
+# Schedules
+
+
+def _make_schedule_due(db, name: str) -> None:
+    schedule = db.get(models.JobSchedule, name)
+    schedule.next_run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+
+def test_due_schedule_enqueues_once_and_skips_while_pending(db):
+    jobs.ensure_schedule(db, "test.every", "test.ok", "@every 1m")
+    assert jobs.enqueue_due(db) == 0
+
+    _make_schedule_due(db, "test.every")
+    assert jobs.enqueue_due(db) == 1
+    assert jobs.enqueue_due(db) == 0
+
+    # Due again, but the previous run has not finished yet.
+    _make_schedule_due(db, "test.every")
+    assert jobs.enqueue_due(db) == 0
+
+    assert jobs.run_next("w") is True
+    _make_schedule_due(db, "test.every")
+    assert jobs.enqueue_due(db) == 1
+
+
+# Cron expressions
+
+
+@pytest.mark.parametrize(
+    ("expression", "after", "expected"),
+    [
+        # Month rollover, including months without the requested day.
+        ("0 0 1 * *", datetime(2024, 1, 31, 23, 59), datetime(2024, 2, 1, 0, 0)),
+        ("0 0 31 * *", datetime(2024, 4, 1, 0, 0), datetime(2024, 5, 31, 0, 0)),
+        ("30 12 29 2 *", datetime(2023, 3, 1), datetime(2024, 2, 29, 12, 30)),
+        ("59 23 * * *", datetime(2024, 2, 29, 23, 59), datetime(2024, 3, 1, 23, 59)),
+        # Year rollover.
+        ("0 0 1 1 *", datetime(2024, 6, 1), datetime(2025, 1, 1, 0, 0)),
+        ("15 * * 12 *", datetime(2024, 12, 31, 23, 15), datetime(2025, 12, 1, 0, 15)),
+        # Weekday 7 is Sunday, like 0. 2024-01-01 is a Monday.
+        ("0 9 * * 7", datetime(2024, 1, 1), datetime(2024, 1, 7, 9, 0)),
+        ("0 9 * * 0", datetime(2024, 1, 1), datetime(2024, 1, 7, 9, 0)),
+        ("0 9 * * 6-7", datetime(2024, 1, 1), datetime(2024, 1, 6, 9, 0)),
+        ("0 9 * * 7", datetime(2024, 1, 7, 9, 0), datetime(2024, 1, 14, 9, 0)),
+        # Day of month and weekday both restricted: either one matches.
+        ("0 0 13 * 5", datetime(2024, 1, 1), datetime(2024, 1, 5, 0, 0)),
+        ("0 0 2 * 7", datetime(2024, 1, 1), datetime(2024, 1, 2, 0, 0)),
+        # Steps, lists and aliases.
+        ("*/15 * * * *", datetime(2024, 1, 1, 10, 7, 30), datetime(2024, 1, 1, 10, 15)),
+        ("0 8,20 * * *", datetime(2024, 1, 1, 8, 0), datetime(2024, 1, 1, 20, 0)),
+        ("@weekly", datetime(2024, 1, 1), datetime(2024, 1, 7, 0, 0)),
+        ("@monthly", datetime(2024, 12, 15), datetime(2025, 1, 1, 0, 0)),
+        ("@every 90s", datetime(2024, 1, 1, 0, 0, 10), datetime(2024, 1, 1, 0, 1, 40)),
+    ],
+)
+def test_next_after(expression, after, expected):
+    assert jobs.CronSchedule(expression).next_after(after) == expected
+
+
+def test_next_after_is_strictly_later():
+    schedule = jobs.CronSchedule("* * * * *")
+    moment = datetime(2024, 1, 1, 12, 0)
+    assert schedule.next_after(moment) == datetime(2024, 1, 1, 12, 1)
+
+
+@pytest.mark.parametrize(
+    "expression",
+    ["", "* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "* * * 13 *", "* * * * 8", "*/0 * * * *", "5-1 * * * *", "x * * * *", "@every 0s"],
+)
+def test_invalid_expressions_are_rejected(expression):
+    with pytest.raises(jobs.InvalidScheduleError):
+        jobs.CronSchedule(expression)
+
+
+def test_expression_that_never_fires_is_rejected():
+    with pytest.raises(jobs.InvalidScheduleError):
+        jobs.CronSchedule("0 0 30 2 *").next_after(datetime(2024, 1, 1))
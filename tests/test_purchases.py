@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from ucm_color_admin import members, purchases, schemas
+
+
+def _member(db, phone: str, order_id: int, amount_cents: int):
+    member = members.create_member(db, schemas.MemberCreate(phone=phone))
+    purchases.record_purchase(db, member_id=member.id, order_id=order_id, amount_cents=amount_cents, item_count=1)
+    db.commit()
+    return member
+
+
+def _order_ids(db, member_id: int) -> list[int]:
+    page = purchases.list_purchases(db, purchases.history_member_ids(db, member_id))
+    return sorted(item.order_id for item in page.items)
+
+
+def test_history_follows_chained_merges(db):
+    first = _member(db, "13900000001", 9001, 100)
+    second = _member(db, "13900000002", 9002, 200)
+    third = _member(db, "13900000003", 9003, 400)
+
+    members.merge_members(db, second.id, [first.id], "chain-1")
+    db.commit()
+    members.merge_members(db, third.id, [second.id], "chain-2")
+    db.commit()
+
+    assert sorted(purchases.history_member_ids(db, third.id)) == sorted([first.id, second.id, third.id])
+    assert _order_ids(db, third.id) == [9001, 9002, 9003]
+    stats = purchases.member_stats(db, purchases.history_member_ids(db, third.id))
+    assert stats.lifetime_spend_cents == 700
+    assert stats.visit_count == 3
+
+    # Undoing the later merge hands the earlier one back to its own survivor.
+    members.undo_merge_batch(db, "chain-2")
+    assert _order_ids(db, third.id) == [9003]
+    assert _order_ids(db, second.id) == [9001, 9002]